@@ -0,0 +1,60 @@
+"""
+测量InmemoryTokenRepository快照的写入与恢复耗时
+
+用法：python benchmarks/bench_inmemory_snapshot.py
+"""
+
+import asyncio
+import tempfile
+from pathlib import Path
+from timeit import default_timer
+from datetime import datetime, timedelta
+
+import nonebot
+
+nonebot.init(sqlalchemy_database_url="sqlite+aiosqlite:///:memory:")
+nonebot.require("nonebot_plugin_access_control")
+
+from nonebot_plugin_access_control_api.models.rate_limit import (  # noqa: E402
+    RateLimitRule,
+)
+
+from nonebot_plugin_access_control.repository.rate_limit_token.snapshot import (  # noqa: E402
+    SnapshotInmemoryTokenRepository,
+)
+
+
+async def bench(users: int, tokens_per_user: int):
+    path = Path(tempfile.mkdtemp()) / "rate_limit_token.snapshot"
+    rule = RateLimitRule("1", None, "all", timedelta(hours=1), tokens_per_user, False)
+
+    repo = SnapshotInmemoryTokenRepository(path)
+    for i in range(users):
+        for _ in range(tokens_per_user):
+            await repo.acquire_token(rule, f"user{i}")
+
+    start = default_timer()
+    await repo.snapshot()
+    snapshot_time = default_timer() - start
+
+    repo = SnapshotInmemoryTokenRepository(path)
+    start = default_timer()
+    await repo.restore()
+    restore_time = default_timer() - start
+
+    print(
+        f"{users} user(s) x {tokens_per_user} token(s): "
+        f"snapshot {snapshot_time:.3f}s, restore {restore_time:.3f}s, "
+        f"file {path.stat().st_size / 1024 / 1024:.1f}MiB"
+    )
+
+
+async def main():
+    await bench(1000000, 1)
+    await bench(100000, 10)
+    await bench(1000, 1000)
+
+
+if __name__ == "__main__":
+    print(datetime.now())
+    asyncio.run(main())
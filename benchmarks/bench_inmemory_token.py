@@ -0,0 +1,109 @@
+"""
+对比InmemoryTokenRepository（deque + 墓碑）与原先基于tuple的实现
+
+用法：python benchmarks/bench_inmemory_token.py
+"""
+
+import asyncio
+from typing import Optional
+from timeit import default_timer
+from datetime import datetime, timedelta
+
+import nonebot
+
+nonebot.init(sqlalchemy_database_url="sqlite+aiosqlite:///:memory:")
+nonebot.require("nonebot_plugin_access_control")
+
+from nonebot_plugin_access_control_api.models.rate_limit import (  # noqa: E402
+    RateLimitRule,
+    RateLimitSingleToken,
+)
+
+from nonebot_plugin_access_control.repository.rate_limit_token.utils import (  # noqa: E402
+    StorageKey,
+)
+from nonebot_plugin_access_control.repository.rate_limit_token.inmemory import (  # noqa: E402
+    InmemoryTokenRepository,
+)
+
+
+def _handle_expired(
+    tokens: tuple[RateLimitSingleToken, ...],
+) -> tuple[RateLimitSingleToken, ...]:
+    now = datetime.utcnow()
+    return tuple(filter(lambda x: x.expire_time > now, tokens))
+
+
+class TupleTokenRepository(InmemoryTokenRepository):
+    """原先的实现：每次操作都重建整个tuple"""
+
+    async def get_first_expire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        key = StorageKey(rule.id, user)
+        tokens = _handle_expired(self.data.get(key) or ())
+        self.data[key] = tokens
+
+        with_min_expire_time = None
+        for x in tokens:
+            if (
+                with_min_expire_time is None
+                or x.expire_time < with_min_expire_time.expire_time
+            ):
+                with_min_expire_time = x
+        return with_min_expire_time
+
+    async def acquire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        key = StorageKey(rule.id, user)
+        tokens = _handle_expired(self.data.get(key) or ())
+        self.data[key] = tokens
+
+        if len(tokens) >= rule.limit:
+            return None
+
+        acquire_time = datetime.utcnow()
+        expire_time = acquire_time + rule.time_span
+
+        token = RateLimitSingleToken(
+            self.next_id(), rule.id, user, acquire_time, expire_time
+        )
+        self.data[key] = (*tokens, token)
+        return token
+
+    async def retire_token(self, token: RateLimitSingleToken):
+        key = StorageKey(token.rule_id, token.user)
+        tokens = _handle_expired(self.data.get(key) or ())
+        self.data[key] = tuple(filter(lambda x: x.id != token.id, tokens))
+
+
+async def bench(cls: type[InmemoryTokenRepository], size: int, rounds: int) -> float:
+    repo = cls()
+    rule = RateLimitRule("1", None, "all", timedelta(hours=1), size + 1, False)
+
+    for _ in range(size):
+        await repo.acquire_token(rule, "user")
+
+    start = default_timer()
+    for _ in range(rounds):
+        token = await repo.acquire_token(rule, "user")
+        await repo.get_first_expire_token(rule, "user")
+        await repo.retire_token(token)
+    return (default_timer() - start) / rounds
+
+
+async def main():
+    print(f"{'tokens/key':>10} {'tuple (us)':>12} {'deque (us)':>12} {'speedup':>8}")
+    for size in (10, 100, 10000):
+        rounds = 20000 if size <= 100 else 200
+        legacy = await bench(TupleTokenRepository, size, rounds)
+        current = await bench(InmemoryTokenRepository, size, rounds)
+        print(
+            f"{size:>10} {legacy * 1e6:>12.2f} {current * 1e6:>12.2f}"
+            f" {legacy / current:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
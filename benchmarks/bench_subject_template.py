@@ -0,0 +1,191 @@
+"""
+对比extract_from_session的预编译模板实现与原先逐个拼接字符串的实现
+
+用法：python benchmarks/bench_subject_template.py
+"""
+
+import gc
+import sys
+from timeit import default_timer
+from collections.abc import Sequence
+
+import nonebot
+
+nonebot.init(sqlalchemy_database_url="sqlite+aiosqlite:///:memory:")
+nonebot.require("nonebot_plugin_access_control")
+
+from nonebot_plugin_session import Session, SessionLevel  # noqa: E402
+from nonebot_plugin_access_control_api.subject.model import SubjectModel  # noqa: E402
+from nonebot_plugin_access_control_api.utils.superuser import (  # noqa: E402
+    is_superuser,
+)
+
+from nonebot_plugin_access_control.subject.extractor.builtin.session import (  # noqa: E402
+    OFFER_BY,
+    extract_from_session,
+)
+
+N = 100000
+
+
+def _append_subject(
+    li: list[SubjectModel],
+    content_body: str,
+    content_prefix: Sequence[str],
+    tag: Sequence[str],
+):
+    for i in range(min(len(content_prefix), len(tag))):
+        li.append(SubjectModel(f"{content_prefix[i]}{content_body}", OFFER_BY, tag[i]))
+
+
+def legacy_extract_from_session(session: Session) -> Sequence[SubjectModel]:
+    """原先的实现：每次都逐个拼接字符串"""
+    if session.bot_type == "OneBot V11" or session.bot_type == "OneBot V12":
+        prefix = [session.platform, "onebot"]
+    else:
+        prefix = [session.platform]
+
+    li: list[SubjectModel] = []
+
+    if session.level == SessionLevel.LEVEL3:
+        user_id = session.id1
+        channel_id = session.id2
+        guild_id = session.id3
+
+        _append_subject(
+            li,
+            f":g{guild_id}:c{channel_id}:{user_id}",
+            prefix,
+            ["platform:guild:channel:user", "onebot:guild:channel:user"],
+        )
+        _append_subject(
+            li,
+            f":c{channel_id}:{user_id}",
+            prefix,
+            ["platform:channel:user", "onebot:channel:user"],
+        )
+        _append_subject(
+            li,
+            f":g{guild_id}:{user_id}",
+            prefix,
+            ["platform:guild:user", "onebot:guild:user"],
+        )
+        _append_subject(li, f":{user_id}", prefix, ["platform:user", "onebot:user"])
+
+        if is_superuser(user_id, session.bot_type):
+            li.append(SubjectModel("superuser", OFFER_BY, "superuser"))
+
+        _append_subject(
+            li,
+            f":g{guild_id}:c{channel_id}",
+            prefix,
+            ["platform:guild:channel", "onebot:guild:channel"],
+        )
+        _append_subject(
+            li, f":c{channel_id}", prefix, ["platform:channel", "onebot:channel"]
+        )
+        _append_subject(li, f":g{guild_id}", prefix, ["platform:guild", "onebot:guild"])
+
+        _append_subject(
+            li, ":channel", prefix, ["platform:chat_type", "onebot:chat_type"]
+        )
+        li.append(SubjectModel("channel", OFFER_BY, "chat_type"))
+    elif session.level == SessionLevel.LEVEL2:
+        user_id = session.id1
+        group_id = session.id2
+
+        _append_subject(
+            li,
+            f":g{group_id}:{user_id}",
+            prefix,
+            ["platform:group:user", "onebot:group:user"],
+        )
+        _append_subject(li, f":{user_id}", prefix, ["platform:user", "onebot:user"])
+
+        if is_superuser(user_id, session.bot_type):
+            li.append(SubjectModel("superuser", OFFER_BY, "superuser"))
+
+        _append_subject(li, f":g{group_id}", prefix, ["platform:group", "onebot:group"])
+        _append_subject(
+            li, ":group", prefix, ["platform:chat_type", "onebot:chat_type"]
+        )
+        li.append(SubjectModel("group", OFFER_BY, "chat_type"))
+    elif session.level == SessionLevel.LEVEL1:
+        user_id = session.id1
+
+        _append_subject(li, f":{user_id}", prefix, ["platform:user", "onebot:user"])
+
+        if is_superuser(user_id, session.bot_type):
+            li.append(SubjectModel("superuser", OFFER_BY, "superuser"))
+
+        _append_subject(
+            li, ":private", prefix, ["platform:chat_type", "onebot:chat_type"]
+        )
+        li.append(SubjectModel("private", OFFER_BY, "chat_type"))
+
+    _append_subject(li, "", prefix, ["platform", "onebot"])
+
+    li.append(SubjectModel("all", OFFER_BY, "all"))
+
+    return li
+
+
+SESSIONS = {
+    "onebot group": Session(
+        bot_id="1",
+        bot_type="OneBot V11",
+        platform="qq",
+        level=SessionLevel.LEVEL2,
+        id1="23456",
+        id2="34567",
+    ),
+    "qqguild channel": Session(
+        bot_id="1",
+        bot_type="QQ Guild",
+        platform="qqguild",
+        level=SessionLevel.LEVEL3,
+        id1="23456",
+        id2="34567",
+        id3="45678",
+    ),
+    "onebot private": Session(
+        bot_id="1",
+        bot_type="OneBot V11",
+        platform="qq",
+        level=SessionLevel.LEVEL1,
+        id1="23456",
+    ),
+}
+
+
+def bench(func, session: Session) -> tuple[float, float]:
+    """返回每次调用的耗时（微秒）与保留结果时每次调用新增的内存块数"""
+    results = []
+    gc.collect()
+    gc.disable()
+    try:
+        blocks = sys.getallocatedblocks()
+        begin = default_timer()
+        for _ in range(N):
+            results.append(func(session))
+        elapsed = default_timer() - begin
+        blocks = sys.getallocatedblocks() - blocks
+    finally:
+        gc.enable()
+    return elapsed / N * 1e6, blocks / N
+
+
+def main():
+    for name, session in SESSIONS.items():
+        assert extract_from_session(session) == legacy_extract_from_session(session)
+
+        legacy_time, legacy_blocks = bench(legacy_extract_from_session, session)
+        time, blocks = bench(extract_from_session, session)
+        print(
+            f"{name}: legacy {legacy_time:.2f}us, {legacy_blocks:.1f} block(s)/event; "
+            f"template {time:.2f}us, {blocks:.1f} block(s)/event"
+        )
+
+
+if __name__ == "__main__":
+    main()
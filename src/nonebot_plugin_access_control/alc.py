@@ -39,6 +39,7 @@ alc_ac = Alconna(
             Option("--lim|--limit", Args["limit", int]),
             Option("--span", Args["span", str]),
             Option("--overwrite", action=store_true, default=False),
+            Option("--algo|--algorithm", Args["algorithm", str]),
         ),
         Subcommand("rm", Args["limit_rule_id", str]),
         Subcommand(
@@ -86,7 +87,7 @@ def help_ac(env: "T_ENV" = "nonebot") -> str:
     - `{cmd_start}permission ls --srv <服务>`：列出服务已配置的主体权限
     - `{cmd_start}permission ls --sbj <主体> --srv <服务>`：列出主体与服务已配置的权限
 - 流量限制
-    - `{cmd_start}limit add --sbj <主体> --srv <服务> --limit <次数> --span <时间间隔> [--overwrite]`：为主体与服务添加限流规则
+    - `{cmd_start}limit add --sbj <主体> --srv <服务> --limit <次数> --span <时间间隔> [--overwrite] [--algo gcra]`：为主体与服务添加限流规则
     - `{cmd_start}limit rm <规则ID>`：删除限流规则
     - `{cmd_start}limit ls`：列出所有已配置的限流规则
     - `{cmd_start}limit ls --sbj <主体>`：列出主体已配置的限流规则
@@ -7,9 +7,39 @@ from pydantic import Field, BaseModel
 class Config(BaseModel):
     access_control_default_permission: Literal["allow", "deny"] = "allow"
 
-    access_control_rate_limit_token_storage: Literal["datastore", "inmemory"] = (
-        "inmemory"
-    )
+    access_control_permission_cache_enabled: bool = False
+    access_control_skip_unconfigured_service_enabled: bool = False
+    access_control_skip_unconfigured_subject_enabled: bool = False
+
+    access_control_rate_limit_rule_cache_enabled: bool = False
+    access_control_rate_limit_blocked_cache_enabled: bool = False
+    access_control_rate_limit_token_storage: Literal[
+        "datastore",
+        "inmemory",
+        "sliding_window",
+        "gcra",
+        "write_behind",
+        "redis",
+        "shm",
+    ] = "inmemory"
+    access_control_rate_limit_token_cleanup_budget: int = Field(default=1000, gt=0)
+    access_control_rate_limit_token_snapshot_enabled: bool = False
+    access_control_rate_limit_token_snapshot_interval: int = Field(default=60, gt=0)
+    access_control_rate_limit_token_flush_interval: int = Field(default=1000, gt=0)
+    access_control_rate_limit_token_flush_max_pending: int = Field(default=100, gt=0)
+    access_control_rate_limit_token_redis_url: str = "redis://localhost:6379/0"
+    access_control_rate_limit_token_redis_max_connections: Optional[int] = None
+    access_control_rate_limit_token_redis_prefix: str = "accctrl"
+    access_control_rate_limit_token_shm_slots: int = Field(default=65536, gt=0)
+    access_control_rate_limit_token_shm_fail_open: bool = False
+
+    access_control_subject_cache_size: int = Field(default=4096, gt=0)
+    access_control_subject_cache_ttl: int = Field(default=600, gt=0)
+
+    access_control_onebot_v11_role_fetch_enabled: bool = False
+    access_control_role_cache_ttl: int = Field(default=300, gt=0)
+    access_control_role_fetch_failure_ttl: int = Field(default=30, gt=0)
+    access_control_role_fetch_concurrency: int = Field(default=4, gt=0)
 
     access_control_auto_patch_enabled: bool = False
     access_control_auto_patch_ignore: list[str] = Field(default_factory=list)
@@ -110,6 +110,7 @@ async def _handle_limit(fout: TextIO, result: Arparma[DataCollection]):
             result.all_matched_args.get("limit"),
             result.all_matched_args.get("span"),
             result.query("limit.add.overwrite", False).value,
+            result.all_matched_args.get("algorithm"),
         )
     elif rm:
         await limit_handler.rm(
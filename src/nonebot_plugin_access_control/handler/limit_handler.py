@@ -13,9 +13,15 @@ from nonebot_plugin_access_control_api.errors import (
 
 from ..repository.utils import use_ac_session
 from .utils.permission import require_superuser_or_script
+from ..service.rate_limit import add_rate_limit_rule, get_rate_limit_rule_algorithm
 
 
-def _map_rule(f: TextIO, rule: RateLimitRule, service_name: Optional[str]):
+def _map_rule(
+    f: TextIO,
+    rule: RateLimitRule,
+    service_name: Optional[str],
+    algorithm: Optional[str] = None,
+):
     f.write(
         f"[{rule.id}] 服务 '{rule.service.qualified_name}' "
         f"限制主体 '{rule.subject}' "
@@ -24,6 +30,8 @@ def _map_rule(f: TextIO, rule: RateLimitRule, service_name: Optional[str]):
     )
     if rule.overwrite:
         f.write(" (覆写)")
+    if algorithm is not None:
+        f.write(f" (算法：{algorithm})")
     if service_name is not None and rule.service.qualified_name != service_name:
         f.write(f" (继承自服务 '{rule.service.qualified_name}')")
 
@@ -36,6 +44,7 @@ async def add(
     limit: Optional[int],
     time_span: Optional[str],
     overwrite: Optional[bool],
+    algorithm: Optional[str] = None,
 ):
     if not subject or not service_name:
         raise AccessControlBadRequestError(
@@ -58,10 +67,10 @@ async def add(
         if service is None:
             raise AccessControlQueryError(f"找不到服务 {service_name}")
 
-        rule = await service.add_rate_limit_rule(
-            subject, parsed_time_span, limit, overwrite or False
+        rule = await add_rate_limit_rule(
+            service, subject, parsed_time_span, limit, overwrite or False, algorithm
         )
-    _map_rule(f, rule, service_name)
+    _map_rule(f, rule, service_name, algorithm)
 
 
 @require_superuser_or_script
@@ -101,12 +110,14 @@ async def ls(f: TextIO, service_name: Optional[str], subject: Optional[str]):
                     x async for x in service.get_rate_limit_rules_by_subject(subject)
                 ]
 
+        algorithms = {x.id: await get_rate_limit_rule_algorithm(x.id) for x in rules}
+
     if len(rules) != 0:
         # 按照服务全称、subject排序
         rules = sorted(rules, key=lambda x: (x.service.qualified_name, x.subject, x.id))
 
         for rule in rules:
-            _map_rule(f, rule, service_name)
+            _map_rule(f, rule, service_name, algorithms[rule.id])
             f.write("\n")
     else:
         f.write("无")
@@ -5,6 +5,7 @@ from nonebot_plugin_access_control_api.subject import extract_subjects
 from nonebot_plugin_access_control_api.errors import AccessControlBadRequestError
 
 from .utils.env import ac_get_env
+from ..subject.extractor import prefetch_subjects
 
 
 async def subject(f: TextIO):
@@ -14,6 +15,8 @@ async def subject(f: TextIO):
     bot = current_bot.get()
     event = current_event.get()
 
+    await prefetch_subjects(bot, event)
+
     for sbj in extract_subjects(bot, event):
         f.write(sbj)
         f.write("\n")
@@ -1,3 +1,4 @@
+from typing import Optional
 from datetime import datetime
 
 from shortuuid import ShortUUID
@@ -27,6 +28,8 @@ class RateLimitRuleOrm(MappedAsDataclass, Model):
     time_span: Mapped[int]  # 单位：秒
     limit: Mapped[int]
     overwrite: Mapped[bool]
+    # 为None时使用access_control_rate_limit_token_storage配置的存储方式
+    algorithm: Mapped[Optional[str]] = mapped_column(default=None)
 
     tokens: Mapped[list["RateLimitTokenOrm"]] = relationship(
         init=False, back_populates="rule", cascade="delete"
@@ -36,7 +39,12 @@ class RateLimitRuleOrm(MappedAsDataclass, Model):
 class RateLimitTokenOrm(MappedAsDataclass, Model):
     __tablename__ = "accctrl_rate_limit_token"
     __table_args__ = (
-        Index("ix_accctrl_rate_limit_token_rule_id", "rule_id"),
+        Index(
+            "ix_accctrl_rate_limit_token_rule_id_user_expire_time",
+            "rule_id",
+            "user",
+            "expire_time",
+        ),
         Index("ix_accctrl_rate_limit_token_expire_time", "expire_time"),
         {"extend_existing": True},
     )
@@ -1,4 +1,12 @@
+from nonebot import logger
+
 from . import impl  # noqa
+from ...config import conf
 from .interface import IPermissionRepository
 
+if conf().access_control_permission_cache_enabled:
+    from . import cached  # noqa
+
+    logger.opt(colors=True).info("use <y>cached</y> permission repository")
+
 __all__ = ("IPermissionRepository",)
@@ -0,0 +1,110 @@
+from asyncio import Lock
+from typing import Optional
+from collections.abc import Collection, AsyncGenerator
+
+from sqlalchemy import select
+from nonebot import logger, get_driver
+from nonebot_plugin_access_control_api.context import context
+from nonebot_plugin_access_control_api.service.interface import IService
+from nonebot_plugin_access_control_api.models.permission import Permission
+from nonebot_plugin_access_control_api.service.interface.nonebot_service import (
+    INoneBotService,
+)
+
+from ..utils import use_ac_session
+from .impl import PermissionRepository
+from ..orm.permission import PermissionOrm
+from .interface import IPermissionRepository
+
+
+@context.bind_singleton_to(IPermissionRepository)
+class CachedPermissionRepository(PermissionRepository):
+    """
+    将accctrl_permission表整个加载到内存中，查询时不再访问数据库
+
+    写入仍然经过数据库，成功后同步更新内存中的索引。
+    若数据库被其他进程修改，需调用reload()重新加载。
+    """
+
+    def __init__(self):
+        # (service, subject) -> allow
+        self._data: dict[tuple[str, str], bool] = {}
+        self._loaded = False
+        self._lock: Optional[Lock] = None
+
+        get_driver().on_startup(self.reload)
+
+    def _get_lock(self) -> Lock:
+        # 延迟创建，避免绑定到导入时的事件循环
+        if self._lock is None:
+            self._lock = Lock()
+        return self._lock
+
+    async def reload(self):
+        async with self._get_lock():
+            data = {}
+            async with use_ac_session() as session:
+                async for x in await session.stream_scalars(select(PermissionOrm)):
+                    data[(x.service, x.subject)] = x.allow
+
+            self._data = data
+            self._loaded = True
+            logger.debug(f"loaded {len(data)} permission(s) into cache")
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            await self.reload()
+
+    async def get_permissions(
+        self, service: Optional[IService], subject: Optional[str]
+    ) -> AsyncGenerator[Permission, None]:
+        await self._ensure_loaded()
+
+        if service is not None and subject is not None:
+            allow = self._data.get((service.qualified_name, subject))
+            if allow is not None:
+                yield Permission(service, subject, allow)
+            return
+
+        for (service_name, sub), allow in list(self._data.items()):
+            if service is not None and service_name != service.qualified_name:
+                continue
+            if subject is not None and sub != subject:
+                continue
+
+            s = service
+            if s is None:
+                s = context.require(INoneBotService).get_service_by_qualified_name(
+                    service_name
+                )
+            if s is not None:
+                yield Permission(s, sub, allow)
+
+    async def get_permissions_by_subjects(
+        self, services: Collection[IService], subjects: Collection[str]
+    ) -> AsyncGenerator[Permission, None]:
+        await self._ensure_loaded()
+
+        for sub in subjects:
+            for s in services:
+                allow = self._data.get((s.qualified_name, sub))
+                if allow is not None:
+                    yield Permission(s, sub, allow)
+
+    async def set_permission(
+        self, service: Optional[IService], subject: str, allow: bool
+    ) -> bool:
+        async with self._get_lock():
+            ok = await super().set_permission(service, subject, allow)
+            if self._loaded:
+                self._data[(service.qualified_name, subject)] = allow
+            return ok
+
+    async def remove_permission(
+        self, service: Optional[IService], subject: str
+    ) -> bool:
+        async with self._get_lock():
+            ok = await super().remove_permission(service, subject)
+            if self._loaded:
+                self._data.pop((service.qualified_name, subject), None)
+            return ok
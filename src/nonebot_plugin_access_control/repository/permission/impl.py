@@ -1,5 +1,5 @@
 from typing import Optional
-from collections.abc import AsyncGenerator
+from collections.abc import Collection, AsyncGenerator
 
 from sqlalchemy import select
 from nonebot_plugin_access_control_api.context import context
@@ -35,6 +35,23 @@ class PermissionRepository(IPermissionRepository):
                 if s is not None:
                     yield Permission(s, x.subject, x.allow)
 
+    async def get_permissions_by_subjects(
+        self, services: Collection[IService], subjects: Collection[str]
+    ) -> AsyncGenerator[Permission, None]:
+        if len(services) == 0 or len(subjects) == 0:
+            return
+
+        services = {s.qualified_name: s for s in services}
+
+        async with use_ac_session() as session:
+            stmt = select(PermissionOrm).where(
+                PermissionOrm.service.in_(services.keys()),
+                PermissionOrm.subject.in_(subjects),
+            )
+
+            async for x in await session.stream_scalars(stmt):
+                yield Permission(services[x.service], x.subject, x.allow)
+
     async def set_permission(
         self, service: Optional[IService], subject: str, allow: bool
     ) -> bool:
@@ -1,5 +1,5 @@
 from typing import Optional, Protocol
-from collections.abc import AsyncGenerator
+from collections.abc import Collection, AsyncGenerator
 
 from nonebot_plugin_access_control_api.service.interface import IService
 from nonebot_plugin_access_control_api.models.permission import Permission
@@ -12,6 +12,15 @@ class IPermissionRepository(Protocol):
         raise NotImplementedError()
         yield Permission()  # noqa
 
+    async def get_permissions_by_subjects(
+        self, services: Collection[IService], subjects: Collection[str]
+    ) -> AsyncGenerator[Permission, None]:
+        """
+        一次性查询所有服务与主体组合的权限配置（不保证顺序）
+        """
+        raise NotImplementedError()
+        yield Permission()  # noqa
+
     async def set_permission(
         self, service: Optional[IService], subject: str, allow: bool
     ) -> bool:
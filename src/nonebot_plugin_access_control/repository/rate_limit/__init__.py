@@ -1,4 +1,12 @@
+from nonebot import logger
+
 from . import impl  # noqa
+from ...config import conf
 from .interface import IRateLimitRepository
 
+if conf().access_control_rate_limit_rule_cache_enabled:
+    from . import cached  # noqa
+
+    logger.opt(colors=True).info("use <y>cached</y> rate_limit_rule repository")
+
 __all__ = ("IRateLimitRepository",)
@@ -0,0 +1,190 @@
+from asyncio import Lock
+from typing import Optional
+from datetime import timedelta
+from collections import OrderedDict
+from collections.abc import Sequence, AsyncGenerator
+
+from sqlalchemy import select
+from nonebot import logger, get_driver
+from nonebot_plugin_access_control_api.context import context
+from nonebot_plugin_access_control_api.service.interface import IService
+from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+from nonebot_plugin_access_control_api.service.interface.nonebot_service import (
+    INoneBotService,
+)
+
+from ..utils import use_ac_session
+from .interface import IRateLimitRepository
+from ..orm.rate_limit import RateLimitRuleOrm
+from .impl import RateLimitRepository, resolve_effective_rules
+
+# 缓存的(服务链, 主体列表)组合的最大数量
+MAX_RESOLVED_CACHE_SIZE = 4096
+
+T_ResolvedKey = tuple[tuple[str, ...], tuple[str, ...]]
+
+
+@context.bind_singleton_to(IRateLimitRepository)
+class CachedRateLimitRepository(RateLimitRepository):
+    """
+    将accctrl_rate_limit_rule表整个加载到内存中，查询时不再访问数据库
+
+    除了按(服务, 主体)索引的规则表外，还缓存了按(服务链, 主体列表)求出的生效规则列表。
+    写入仍然经过数据库，成功后同步更新内存中的索引。
+    若数据库被其他进程修改，需调用reload()重新加载。
+    """
+
+    def __init__(self):
+        # rule_id -> rule（规则的service字段为服务全称，查询时再替换为服务对象）
+        self._rules: dict[str, RateLimitRule] = {}
+        # rule_id -> algorithm
+        self._algorithms: dict[str, Optional[str]] = {}
+        # (service, subject) -> rules
+        self._index: dict[tuple[str, str], list[RateLimitRule]] = {}
+        self._resolved: OrderedDict[T_ResolvedKey, tuple[RateLimitRule, ...]] = (
+            OrderedDict()
+        )
+        self._loaded = False
+        self._lock: Optional[Lock] = None
+
+        get_driver().on_startup(self.reload)
+
+    def _get_lock(self) -> Lock:
+        # 延迟创建，避免绑定到导入时的事件循环
+        if self._lock is None:
+            self._lock = Lock()
+        return self._lock
+
+    def _put(self, rule: RateLimitRule, algorithm: Optional[str]):
+        self._rules[rule.id] = rule
+        self._algorithms[rule.id] = algorithm
+        self._index.setdefault((rule.service, rule.subject), []).append(rule)
+
+    def _pop(self, rule_id: str):
+        self._algorithms.pop(rule_id, None)
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            return
+
+        key = (rule.service, rule.subject)
+        rules = [x for x in self._index.get(key, ()) if x.id != rule_id]
+        if len(rules) != 0:
+            self._index[key] = rules
+        else:
+            self._index.pop(key, None)
+
+    async def reload(self):
+        async with self._get_lock():
+            rules = {}
+            algorithms = {}
+            index = {}
+            async with use_ac_session() as session:
+                async for x in await session.stream_scalars(select(RateLimitRuleOrm)):
+                    rule = RateLimitRule(
+                        x.id,
+                        x.service,
+                        x.subject,
+                        timedelta(seconds=x.time_span),
+                        x.limit,
+                        x.overwrite,
+                    )
+                    rules[rule.id] = rule
+                    algorithms[rule.id] = x.algorithm
+                    index.setdefault((rule.service, rule.subject), []).append(rule)
+
+            # 加载完成后一次性替换，加载期间的查询仍使用旧的索引
+            self._rules = rules
+            self._algorithms = algorithms
+            self._index = index
+            self._resolved.clear()
+            self._loaded = True
+            logger.debug(f"loaded {len(rules)} rate limit rule(s) into cache")
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            await self.reload()
+
+    async def get_rules_by_subject(
+        self, service: Optional[IService], subject: Optional[str]
+    ) -> AsyncGenerator[RateLimitRule, None]:
+        await self._ensure_loaded()
+
+        if service is not None and subject is not None:
+            rules = self._index.get((service.qualified_name, subject), ())
+        else:
+            rules = list(self._rules.values())
+
+        for x in rules:
+            if service is not None and x.service != service.qualified_name:
+                continue
+            if subject is not None and x.subject != subject:
+                continue
+
+            s = service
+            if s is None:
+                s = context.require(INoneBotService).get_service_by_qualified_name(
+                    x.service
+                )
+            if s is not None:
+                yield x._replace(service=s)
+
+    async def get_effective_rules(
+        self, services: Sequence[IService], subjects: Sequence[str]
+    ) -> AsyncGenerator[RateLimitRule, None]:
+        await self._ensure_loaded()
+
+        key = (tuple(s.qualified_name for s in services), tuple(subjects))
+        resolved = self._resolved.get(key)
+        if resolved is not None:
+            self._resolved.move_to_end(key)
+        else:
+            rules = []
+            for s in services:
+                for sub in subjects:
+                    for x in self._index.get((s.qualified_name, sub), ()):
+                        rules.append(x._replace(service=s))
+
+            resolved = tuple(resolve_effective_rules(rules, services, subjects))
+
+            self._resolved[key] = resolved
+            if len(self._resolved) > MAX_RESOLVED_CACHE_SIZE:
+                self._resolved.popitem(last=False)
+
+        for rule in resolved:
+            yield rule
+
+    async def add_rate_limit_rule(
+        self,
+        service: IService,
+        subject: str,
+        time_span: timedelta,
+        limit: int,
+        overwrite: bool = False,
+        algorithm: Optional[str] = None,
+    ) -> RateLimitRule:
+        async with self._get_lock():
+            rule = await super().add_rate_limit_rule(
+                service, subject, time_span, limit, overwrite, algorithm
+            )
+            if self._loaded:
+                self._put(
+                    rule._replace(
+                        service=service.qualified_name,
+                        time_span=timedelta(seconds=int(time_span.total_seconds())),
+                    ),
+                    algorithm,
+                )
+                self._resolved.clear()
+            return rule
+
+    async def get_rule_algorithm(self, rule_id: str) -> Optional[str]:
+        await self._ensure_loaded()
+        return self._algorithms.get(rule_id)
+
+    async def remove_rate_limit_rule(self, rule_id: str) -> Optional[RateLimitRule]:
+        async with self._get_lock():
+            rule = await super().remove_rate_limit_rule(rule_id)
+            if self._loaded:
+                self._pop(rule_id)
+                self._resolved.clear()
+            return rule
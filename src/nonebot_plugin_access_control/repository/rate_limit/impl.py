@@ -1,6 +1,6 @@
 from typing import Optional
 from datetime import timedelta
-from collections.abc import AsyncGenerator
+from collections.abc import Iterable, Sequence, AsyncGenerator
 
 from sqlalchemy import func, select
 from nonebot_plugin_access_control_api.context import context
@@ -16,8 +16,52 @@ from .interface import IRateLimitRepository
 from ..orm.rate_limit import RateLimitRuleOrm
 
 
+def map_rule(orm: RateLimitRuleOrm, service: IService) -> RateLimitRule:
+    return RateLimitRule(
+        orm.id,
+        service,
+        orm.subject,
+        timedelta(seconds=orm.time_span),
+        orm.limit,
+        orm.overwrite,
+    )
+
+
+def resolve_effective_rules(
+    rules: Iterable[RateLimitRule],
+    services: Sequence[IService],
+    subjects: Sequence[str],
+) -> list[RateLimitRule]:
+    subject_priority = {}
+    for i, sub in enumerate(subjects):
+        subject_priority.setdefault(sub, i)
+    service_priority = {s.qualified_name: i for i, s in enumerate(services)}
+
+    # 同一(服务, 主体)下，覆写规则只能在没有其他规则时添加，因此总是排在最前；
+    # 其余规则保持传入的顺序（排序是稳定的）
+    rules = sorted(
+        rules,
+        key=lambda x: (
+            subject_priority[x.subject],
+            service_priority[x.service.qualified_name],
+            not x.overwrite,
+        ),
+    )
+
+    result = []
+    for rule in rules:
+        result.append(rule)
+        if rule.overwrite:
+            break
+    return result
+
+
 @context.bind_singleton_to(IRateLimitRepository)
 class RateLimitRepository(IRateLimitRepository):
+    def __init__(self):
+        # rule_id -> algorithm，查询规则时顺带记录，获取令牌时无需再次查询
+        self._algorithms: dict[str, Optional[str]] = {}
+
     async def get_rules_by_subject(
         self, service: Optional[IService], subject: Optional[str]
     ) -> AsyncGenerator[RateLimitRuleOrm, None]:
@@ -35,14 +79,29 @@ class RateLimitRepository(IRateLimitRepository):
                         x.service
                     )
                 if s is not None:
-                    yield RateLimitRule(
-                        x.id,
-                        s,
-                        x.subject,
-                        timedelta(seconds=x.time_span),
-                        x.limit,
-                        x.overwrite,
-                    )
+                    self._algorithms[x.id] = x.algorithm
+                    yield map_rule(x, s)
+
+    async def get_effective_rules(
+        self, services: Sequence[IService], subjects: Sequence[str]
+    ) -> AsyncGenerator[RateLimitRule, None]:
+        if len(services) == 0 or len(subjects) == 0:
+            return
+
+        service_mapping = {s.qualified_name: s for s in services}
+
+        async with use_ac_session() as session:
+            stmt = select(RateLimitRuleOrm).where(
+                RateLimitRuleOrm.service.in_(service_mapping.keys()),
+                RateLimitRuleOrm.subject.in_(subjects),
+            )
+            rules = []
+            for x in await session.scalars(stmt):
+                self._algorithms[x.id] = x.algorithm
+                rules.append(map_rule(x, service_mapping[x.service]))
+
+        for rule in resolve_effective_rules(rules, services, subjects):
+            yield rule
 
     async def add_rate_limit_rule(
         self,
@@ -51,6 +110,7 @@ class RateLimitRepository(IRateLimitRepository):
         time_span: timedelta,
         limit: int,
         overwrite: bool = False,
+        algorithm: Optional[str] = None,
     ) -> RateLimitRule:
         async with use_ac_session() as sess:
             if overwrite:
@@ -71,6 +131,7 @@ class RateLimitRepository(IRateLimitRepository):
                 time_span=int(time_span.total_seconds()),
                 limit=limit,
                 overwrite=overwrite,
+                algorithm=algorithm,
             )
             sess.add(orm)
             await sess.commit()
@@ -78,9 +139,20 @@ class RateLimitRepository(IRateLimitRepository):
             await sess.refresh(orm)
 
             rule = RateLimitRule(orm.id, service, subject, time_span, limit, overwrite)
+            self._algorithms[rule.id] = algorithm
 
             return rule
 
+    async def get_rule_algorithm(self, rule_id: str) -> Optional[str]:
+        if rule_id in self._algorithms:
+            return self._algorithms[rule_id]
+
+        async with use_ac_session() as sess:
+            stmt = select(RateLimitRuleOrm.algorithm).where(
+                RateLimitRuleOrm.id == rule_id
+            )
+            return (await sess.execute(stmt)).scalar_one_or_none()
+
     async def remove_rate_limit_rule(self, rule_id: str) -> Optional[RateLimitRule]:
         async with use_ac_session() as sess:
             orm = await sess.get(RateLimitRuleOrm, rule_id)
@@ -89,18 +161,10 @@ class RateLimitRepository(IRateLimitRepository):
 
             await sess.delete(orm)
             await sess.commit()
+            self._algorithms.pop(rule_id, None)
 
             service = context.require(INoneBotService).get_service_by_qualified_name(
                 orm.service
             )
 
-            rule = RateLimitRule(
-                orm.id,
-                service,
-                orm.subject,
-                timedelta(seconds=orm.time_span),
-                orm.limit,
-                orm.overwrite,
-            )
-
-            return rule
+            return map_rule(orm, service)
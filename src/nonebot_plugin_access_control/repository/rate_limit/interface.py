@@ -1,6 +1,6 @@
 from datetime import timedelta
 from typing import Optional, Protocol
-from collections.abc import AsyncGenerator
+from collections.abc import Sequence, AsyncGenerator
 
 from nonebot_plugin_access_control_api.service.interface import IService
 from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
@@ -15,6 +15,15 @@ class IRateLimitRepository(Protocol):
         raise NotImplementedError()
         yield RateLimitRuleOrm()  # noqa
 
+    async def get_effective_rules(
+        self, services: Sequence[IService], subjects: Sequence[str]
+    ) -> AsyncGenerator[RateLimitRule, None]:
+        """
+        按照主体优先级、服务顺序依次返回生效的限流规则，遇到覆写规则后截止
+        """
+        raise NotImplementedError()
+        yield RateLimitRule()  # noqa
+
     async def add_rate_limit_rule(
         self,
         service: IService,
@@ -22,8 +31,12 @@ class IRateLimitRepository(Protocol):
         time_span: timedelta,
         limit: int,
         overwrite: bool = False,
+        algorithm: Optional[str] = None,
     ) -> RateLimitRule:
         raise NotImplementedError()
 
+    async def get_rule_algorithm(self, rule_id: str) -> Optional[str]:
+        raise NotImplementedError()
+
     async def remove_rate_limit_rule(self, rule_id: str) -> Optional[RateLimitRule]:
         raise NotImplementedError()
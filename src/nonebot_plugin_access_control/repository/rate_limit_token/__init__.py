@@ -1,7 +1,9 @@
 from nonebot import logger
+from nonebot_plugin_access_control_api.context import context
 
 from ...config import conf
-from .interface import IRateLimitTokenRepository
+from .gcra import GcraTokenRepository
+from .interface import AcquireTokensResult, IRateLimitTokenRepository
 
 if conf().access_control_rate_limit_token_storage == "datastore":
     from . import datastore  # noqa
@@ -11,10 +13,39 @@ elif conf().access_control_rate_limit_token_storage == "inmemory":
     from . import inmemory  # noqa
 
     logger.opt(colors=True).info("use <y>inmemory</y> rate_limit_token storage")
+
+    if conf().access_control_rate_limit_token_snapshot_enabled:
+        from . import snapshot  # noqa
+
+        logger.opt(colors=True).info("<y>snapshot</y> of rate_limit_token enabled")
+elif conf().access_control_rate_limit_token_storage == "sliding_window":
+    from . import sliding_window  # noqa
+
+    logger.opt(colors=True).info("use <y>sliding_window</y> rate_limit_token storage")
+elif conf().access_control_rate_limit_token_storage == "write_behind":
+    from . import write_behind  # noqa
+
+    logger.opt(colors=True).info("use <y>write_behind</y> rate_limit_token storage")
+elif conf().access_control_rate_limit_token_storage == "redis":
+    from . import redis  # noqa
+
+    logger.opt(colors=True).info("use <y>redis</y> rate_limit_token storage")
+elif conf().access_control_rate_limit_token_storage == "shm":
+    from . import shm  # noqa
+
+    logger.opt(colors=True).info("use <y>shm</y> rate_limit_token storage")
+elif conf().access_control_rate_limit_token_storage == "gcra":
+    context.bind(IRateLimitTokenRepository, GcraTokenRepository)
+
+    logger.opt(colors=True).info("use <y>gcra</y> rate_limit_token storage")
 else:
     raise RuntimeError(
         f"invalid access_control_rate_limit_token_storage: "
         f"{conf().access_control_rate_limit_token_storage}"
     )
 
-__all__ = ("IRateLimitTokenRepository",)
+__all__ = (
+    "IRateLimitTokenRepository",
+    "AcquireTokensResult",
+    "GcraTokenRepository",
+)
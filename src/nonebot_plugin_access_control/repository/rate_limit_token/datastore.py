@@ -5,19 +5,21 @@ require("nonebot_plugin_apscheduler")
 
 from typing import Optional
 from datetime import datetime
+from collections.abc import Sequence
 
 from loguru import logger
-from sqlalchemy import func, delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from nonebot_plugin_apscheduler import scheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import func, delete, insert, select, literal
 from nonebot_plugin_access_control_api.models.rate_limit import (
     RateLimitRule,
     RateLimitSingleToken,
 )
 
 from ..utils import use_ac_session
-from .interface import IRateLimitTokenRepository
 from ..orm.rate_limit import RateLimitRuleOrm, RateLimitTokenOrm
+from .interface import AcquireTokensResult, IRateLimitTokenRepository
 
 
 @context.bind_singleton_to(IRateLimitTokenRepository)
@@ -35,15 +37,14 @@ class DataStoreTokenRepository(IRateLimitTokenRepository):
         now = datetime.utcnow()
 
         async with use_ac_session() as sess:
-            stmt = (
-                select(func.min(RateLimitTokenOrm.expire_time))
-                .select_from(RateLimitTokenOrm)
-                .where(RateLimitTokenOrm.expire_time > now)
-                .scalar_subquery()
-            )
             stmt = (
                 select(RateLimitTokenOrm)
-                .where(RateLimitTokenOrm.expire_time == stmt)
+                .where(
+                    RateLimitTokenOrm.rule_id == rule.id,
+                    RateLimitTokenOrm.user == user,
+                    RateLimitTokenOrm.expire_time > now,
+                )
+                .order_by(RateLimitTokenOrm.expire_time)
                 .limit(1)
             )
             res = (await sess.execute(stmt)).scalar_one_or_none()
@@ -59,39 +60,155 @@ class DataStoreTokenRepository(IRateLimitTokenRepository):
                     res.acquire_time + rule.time_span,
                 )
 
+    @staticmethod
+    def _conditional_insert(
+        rule: RateLimitRule, user: str, acquire_time: datetime, expire_time: datetime
+    ):
+        # INSERT INTO ... SELECT ... WHERE (SELECT count(*) ...) < :limit RETURNING id
+        cnt = (
+            select(func.count())
+            .select_from(RateLimitTokenOrm)
+            .where(
+                RateLimitTokenOrm.rule_id == rule.id,
+                RateLimitTokenOrm.user == user,
+                RateLimitTokenOrm.expire_time > acquire_time,
+            )
+            .scalar_subquery()
+        )
+        values = select(
+            literal(rule.id, RateLimitTokenOrm.rule_id.type),
+            literal(user, RateLimitTokenOrm.user.type),
+            literal(acquire_time, RateLimitTokenOrm.acquire_time.type),
+            literal(expire_time, RateLimitTokenOrm.expire_time.type),
+        ).where(cnt < rule.limit)
+        return (
+            insert(RateLimitTokenOrm)
+            .from_select(["rule_id", "user", "acquire_time", "expire_time"], values)
+            .returning(RateLimitTokenOrm.id)
+        )
+
+    @staticmethod
+    async def _lock(sess: AsyncSession, rule: RateLimitRule, user: str):
+        if sess.get_bind(RateLimitTokenOrm).dialect.name == "postgresql":
+            # READ COMMITTED下并发的语句可能看到相同的计数，
+            # 因此先在事务内对(rule_id, user)加锁，事务结束时自动释放
+            await sess.execute(
+                select(func.pg_advisory_xact_lock(func.hashtext(f"{rule.id}:{user}")))
+            )
+
+    async def _try_acquire(
+        self,
+        sess: AsyncSession,
+        rule: RateLimitRule,
+        user: str,
+        acquire_time: datetime,
+        expire_time: datetime,
+    ) -> Optional[int]:
+        # SQLite的写语句开始时即持有写锁，计数与插入在同一条语句内完成，
+        # 写锁持有到事务结束，因此同一事务内的多条语句也不会与其他写入交错
+        if sess.get_bind(RateLimitTokenOrm).dialect.name in ("sqlite", "postgresql"):
+            stmt = self._conditional_insert(rule, user, acquire_time, expire_time)
+            return (await sess.execute(stmt)).scalar_one_or_none()
+        else:
+            return await self._acquire_token_fallback(
+                sess, rule, user, acquire_time, expire_time
+            )
+
     async def acquire_token(
         self, rule: RateLimitRule, user: str
     ) -> Optional[RateLimitSingleToken]:
-        now = datetime.utcnow()
+        acquire_time = datetime.utcnow()
+        expire_time = acquire_time + rule.time_span
 
         async with use_ac_session() as sess:
-            stmt = select(func.count()).where(
-                RateLimitTokenOrm.rule_id == rule.id,
-                RateLimitTokenOrm.user == user,
-                RateLimitTokenOrm.expire_time > now,
+            await self._lock(sess, rule, user)
+            token_id = await self._try_acquire(
+                sess, rule, user, acquire_time, expire_time
             )
-            cnt = (await sess.execute(stmt)).scalar_one()
+            await sess.commit()
 
-            if cnt >= rule.limit:
+            if token_id is None:
                 return None
 
-            acquire_time = datetime.utcnow()
-            expire_time = acquire_time + rule.time_span
+            return RateLimitSingleToken(
+                token_id, rule.id, user, acquire_time, expire_time
+            )
+
+    async def acquire_tokens(
+        self, rules: Sequence[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        acquire_time = datetime.utcnow()
+
+        async with use_ac_session() as sess:
+            # 在保存点内插入令牌，失败时只回滚这部分，不影响会话中调用方的其他修改
+            savepoint = await sess.begin_nested()
+
+            # 按固定顺序加锁，避免死锁
+            for rule in sorted(rules, key=lambda x: x.id):
+                await self._lock(sess, rule, user)
+
+            tokens = []
+            violating = []
+            for rule in rules:
+                expire_time = acquire_time + rule.time_span
+                token_id = await self._try_acquire(
+                    sess, rule, user, acquire_time, expire_time
+                )
+                if token_id is not None:
+                    tokens.append(
+                        RateLimitSingleToken(
+                            token_id, rule.id, user, acquire_time, expire_time
+                        )
+                    )
+                else:
+                    violating.append(rule)
+
+            if len(violating) == 0:
+                await savepoint.commit()
+                await sess.commit()
+                return AcquireTokensResult(tokens, [], None)
+
+            # 回滚到保存点，已插入的令牌不会生效
+            await savepoint.rollback()
 
-            x = RateLimitTokenOrm(
-                rule_id=rule.id,
-                user=user,
-                acquire_time=acquire_time,
-                expire_time=expire_time,
+            stmt = select(func.min(RateLimitTokenOrm.expire_time)).where(
+                RateLimitTokenOrm.rule_id.in_([x.id for x in violating]),
+                RateLimitTokenOrm.user == user,
+                RateLimitTokenOrm.expire_time > acquire_time,
             )
-            sess.add(x)
+            available_time = (await sess.execute(stmt)).scalar_one_or_none()
             await sess.commit()
 
-            await sess.refresh(x)
+            return AcquireTokensResult([], violating, available_time)
+
+    @staticmethod
+    async def _acquire_token_fallback(
+        sess: AsyncSession,
+        rule: RateLimitRule,
+        user: str,
+        acquire_time: datetime,
+        expire_time: datetime,
+    ) -> Optional[int]:
+        # 不支持RETURNING的数据库（如MySQL）
+        stmt = select(func.count()).where(
+            RateLimitTokenOrm.rule_id == rule.id,
+            RateLimitTokenOrm.user == user,
+            RateLimitTokenOrm.expire_time > acquire_time,
+        )
+        cnt = (await sess.execute(stmt)).scalar_one()
+
+        if cnt >= rule.limit:
+            return None
 
-            return RateLimitSingleToken(
-                x.id, x.rule_id, x.user, acquire_time, expire_time
-            )
+        x = RateLimitTokenOrm(
+            rule_id=rule.id,
+            user=user,
+            acquire_time=acquire_time,
+            expire_time=expire_time,
+        )
+        sess.add(x)
+        await sess.flush()
+        return x.id
 
     async def retire_token(self, token: RateLimitSingleToken):
         async with use_ac_session() as sess:
@@ -0,0 +1,150 @@
+from nonebot import require
+from nonebot_plugin_access_control_api.context import context
+
+require("nonebot_plugin_apscheduler")
+
+from time import time
+from typing import Optional
+from collections.abc import Sequence
+
+from nonebot_plugin_apscheduler import scheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from nonebot_plugin_access_control_api.models.rate_limit import (
+    RateLimitRule,
+    RateLimitSingleToken,
+)
+
+from .utils import StorageKey, timestamp_to_datetime
+from .interface import AcquireTokensResult, IRateLimitTokenRepository
+
+# 容忍浮点数累加误差
+EPSILON = 1e-6
+
+
+@context.singleton()
+class GcraTokenRepository(IRateLimitTokenRepository):
+    """
+    通用信元速率算法（GCRA）：每条规则的每个用户只记录一个理论到达时间（TAT）
+
+    每次调用使TAT推后 time_span / limit，
+    当TAT超出当前时间不超过 time_span 时允许调用，因此最多允许连续调用limit次。
+    """
+
+    def __init__(self):
+        self.id_cnt = 0
+        self.data: dict[StorageKey, float] = {}
+        # rule_id -> 单次调用使TAT推后的时间（归还令牌时使用）
+        self.intervals: dict[str, float] = {}
+
+        scheduler.add_job(
+            self.delete_outdated_tokens,
+            IntervalTrigger(minutes=1),
+            id="delete_outdated_tokens_gcra",
+        )
+
+    def next_id(self) -> int:
+        self.id_cnt += 1
+        return self.id_cnt
+
+    async def get_first_expire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        tat = self.data.get(StorageKey(rule.id, user))
+        if tat is None:
+            return None
+
+        now = time()
+        span = rule.time_span.total_seconds()
+        interval = span / rule.limit
+
+        # 返回一个在可用时间过期的虚拟令牌
+        expire_time = max(now, tat + interval - span)
+        return RateLimitSingleToken(
+            0,
+            rule.id,
+            user,
+            timestamp_to_datetime(expire_time - span),
+            timestamp_to_datetime(expire_time),
+        )
+
+    def _next_tat(
+        self, rule: RateLimitRule, user: str, now: float
+    ) -> tuple[StorageKey, float, float]:
+        key = StorageKey(rule.id, user)
+        interval = rule.time_span.total_seconds() / rule.limit
+        tat = max(self.data.get(key, now), now) + interval
+        return key, tat, interval
+
+    def _make_token(
+        self, rule: RateLimitRule, user: str, now: float
+    ) -> RateLimitSingleToken:
+        return RateLimitSingleToken(
+            self.next_id(),
+            rule.id,
+            user,
+            timestamp_to_datetime(now),
+            timestamp_to_datetime(now + rule.time_span.total_seconds()),
+        )
+
+    async def acquire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        now = time()
+        span = rule.time_span.total_seconds()
+
+        key, tat, interval = self._next_tat(rule, user, now)
+        if tat - now > span + EPSILON:
+            return None
+
+        self.data[key] = tat
+        self.intervals[rule.id] = interval
+        return self._make_token(rule, user, now)
+
+    async def acquire_tokens(
+        self, rules: Sequence[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        now = time()
+        updates = []
+        violating = []
+        available_time = None
+
+        for rule in rules:
+            span = rule.time_span.total_seconds()
+            key, tat, interval = self._next_tat(rule, user, now)
+            if tat - now > span + EPSILON:
+                violating.append(rule)
+                if available_time is None or tat - span < available_time:
+                    available_time = tat - span
+            else:
+                updates.append((rule, key, tat, interval))
+
+        if len(violating) != 0:
+            return AcquireTokensResult(
+                [], violating, timestamp_to_datetime(available_time)
+            )
+
+        tokens = []
+        for rule, key, tat, interval in updates:
+            self.data[key] = tat
+            self.intervals[rule.id] = interval
+            tokens.append(self._make_token(rule, user, now))
+        return AcquireTokensResult(tokens, [], None)
+
+    async def retire_token(self, token: RateLimitSingleToken):
+        key = StorageKey(token.rule_id, token.user)
+        tat = self.data.get(key)
+        if tat is None:
+            return
+
+        interval = self.intervals.get(token.rule_id, 0.0)
+        self.data[key] = max(tat - interval, time())
+
+    async def delete_outdated_tokens(self):
+        now = time()
+        del_keys = [k for k, tat in self.data.items() if tat <= now]
+
+        for k in del_keys:
+            del self.data[k]
+
+    async def clear_token(self):
+        self.data = {}
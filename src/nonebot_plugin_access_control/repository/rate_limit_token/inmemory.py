@@ -3,8 +3,12 @@ from nonebot_plugin_access_control_api.context import context
 
 require("nonebot_plugin_apscheduler")
 
+import asyncio
+from typing import Optional
+from collections import deque
 from datetime import datetime
-from typing import Optional, NamedTuple
+from heapq import heappop, heappush
+from collections.abc import Iterable, Sequence
 
 from nonebot_plugin_apscheduler import scheduler
 from apscheduler.triggers.interval import IntervalTrigger
@@ -13,26 +17,71 @@ from nonebot_plugin_access_control_api.models.rate_limit import (
     RateLimitSingleToken,
 )
 
-from .interface import IRateLimitTokenRepository
+from ...config import conf
+from .utils import StorageKey
+from .interface import AcquireTokensResult, IRateLimitTokenRepository
 
 
-class StorageKey(NamedTuple):
-    rule_id: str
-    user: str
+class TokenQueue:
+    """
+    同一规则、同一用户的令牌队列
 
+    令牌按获取顺序入队，而同一规则的令牌时间跨度相同，因此队列同时按过期时间有序：
+    过期令牌总是从队首出队，队首即为最早过期的令牌。
+    归还的令牌只记录其ID（墓碑），等到出队时再真正删除。
+    """
 
-def _handle_expired(
-    tokens: tuple[RateLimitSingleToken, ...],
-) -> tuple[RateLimitSingleToken, ...]:
-    now = datetime.utcnow()
-    return tuple(filter(lambda x: x.expire_time > now, tokens))
+    __slots__ = ("tokens", "retired")
+
+    def __init__(self, tokens: Iterable[RateLimitSingleToken] = ()):
+        self.tokens: deque[RateLimitSingleToken] = deque(tokens)
+        self.retired: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self.tokens) - len(self.retired)
+
+    def handle_expired(self, now: datetime):
+        tokens = self.tokens
+        while len(tokens) != 0 and (
+            tokens[0].expire_time <= now or tokens[0].id in self.retired
+        ):
+            self.retired.discard(tokens.popleft().id)
+
+    def first(self) -> Optional[RateLimitSingleToken]:
+        if len(self.tokens) != 0:
+            return self.tokens[0]
+        return None
+
+    def append(self, token: RateLimitSingleToken):
+        self.tokens.append(token)
+
+    def retire(self, token_id: int):
+        tokens, retired = self.tokens, self.retired
+        # 令牌ID单调递增，ID小于队首的令牌已经出队
+        if len(tokens) == 0 or token_id < tokens[0].id or token_id in retired:
+            return
+
+        retired.add(token_id)
+        # 归还的令牌位于队首或队尾（最常见的情况：刚获取的令牌被归还）时直接出队
+        while len(tokens) != 0 and tokens[-1].id in retired:
+            retired.discard(tokens.pop().id)
+        while len(tokens) != 0 and tokens[0].id in retired:
+            retired.discard(tokens.popleft().id)
+
+        if len(retired) * 2 > len(tokens):
+            # 墓碑过多时压缩队列，均摊O(1)
+            self.tokens = deque(x for x in tokens if x.id not in retired)
+            retired.clear()
 
 
 @context.bind_singleton_to(IRateLimitTokenRepository)
 class InmemoryTokenRepository(IRateLimitTokenRepository):
     def __init__(self):
         self.id_cnt = 0
-        self.data: dict[StorageKey, tuple[RateLimitSingleToken, ...]] = {}
+        self.data: dict[StorageKey, TokenQueue] = {}
+        # 过期索引：(过期时间, key)组成的最小堆，data中的每个key在堆中恰有一项。
+        # 堆中记录的时间不晚于该key队首令牌的过期时间，到期时再按队首重新入堆
+        self.expiry: list[tuple[datetime, StorageKey]] = []
 
         scheduler.add_job(
             self.delete_outdated_tokens,
@@ -47,53 +96,108 @@ class InmemoryTokenRepository(IRateLimitTokenRepository):
     async def get_first_expire_token(
         self, rule: RateLimitRule, user: str
     ) -> Optional[RateLimitSingleToken]:
-        key = StorageKey(rule.id, user)
-        tokens = _handle_expired(self.data.get(key) or ())
-        self.data[key] = tokens
-
-        with_min_expire_time = None
-        for x in tokens:
-            if (
-                with_min_expire_time is None
-                or x.expire_time < with_min_expire_time.expire_time
-            ):
-                with_min_expire_time = x
-        return with_min_expire_time
+        queue = self.data.get(StorageKey(rule.id, user))
+        if queue is None:
+            return None
+
+        queue.handle_expired(datetime.utcnow())
+        return queue.first()
+
+    def _get_queue(self, key: StorageKey, expire_time: datetime) -> TokenQueue:
+        queue = self.data.get(key)
+        if queue is None:
+            queue = TokenQueue()
+            self.data[key] = queue
+            heappush(self.expiry, (expire_time, key))
+        return queue
+
+    def _append_token(
+        self, queue: TokenQueue, rule: RateLimitRule, user: str, acquire_time: datetime
+    ) -> RateLimitSingleToken:
+        token = RateLimitSingleToken(
+            self.next_id(), rule.id, user, acquire_time, acquire_time + rule.time_span
+        )
+        queue.append(token)
+        return token
 
     async def acquire_token(
         self, rule: RateLimitRule, user: str
     ) -> Optional[RateLimitSingleToken]:
-        key = StorageKey(rule.id, user)
-        tokens = _handle_expired(self.data.get(key) or ())
-        self.data[key] = tokens
+        acquire_time = datetime.utcnow()
+        queue = self._get_queue(
+            StorageKey(rule.id, user), acquire_time + rule.time_span
+        )
+        queue.handle_expired(acquire_time)
 
-        if len(tokens) >= rule.limit:
+        if len(queue) >= rule.limit:
             return None
 
-        acquire_time = datetime.utcnow()
-        expire_time = acquire_time + rule.time_span
+        return self._append_token(queue, rule, user, acquire_time)
 
-        token = RateLimitSingleToken(
-            self.next_id(), rule.id, user, acquire_time, expire_time
-        )
-        self.data[key] = (*tokens, token)
-        return token
+    async def acquire_tokens(
+        self, rules: Sequence[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        # 检查与获取之间没有await，不会被其他协程打断
+        acquire_time = datetime.utcnow()
+        queues = []
+        violating = []
+        available_time = None
+
+        for rule in rules:
+            queue = self._get_queue(
+                StorageKey(rule.id, user), acquire_time + rule.time_span
+            )
+            queue.handle_expired(acquire_time)
+            queues.append(queue)
+
+            if len(queue) >= rule.limit:
+                violating.append(rule)
+                head = queue.first()
+                if head is not None and (
+                    available_time is None or head.expire_time < available_time
+                ):
+                    available_time = head.expire_time
+
+        if len(violating) != 0:
+            return AcquireTokensResult([], violating, available_time)
+
+        tokens = [
+            self._append_token(queue, rule, user, acquire_time)
+            for queue, rule in zip(queues, rules)
+        ]
+        return AcquireTokensResult(tokens, [], None)
 
     async def retire_token(self, token: RateLimitSingleToken):
-        key = StorageKey(token.rule_id, token.user)
-        tokens = _handle_expired(self.data.get(key) or ())
-        self.data[key] = tuple(filter(lambda x: x.id != token.id, tokens))
+        queue = self.data.get(StorageKey(token.rule_id, token.user))
+        if queue is not None:
+            queue.retire(token.id)
 
     async def delete_outdated_tokens(self):
-        del_keys = set()
+        budget = conf().access_control_rate_limit_token_cleanup_budget
+
+        while True:
+            now = datetime.utcnow()
+            data, expiry = self.data, self.expiry
+
+            # 每轮最多处理budget个key，之后让出事件循环
+            for _ in range(budget):
+                if len(expiry) == 0 or expiry[0][0] > now:
+                    return
+
+                _, key = heappop(expiry)
+                queue = data.get(key)
+                if queue is None:
+                    continue
 
-        for k in self.data:
-            self.data[k] = _handle_expired(self.data[k])
-            if len(self.data[k]) == 0:
-                del_keys.add(k)
+                queue.handle_expired(now)
+                head = queue.first()
+                if head is None:
+                    del data[key]
+                else:
+                    heappush(expiry, (head.expire_time, key))
 
-        for k in del_keys:
-            del self.data[k]
+            await asyncio.sleep(0)
 
     async def clear_token(self):
         self.data = {}
+        self.expiry = []
@@ -1,4 +1,6 @@
-from typing import Optional, Protocol
+from datetime import datetime
+from collections.abc import Sequence
+from typing import Optional, Protocol, NamedTuple
 
 from nonebot_plugin_access_control_api.models.rate_limit import (
     RateLimitRule,
@@ -6,6 +8,14 @@ from nonebot_plugin_access_control_api.models.rate_limit import (
 )
 
 
+class AcquireTokensResult(NamedTuple):
+    # 成功时为每条规则获取的令牌，失败时为空
+    tokens: list[RateLimitSingleToken]
+    violating: list[RateLimitRule]
+    # 违反的规则中最早可以再次获取令牌的时间
+    available_time: Optional[datetime]
+
+
 class IRateLimitTokenRepository(Protocol):
     async def get_first_expire_token(
         self, rule: RateLimitRule, user: str
@@ -15,6 +25,14 @@ class IRateLimitTokenRepository(Protocol):
         self, rule: RateLimitRule, user: str
     ) -> Optional[RateLimitSingleToken]: ...
 
+    async def acquire_tokens(
+        self, rules: Sequence[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        """
+        为所有规则获取令牌：任意一条规则超出限制时，不获取任何令牌
+        """
+        ...
+
     async def retire_token(self, token: RateLimitSingleToken): ...
 
     async def clear_token(self): ...
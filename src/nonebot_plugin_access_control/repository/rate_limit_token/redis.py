@@ -0,0 +1,165 @@
+from time import time
+from typing import Optional
+from collections.abc import Sequence
+
+from nonebot import logger, get_driver
+from nonebot_plugin_access_control_api.context import context
+from nonebot_plugin_access_control_api.models.rate_limit import (
+    RateLimitRule,
+    RateLimitSingleToken,
+)
+
+try:
+    from redis.asyncio import Redis, ConnectionPool
+except ImportError as e:
+    raise ImportError(
+        "使用redis存储限流计数需要安装redis："
+        "pip install nonebot-plugin-access-control[redis]"
+    ) from e
+
+from ...config import conf
+from .utils import timestamp_to_datetime
+from .interface import AcquireTokensResult, IRateLimitTokenRepository
+
+# KEYS[1]: 令牌ID计数器，KEYS[i + 1]: 第i条规则的令牌有序集合（score为过期时间）
+# ARGV[1]: 当前时间（毫秒），ARGV[2i]、ARGV[2i + 1]: 第i条规则的时间跨度（毫秒）与次数
+# 返回：成功时为{1, 令牌ID列表}，失败时为{0, 违反的规则序号列表, 最早的过期时间或-1}
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local n = #KEYS - 1
+
+local violating = {}
+local earliest = -1
+for i = 1, n do
+    local key = KEYS[i + 1]
+    local limit = tonumber(ARGV[2 * i + 1])
+
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+    if redis.call('ZCARD', key) >= limit then
+        violating[#violating + 1] = i
+        local head = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        if #head == 2 then
+            local t = tonumber(head[2])
+            if earliest == -1 or t < earliest then
+                earliest = t
+            end
+        end
+    end
+end
+
+if #violating > 0 then
+    return {0, violating, earliest}
+end
+
+local ids = {}
+for i = 1, n do
+    local key = KEYS[i + 1]
+    local span = tonumber(ARGV[2 * i])
+    local id = redis.call('INCR', KEYS[1])
+    redis.call('ZADD', key, now + span, id)
+    -- 同一规则的令牌时间跨度相同，新令牌总是最晚过期
+    redis.call('PEXPIRE', key, span)
+    ids[i] = id
+end
+return {1, ids}
+"""
+
+
+@context.bind_singleton_to(IRateLimitTokenRepository)
+class RedisTokenRepository(IRateLimitTokenRepository):
+    """
+    每条规则的每个用户对应一个有序集合，成员为令牌ID，score为过期时间（毫秒）
+
+    检查与获取在同一个Lua脚本内完成，多个NoneBot实例可以共享限流计数。
+    有序集合的过期时间随最晚过期的令牌更新，过期后由Redis自动删除，因此无需定时清理。
+    """
+
+    def __init__(self, client: Optional["Redis"] = None):
+        config = conf()
+        if client is None:
+            pool = ConnectionPool.from_url(
+                config.access_control_rate_limit_token_redis_url,
+                max_connections=config.access_control_rate_limit_token_redis_max_connections,
+            )
+            client = Redis(connection_pool=pool)
+            get_driver().on_shutdown(client.aclose)
+
+        self.client = client
+        self.prefix = config.access_control_rate_limit_token_redis_prefix
+        self._acquire_script = client.register_script(ACQUIRE_SCRIPT)
+
+    def _key(self, rule_id: str, user: str) -> str:
+        return f"{self.prefix}:token:{rule_id}:{user}"
+
+    async def get_first_expire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        now = int(time() * 1000)
+        res = await self.client.zrangebyscore(
+            self._key(rule.id, user), f"({now}", "+inf", 0, 1, withscores=True
+        )
+        if len(res) == 0:
+            return None
+
+        token_id, expire_time = res[0]
+        expire_time = expire_time / 1000
+        return RateLimitSingleToken(
+            int(token_id),
+            rule.id,
+            user,
+            timestamp_to_datetime(expire_time - rule.time_span.total_seconds()),
+            timestamp_to_datetime(expire_time),
+        )
+
+    async def acquire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        result = await self.acquire_tokens([rule], user)
+        if len(result.tokens) == 0:
+            return None
+        return result.tokens[0]
+
+    async def acquire_tokens(
+        self, rules: Sequence[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        if len(rules) == 0:
+            return AcquireTokensResult([], [], None)
+
+        now = int(time() * 1000)
+        spans = [int(rule.time_span.total_seconds() * 1000) for rule in rules]
+        keys = [f"{self.prefix}:id"]
+        args = [now]
+        for rule, span in zip(rules, spans):
+            keys.append(self._key(rule.id, user))
+            args.append(span)
+            args.append(rule.limit)
+
+        res = await self._acquire_script(keys=keys, args=args)
+
+        if res[0] == 0:
+            violating = [rules[i - 1] for i in res[1]]
+            available_time = None
+            if res[2] != -1:
+                available_time = timestamp_to_datetime(res[2] / 1000)
+            return AcquireTokensResult([], violating, available_time)
+
+        tokens = [
+            RateLimitSingleToken(
+                int(token_id),
+                rule.id,
+                user,
+                timestamp_to_datetime(now / 1000),
+                timestamp_to_datetime((now + span) / 1000),
+            )
+            for rule, span, token_id in zip(rules, spans, res[1])
+        ]
+        return AcquireTokensResult(tokens, [], None)
+
+    async def retire_token(self, token: RateLimitSingleToken):
+        await self.client.zrem(self._key(token.rule_id, token.user), token.id)
+
+    async def clear_token(self):
+        cnt = 0
+        async for key in self.client.scan_iter(match=f"{self.prefix}:token:*"):
+            cnt += await self.client.unlink(key)
+        logger.debug(f"deleted {cnt} rate limit token key(s)")
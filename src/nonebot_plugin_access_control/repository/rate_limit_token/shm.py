@@ -0,0 +1,292 @@
+from nonebot import require
+from nonebot_plugin_access_control_api.context import context
+
+require("nonebot_plugin_localstore")
+
+import os
+import mmap
+import struct
+import asyncio
+from time import time
+from pathlib import Path
+from hashlib import blake2b
+from typing import Optional
+from contextlib import asynccontextmanager
+from collections.abc import Sequence, Collection
+
+from nonebot import logger, get_driver
+from nonebot_plugin_localstore import get_data_file
+from nonebot_plugin_access_control_api.models.rate_limit import (
+    RateLimitRule,
+    RateLimitSingleToken,
+)
+
+try:
+    import fcntl
+except ImportError as e:
+    raise ImportError("共享内存存储（shm）依赖fcntl，仅支持类Unix系统") from e
+
+from .gcra import EPSILON
+from ...config import conf
+from .utils import timestamp_to_datetime
+from .interface import AcquireTokensResult, IRateLimitTokenRepository
+
+# 文件头：魔数、槽位数
+HEADER = struct.Struct("<8sQ")
+MAGIC = b"ACRLSHM1"
+# 槽位：key的128位哈希（两个u64，均为0表示空槽位）、TAT、单次调用使TAT推后的时间
+SLOT = struct.Struct("<QQdd")
+# 单次查找最多探测的槽位数
+MAX_PROBE = 128
+# 其他进程持有锁时，重试加锁的初始间隔与最大间隔（秒）
+LOCK_RETRY_INTERVAL = 0.001
+LOCK_RETRY_MAX_INTERVAL = 0.05
+
+
+def _hash_key(rule_id: str, user: str) -> tuple[int, int]:
+    h1, h2 = struct.unpack(
+        "<QQ", blake2b(f"{rule_id}\0{user}".encode(), digest_size=16).digest()
+    )
+    # 保留0作为空槽位的标记
+    return h1 or 1, h2
+
+
+@context.bind_singleton_to(IRateLimitTokenRepository)
+class SharedMemoryTokenRepository(IRateLimitTokenRepository):
+    """
+    将计数保存在数据目录下的文件中，通过mmap映射到内存，同一台机器上的多个进程共享限流计数
+
+    文件是一张开放寻址（线性探测）的定长哈希表，每条规则的每个用户占一个槽位，
+    计数方式与GCRA相同：每个槽位只记录一个理论到达时间（TAT）。
+    已过期的槽位在插入新key时原地复用，因此无需定时清理。
+    读写时通过flock对整个文件加锁，单次操作只涉及少量槽位，持有锁的时间很短。
+    加锁是非阻塞的，其他进程持有锁时让出事件循环后重试。
+    槽位已满时拒绝获取令牌（可通过access_control_rate_limit_token_shm_fail_open改为放行）。
+    """
+
+    def __init__(self, path: Optional[Path] = None, slots: Optional[int] = None):
+        if path is None:
+            path = get_data_file(
+                "nonebot_plugin_access_control", "rate_limit_token.shm"
+            )
+        if slots is None:
+            slots = conf().access_control_rate_limit_token_shm_slots
+
+        self.id_cnt = 0
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            size = os.fstat(self.fd).st_size
+            if size < HEADER.size:
+                os.ftruncate(self.fd, HEADER.size + slots * SLOT.size)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, slots), 0)
+            else:
+                magic, file_slots = HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+                if magic != MAGIC:
+                    raise RuntimeError(f"{path} is not a rate limit token file")
+                if file_slots != slots:
+                    # 其他进程可能正在使用该文件，以文件中的槽位数为准
+                    logger.warning(
+                        f"{path} has {file_slots} slot(s), "
+                        f"ignoring configured value {slots}"
+                    )
+                slots = file_slots
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+        self.slots = slots
+        self.mm = mmap.mmap(self.fd, HEADER.size + slots * SLOT.size)
+
+        get_driver().on_shutdown(self.close)
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+    @asynccontextmanager
+    async def _locked(self, op: int = fcntl.LOCK_EX):
+        delay = LOCK_RETRY_INTERVAL
+        while True:
+            try:
+                fcntl.flock(self.fd, op | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, LOCK_RETRY_MAX_INTERVAL)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def next_id(self) -> int:
+        self.id_cnt += 1
+        return self.id_cnt
+
+    def _find_slot(
+        self,
+        h1: int,
+        h2: int,
+        now: float,
+        create: bool,
+        claimed: Collection[int] = (),
+    ) -> int:
+        """
+        返回key所在槽位的偏移量；key不存在时，若create为真则返回可用的槽位，否则返回-1
+
+        claimed中的槽位已被同一批次中的其他key占用，不会作为可用的槽位返回
+        """
+        mm = self.mm
+        i = h1 % self.slots
+        reusable = -1
+
+        for _ in range(min(self.slots, MAX_PROBE)):
+            offset = HEADER.size + i * SLOT.size
+            k1, k2, tat, _ = SLOT.unpack_from(mm, offset)
+            if k1 == h1 and k2 == h2:
+                return offset
+            if offset in claimed:
+                pass
+            elif k1 == 0:
+                # 空槽位之后不会再有该key
+                if not create:
+                    return -1
+                return offset if reusable == -1 else reusable
+            elif reusable == -1 and tat <= now:
+                reusable = offset
+            i = (i + 1) % self.slots
+
+        return reusable if create else -1
+
+    def _earliest_reusable_time(self, h1: int) -> float:
+        """
+        返回key可探测到的槽位中最早过期的时间（槽位已满时使用）
+        """
+        i = h1 % self.slots
+        earliest = None
+        for _ in range(min(self.slots, MAX_PROBE)):
+            _, _, tat, _ = SLOT.unpack_from(self.mm, HEADER.size + i * SLOT.size)
+            if earliest is None or tat < earliest:
+                earliest = tat
+            i = (i + 1) % self.slots
+        return earliest
+
+    def _read_tat(self, offset: int, h1: int, h2: int, now: float) -> float:
+        k1, k2, tat, _ = SLOT.unpack_from(self.mm, offset)
+        if k1 != h1 or k2 != h2:
+            return now
+        return max(tat, now)
+
+    def _make_token(
+        self, rule: RateLimitRule, user: str, now: float
+    ) -> RateLimitSingleToken:
+        return RateLimitSingleToken(
+            self.next_id(),
+            rule.id,
+            user,
+            timestamp_to_datetime(now),
+            timestamp_to_datetime(now + rule.time_span.total_seconds()),
+        )
+
+    async def get_first_expire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        h1, h2 = _hash_key(rule.id, user)
+        now = time()
+
+        async with self._locked(fcntl.LOCK_SH):
+            offset = self._find_slot(h1, h2, now, False)
+            if offset == -1:
+                return None
+            _, _, tat, _ = SLOT.unpack_from(self.mm, offset)
+
+        span = rule.time_span.total_seconds()
+        interval = span / rule.limit
+
+        # 返回一个在可用时间过期的虚拟令牌
+        expire_time = max(now, tat + interval - span)
+        return RateLimitSingleToken(
+            0,
+            rule.id,
+            user,
+            timestamp_to_datetime(expire_time - span),
+            timestamp_to_datetime(expire_time),
+        )
+
+    async def acquire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        result = await self.acquire_tokens([rule], user)
+        if len(result.tokens) == 0:
+            return None
+        return result.tokens[0]
+
+    async def acquire_tokens(
+        self, rules: Sequence[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        now = time()
+        keys = [_hash_key(rule.id, user) for rule in rules]
+        fail_open = conf().access_control_rate_limit_token_shm_fail_open
+        updates = []
+        # 本批次中已分配给各key的槽位，避免多个新key分配到同一个槽位
+        claimed = set()
+        violating = []
+        available_time = None
+
+        async with self._locked():
+            for rule, (h1, h2) in zip(rules, keys):
+                span = rule.time_span.total_seconds()
+                interval = span / rule.limit
+
+                offset = self._find_slot(h1, h2, now, True, claimed)
+                if offset == -1:
+                    if fail_open:
+                        logger.warning(
+                            "rate limit token table is full, token is granted"
+                        )
+                        continue
+
+                    logger.warning("rate limit token table is full, token is denied")
+                    violating.append(rule)
+                    reusable_time = self._earliest_reusable_time(h1)
+                    if available_time is None or reusable_time < available_time:
+                        available_time = reusable_time
+                    continue
+
+                tat = self._read_tat(offset, h1, h2, now) + interval
+                if tat - now > span + EPSILON:
+                    violating.append(rule)
+                    if available_time is None or tat - span < available_time:
+                        available_time = tat - span
+                else:
+                    claimed.add(offset)
+                    updates.append((offset, h1, h2, tat, interval))
+
+            if len(violating) != 0:
+                return AcquireTokensResult(
+                    [], violating, timestamp_to_datetime(available_time)
+                )
+
+            for offset, h1, h2, tat, interval in updates:
+                SLOT.pack_into(self.mm, offset, h1, h2, tat, interval)
+
+        return AcquireTokensResult(
+            [self._make_token(rule, user, now) for rule in rules], [], None
+        )
+
+    async def retire_token(self, token: RateLimitSingleToken):
+        h1, h2 = _hash_key(token.rule_id, token.user)
+        now = time()
+
+        async with self._locked():
+            offset = self._find_slot(h1, h2, now, False)
+            if offset == -1:
+                return
+
+            _, _, tat, interval = SLOT.unpack_from(self.mm, offset)
+            SLOT.pack_into(self.mm, offset, h1, h2, max(tat - interval, now), interval)
+
+    async def clear_token(self):
+        async with self._locked():
+            self.mm[HEADER.size :] = bytes(self.slots * SLOT.size)
@@ -0,0 +1,183 @@
+from nonebot import require
+from nonebot_plugin_access_control_api.context import context
+
+require("nonebot_plugin_apscheduler")
+
+from time import time
+from typing import Optional
+from collections.abc import Sequence
+
+from nonebot_plugin_apscheduler import scheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from nonebot_plugin_access_control_api.models.rate_limit import (
+    RateLimitRule,
+    RateLimitSingleToken,
+)
+
+from .interface import AcquireTokensResult, IRateLimitTokenRepository
+from .utils import StorageKey, datetime_to_timestamp, timestamp_to_datetime
+
+
+class SlidingWindow:
+    """
+    滑动窗口计数器：只记录当前与上一个固定窗口内的计数，
+    以上一个窗口计数按时间比例加权后与当前窗口计数之和作为滑动窗口内的估计计数
+    """
+
+    __slots__ = ("span", "start", "prev", "curr")
+
+    def __init__(self, span: float, now: float):
+        self.span = span
+        self.start = now - now % span
+        self.prev = 0
+        self.curr = 0
+
+    def rotate(self, now: float):
+        if now >= self.start + self.span:
+            n = (now - self.start) // self.span
+            self.prev = self.curr if n == 1 else 0
+            self.curr = 0
+            self.start += n * self.span
+
+    def estimate(self, now: float) -> float:
+        return self.prev * (1 - (now - self.start) / self.span) + self.curr
+
+    def available_time(self, limit: int, now: float) -> float:
+        if self.curr + 1 > limit:
+            # 需要等到下一个窗口，且当前窗口的计数按比例衰减到足够小
+            f = 1 - (limit - 1) / self.curr
+            t = self.start + self.span + self.span * max(0.0, f)
+        elif self.prev > 0:
+            f = 1 - (limit - 1 - self.curr) / self.prev
+            t = self.start + self.span * max(0.0, f)
+        else:
+            t = now
+        return max(now, t)
+
+
+@context.bind_singleton_to(IRateLimitTokenRepository)
+class SlidingWindowTokenRepository(IRateLimitTokenRepository):
+    def __init__(self):
+        self.id_cnt = 0
+        self.data: dict[StorageKey, SlidingWindow] = {}
+
+        scheduler.add_job(
+            self.delete_outdated_tokens,
+            IntervalTrigger(minutes=1),
+            id="delete_outdated_tokens_sliding_window",
+        )
+
+    def next_id(self) -> int:
+        self.id_cnt += 1
+        return self.id_cnt
+
+    def _get_window(self, key: StorageKey, span: float, now: float) -> SlidingWindow:
+        window = self.data.get(key)
+        if window is None or window.span != span:
+            window = SlidingWindow(span, now)
+            self.data[key] = window
+        else:
+            window.rotate(now)
+        return window
+
+    async def get_first_expire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        key = StorageKey(rule.id, user)
+        if key not in self.data:
+            return None
+
+        now = time()
+        span = rule.time_span.total_seconds()
+        window = self._get_window(key, span, now)
+
+        # 滑动窗口不记录单个令牌，返回一个在可用时间过期的虚拟令牌
+        expire_time = window.available_time(rule.limit, now)
+        return RateLimitSingleToken(
+            0,
+            rule.id,
+            user,
+            timestamp_to_datetime(expire_time - span),
+            timestamp_to_datetime(expire_time),
+        )
+
+    def _make_token(
+        self, rule: RateLimitRule, user: str, now: float
+    ) -> RateLimitSingleToken:
+        return RateLimitSingleToken(
+            self.next_id(),
+            rule.id,
+            user,
+            timestamp_to_datetime(now),
+            timestamp_to_datetime(now + rule.time_span.total_seconds()),
+        )
+
+    async def acquire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        now = time()
+        span = rule.time_span.total_seconds()
+
+        if span > 0:
+            window = self._get_window(StorageKey(rule.id, user), span, now)
+            if window.estimate(now) + 1 > rule.limit:
+                return None
+            window.curr += 1
+
+        return self._make_token(rule, user, now)
+
+    async def acquire_tokens(
+        self, rules: Sequence[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        now = time()
+        windows = []
+        violating = []
+        available_time = None
+
+        for rule in rules:
+            span = rule.time_span.total_seconds()
+            if span <= 0:
+                continue
+
+            window = self._get_window(StorageKey(rule.id, user), span, now)
+            if window.estimate(now) + 1 > rule.limit:
+                violating.append(rule)
+                t = window.available_time(rule.limit, now)
+                if available_time is None or t < available_time:
+                    available_time = t
+            else:
+                windows.append(window)
+
+        if len(violating) != 0:
+            return AcquireTokensResult(
+                [], violating, timestamp_to_datetime(available_time)
+            )
+
+        for window in windows:
+            window.curr += 1
+        return AcquireTokensResult(
+            [self._make_token(rule, user, now) for rule in rules], [], None
+        )
+
+    async def retire_token(self, token: RateLimitSingleToken):
+        window = self.data.get(StorageKey(token.rule_id, token.user))
+        if window is None:
+            return
+
+        window.rotate(time())
+
+        acquire_time = datetime_to_timestamp(token.acquire_time)
+        if acquire_time >= window.start:
+            window.curr = max(0, window.curr - 1)
+        elif acquire_time >= window.start - window.span:
+            window.prev = max(0, window.prev - 1)
+
+    async def delete_outdated_tokens(self):
+        now = time()
+        del_keys = [k for k, w in self.data.items() if now >= w.start + 2 * w.span]
+
+        for k in del_keys:
+            del self.data[k]
+
+    async def clear_token(self):
+        self.data = {}
@@ -0,0 +1,328 @@
+from nonebot import require
+from nonebot_plugin_access_control_api.context import context
+
+require("nonebot_plugin_apscheduler")
+require("nonebot_plugin_localstore")
+
+import os
+import struct
+import asyncio
+from array import array
+from pathlib import Path
+from heapq import heappush
+from typing import Optional
+from bisect import bisect_right
+from itertools import accumulate
+from datetime import datetime, timedelta
+from collections.abc import Iterable, Collection
+
+from nonebot import logger, get_driver
+from nonebot_plugin_apscheduler import scheduler
+from nonebot_plugin_localstore import get_data_file
+from apscheduler.triggers.interval import IntervalTrigger
+from nonebot_plugin_access_control_api.models.rate_limit import (
+    RateLimitRule,
+    RateLimitSingleToken,
+)
+
+from ...config import conf
+from .utils import StorageKey
+from .interface import IRateLimitTokenRepository
+from .inmemory import TokenQueue, InmemoryTokenRepository
+
+# 文件头：魔数、key的数量、令牌的数量、key名称的字节数
+HEADER = struct.Struct("<8sIQQ")
+MAGIC = b"ACRLSNP2"
+# 文件头之后按列存放：
+#   key名称：rule_id与user以\0分隔后UTF-8编码
+#   各key的时间跨度（秒，double数组）
+#   各key的令牌数（uint32数组）
+#   各令牌的过期时间戳（秒，double数组），同一key的令牌连续存放
+
+_EPOCH = datetime(1970, 1, 1)
+
+T_QueueSnapshot = tuple[StorageKey, tuple[RateLimitSingleToken, ...], frozenset[int]]
+
+
+class RestoredTokens:
+    """
+    从快照恢复、尚未被访问的令牌
+
+    恢复时只建立key到其在快照中位置的索引，不创建令牌对象；
+    各key的令牌在首次被访问时才创建并移入InmemoryTokenRepository.data。
+    """
+
+    def __init__(
+        self,
+        names: list[str],
+        spans: array,
+        counts: array,
+        expires: array,
+        first_id: int,
+    ):
+        # key -> 序号；key为(rule_id, user)元组，与StorageKey相等
+        self.index: dict[tuple[str, str], int] = dict(
+            zip(zip(names[0::2], names[1::2]), range(len(spans)))
+        )
+        self.spans = spans
+        # 各key的第一个令牌在expires中的位置
+        self.begins = array("Q", accumulate(counts, initial=0))
+        self.expires = expires
+        # 令牌ID为first_id加上令牌在expires中的位置
+        self.first_id = first_id
+        # 所有令牌都过期后整体丢弃
+        self.expire_time = (
+            datetime.utcfromtimestamp(max(expires)) if len(expires) != 0 else _EPOCH
+        )
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get_expires(self, i: int, now: datetime) -> array:
+        """
+        返回序号为i的key未过期的令牌的过期时间戳
+        """
+        begin, end = self.begins[i], self.begins[i + 1]
+        # 同一key的令牌按过期时间有序，跳过已过期的令牌
+        begin = bisect_right(self.expires, (now - _EPOCH).total_seconds(), begin, end)
+        return self.expires[begin:end]
+
+    def pop(self, key: StorageKey, now: datetime) -> Optional[TokenQueue]:
+        """
+        取出key的令牌队列，key不存在或其令牌都已过期时返回None
+        """
+        i = self.index.pop(key, None)
+        if i is None:
+            return None
+
+        end = self.begins[i + 1]
+        expires = self.get_expires(i, now)
+        if len(expires) == 0:
+            return None
+
+        span = timedelta(seconds=self.spans[i])
+        first_id = self.first_id + end - len(expires)
+        utcfromtimestamp = datetime.utcfromtimestamp
+        tokens = []
+        for j, ts in enumerate(expires):
+            expire_time = utcfromtimestamp(ts)
+            tokens.append(
+                RateLimitSingleToken(
+                    first_id + j, key[0], key[1], expire_time - span, expire_time
+                )
+            )
+        return TokenQueue(tokens)
+
+
+def encode_snapshot(
+    queues: Collection[T_QueueSnapshot],
+    now: datetime,
+    restored: Optional[RestoredTokens] = None,
+    restored_keys: Iterable[tuple[tuple[str, str], int]] = (),
+) -> bytes:
+    """
+    编码快照，丢弃已过期与已归还的令牌
+
+    restored_keys为restored中尚未被访问的(key, 序号)，这些key的令牌直接从restored复制
+    """
+    names = []
+    spans = array("d")
+    counts = array("I")
+    expires = array("d")
+
+    for key, tokens, retired in queues:
+        n = len(expires)
+        expires.extend(
+            (x.expire_time - _EPOCH).total_seconds()
+            for x in tokens
+            if x.expire_time > now and x.id not in retired
+        )
+        if len(expires) == n:
+            continue
+
+        names.append(key.rule_id)
+        names.append(key.user)
+        spans.append((tokens[0].expire_time - tokens[0].acquire_time).total_seconds())
+        counts.append(len(expires) - n)
+
+    for (rule_id, user), i in restored_keys:
+        raw = restored.get_expires(i, now)
+        if len(raw) == 0:
+            continue
+
+        names.append(rule_id)
+        names.append(user)
+        spans.append(restored.spans[i])
+        counts.append(len(raw))
+        expires.extend(raw)
+
+    name_bytes = "\0".join(names).encode()
+    return b"".join(
+        (
+            HEADER.pack(MAGIC, len(counts), len(expires), len(name_bytes)),
+            name_bytes,
+            spans.tobytes(),
+            counts.tobytes(),
+            expires.tobytes(),
+        )
+    )
+
+
+def decode_snapshot(data: bytes, first_id: int) -> RestoredTokens:
+    """
+    解析快照，令牌ID从first_id开始依次分配
+
+    不创建令牌对象，已过期的令牌在访问时跳过，见RestoredTokens
+    """
+    magic, key_cnt, token_cnt, name_len = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a rate limit token snapshot")
+
+    mv = memoryview(data)
+    offset = HEADER.size
+
+    names = str(mv[offset : offset + name_len], "utf-8").split("\0")
+    offset += name_len
+
+    spans = array("d")
+    spans.frombytes(mv[offset : offset + key_cnt * spans.itemsize])
+    offset += key_cnt * spans.itemsize
+
+    counts = array("I")
+    counts.frombytes(mv[offset : offset + key_cnt * counts.itemsize])
+    offset += key_cnt * counts.itemsize
+
+    expires = array("d")
+    expires.frombytes(mv[offset : offset + token_cnt * expires.itemsize])
+
+    return RestoredTokens(names, spans, counts, expires, first_id)
+
+
+@context.bind_singleton_to(IRateLimitTokenRepository)
+class SnapshotInmemoryTokenRepository(InmemoryTokenRepository):
+    """
+    在关闭时与定期将未过期的令牌写入数据目录下的快照文件，启动时从快照恢复
+
+    编码与写入文件在线程池中进行，事件循环线程上只复制各队列中令牌的引用。
+    恢复时不创建令牌对象，各key的令牌在首次被访问时才创建，见RestoredTokens。
+    进程异常退出时，会丢失上一次快照之后获取与归还的令牌。
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        super().__init__()
+
+        if path is None:
+            path = get_data_file(
+                "nonebot_plugin_access_control", "rate_limit_token.snapshot"
+            )
+        self.path = path
+        self.restored: Optional[RestoredTokens] = None
+        self._snapshot_lock: Optional[asyncio.Lock] = None
+
+        scheduler.add_job(
+            self.snapshot,
+            IntervalTrigger(
+                seconds=conf().access_control_rate_limit_token_snapshot_interval
+            ),
+            id="snapshot_tokens_inmemory",
+        )
+
+        get_driver().on_startup(self.restore)
+        get_driver().on_shutdown(self.snapshot)
+
+    def _get_snapshot_lock(self) -> asyncio.Lock:
+        # 延迟创建，避免绑定到导入时的事件循环
+        if self._snapshot_lock is None:
+            self._snapshot_lock = asyncio.Lock()
+        return self._snapshot_lock
+
+    def _take_restored(self, key: StorageKey):
+        # 首次访问从快照恢复的key时，创建其令牌队列
+        if self.restored is None or key in self.data:
+            return
+
+        queue = self.restored.pop(key, datetime.utcnow())
+        if queue is not None:
+            self.data[key] = queue
+            heappush(self.expiry, (queue.first().expire_time, key))
+
+    async def get_first_expire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        self._take_restored(StorageKey(rule.id, user))
+        return await super().get_first_expire_token(rule, user)
+
+    def _get_queue(self, key: StorageKey, expire_time: datetime) -> TokenQueue:
+        self._take_restored(key)
+        return super()._get_queue(key, expire_time)
+
+    async def retire_token(self, token: RateLimitSingleToken):
+        self._take_restored(StorageKey(token.rule_id, token.user))
+        await super().retire_token(token)
+
+    async def delete_outdated_tokens(self):
+        await super().delete_outdated_tokens()
+
+        if self.restored is not None and (
+            len(self.restored) == 0 or self.restored.expire_time <= datetime.utcnow()
+        ):
+            self.restored = None
+
+    async def clear_token(self):
+        await super().clear_token()
+        self.restored = None
+
+    def _write(
+        self,
+        queues: Collection[T_QueueSnapshot],
+        now: datetime,
+        restored: Optional[RestoredTokens],
+        restored_keys: Collection[tuple[tuple[str, str], int]],
+    ):
+        data = encode_snapshot(queues, now, restored, restored_keys)
+
+        # 先写入临时文件再替换，避免写入中途退出时损坏快照
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    async def snapshot(self):
+        async with self._get_snapshot_lock():
+            now = datetime.utcnow()
+            queues = [
+                (k, tuple(q.tokens), frozenset(q.retired))
+                for k, q in self.data.items()
+                if len(q) != 0
+            ]
+            restored = self.restored
+            restored_keys = list(restored.index.items()) if restored is not None else []
+
+            await asyncio.to_thread(self._write, queues, now, restored, restored_keys)
+            logger.debug(
+                "saved rate limit token snapshot of "
+                f"{len(queues) + len(restored_keys)} key(s)"
+            )
+
+    def _read(self, first_id: int) -> RestoredTokens:
+        with open(self.path, "rb") as f:
+            data = f.read()
+        return decode_snapshot(data, first_id)
+
+    async def restore(self):
+        if not self.path.exists():
+            return
+
+        try:
+            restored = await asyncio.to_thread(self._read, self.id_cnt + 1)
+        except Exception as e:
+            logger.opt(exception=e).error("failed to load rate limit token snapshot")
+            return
+
+        # 已存在的key以内存中的为准
+        for key in self.data:
+            restored.index.pop(key, None)
+
+        self.id_cnt += len(restored.expires)
+        self.restored = restored
+        logger.debug(f"loaded {len(restored)} rate limit token key(s) from snapshot")
@@ -0,0 +1,52 @@
+from asyncio import Lock
+from datetime import datetime, timezone
+from typing import Optional, NamedTuple
+from contextlib import asynccontextmanager
+from collections.abc import Iterable, AsyncGenerator
+
+
+class StorageKey(NamedTuple):
+    rule_id: str
+    user: str
+
+
+def timestamp_to_datetime(ts: float) -> datetime:
+    # 与datetime.utcnow()一致，返回不带时区的UTC时间
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+def datetime_to_timestamp(dt: datetime) -> float:
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+class StripedLock:
+    """
+    按StorageKey分段的锁表：不同的key大概率落在不同的段上，可以并行；
+    同时锁定多个key时按段的序号依次加锁，避免死锁
+    """
+
+    def __init__(self, stripes: int = 1024):
+        # 延迟创建，避免绑定到导入时的事件循环
+        self._locks: list[Optional[Lock]] = [None] * stripes
+
+    def _get_lock(self, i: int) -> Lock:
+        lock = self._locks[i]
+        if lock is None:
+            lock = Lock()
+            self._locks[i] = lock
+        return lock
+
+    @asynccontextmanager
+    async def acquire(self, keys: Iterable[StorageKey]) -> AsyncGenerator[None, None]:
+        # 多个key可能落在同一段上，去重后排序
+        stripes = sorted({hash(k) % len(self._locks) for k in keys})
+        locked = []
+        try:
+            for i in stripes:
+                lock = self._get_lock(i)
+                await lock.acquire()
+                locked.append(lock)
+            yield
+        finally:
+            for lock in reversed(locked):
+                lock.release()
@@ -0,0 +1,232 @@
+import asyncio
+from typing import Optional
+from datetime import datetime
+from collections.abc import Collection
+
+from nonebot import logger, get_driver
+from sqlalchemy.exc import IntegrityError
+from nonebot_plugin_orm import get_session
+from nonebot_plugin_apscheduler import scheduler
+from sqlalchemy import func, delete, insert, select
+from apscheduler.triggers.interval import IntervalTrigger
+from nonebot_plugin_access_control_api.context import context
+from nonebot_plugin_access_control_api.models.rate_limit import (
+    RateLimitRule,
+    RateLimitSingleToken,
+)
+
+from ...config import conf
+from .utils import StorageKey
+from ..orm.rate_limit import RateLimitTokenOrm
+from .interface import IRateLimitTokenRepository
+from .inmemory import TokenQueue, InmemoryTokenRepository
+
+
+@context.bind_singleton_to(IRateLimitTokenRepository)
+class WriteBehindTokenRepository(InmemoryTokenRepository):
+    """
+    在内存中计数并判定，获取与归还的令牌定期批量写入accctrl_rate_limit_token表
+
+    令牌ID在启动时从表中已有的最大ID继续分配，写入时显式指定，
+    因此归还已写入的令牌时可以直接按ID删除。
+    显式指定的ID不经过数据库的序列（如PostgreSQL），因此切换回datastore存储前需要清空令牌表。
+    进程异常退出时，最多丢失一个写入周期内（或积压的令牌数达到上限前）的令牌。
+
+    批量写入违反约束（如规则已被删除、ID重复）时改为逐条写入，违反约束的令牌被丢弃，
+    其余错误（如数据库连接失败）时整批放回队列，等待下次写入。
+    被丢弃的令牌归还时不会删除表中的记录（同一ID的记录属于其他写入方）。
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        # 待写入的令牌（token_id -> token）与待删除的令牌ID
+        self.pending_inserts: dict[int, RateLimitSingleToken] = {}
+        self.pending_deletes: set[int] = set()
+        # 写入时被丢弃的令牌ID -> 过期时间，归还时不删除表中ID相同的记录
+        self.dropped: dict[int, datetime] = {}
+
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        scheduler.add_job(
+            self.flush,
+            IntervalTrigger(
+                seconds=conf().access_control_rate_limit_token_flush_interval / 1000
+            ),
+            id="flush_tokens_write_behind",
+        )
+
+        get_driver().on_startup(self.load)
+        get_driver().on_shutdown(self.flush)
+
+    def _get_flush_lock(self) -> asyncio.Lock:
+        # 延迟创建，避免绑定到导入时的事件循环
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        return self._flush_lock
+
+    async def load(self):
+        now = datetime.utcnow()
+        self.data = {}
+        self.expiry = []
+        self.pending_inserts = {}
+        self.pending_deletes = set()
+        self.dropped = {}
+
+        async with get_session() as sess:
+            stmt = select(func.max(RateLimitTokenOrm.id))
+            self.id_cnt = (await sess.execute(stmt)).scalar_one_or_none() or 0
+
+            stmt = (
+                select(RateLimitTokenOrm)
+                .where(RateLimitTokenOrm.expire_time > now)
+                .order_by(RateLimitTokenOrm.id)
+            )
+            cnt = 0
+            async for x in await sess.stream_scalars(stmt):
+                queue = self._get_queue(StorageKey(x.rule_id, x.user), x.expire_time)
+                queue.append(
+                    RateLimitSingleToken(
+                        x.id, x.rule_id, x.user, x.acquire_time, x.expire_time
+                    )
+                )
+                cnt += 1
+
+        logger.debug(f"loaded {cnt} rate limit token(s) into memory")
+
+    def _schedule_flush(self):
+        max_pending = conf().access_control_rate_limit_token_flush_max_pending
+        if len(self.pending_inserts) + len(self.pending_deletes) < max_pending:
+            return
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.flush())
+
+    def _append_token(
+        self, queue: TokenQueue, rule: RateLimitRule, user: str, acquire_time: datetime
+    ) -> RateLimitSingleToken:
+        token = super()._append_token(queue, rule, user, acquire_time)
+        self.pending_inserts[token.id] = token
+        self._schedule_flush()
+        return token
+
+    async def retire_token(self, token: RateLimitSingleToken):
+        await super().retire_token(token)
+
+        # 尚未写入的令牌直接丢弃
+        if self.pending_inserts.pop(token.id, None) is not None:
+            return
+        if self.dropped.pop(token.id, None) is not None:
+            return
+
+        self.pending_deletes.add(token.id)
+        self._schedule_flush()
+
+    @staticmethod
+    def _to_row(token: RateLimitSingleToken) -> dict:
+        return {
+            "id": token.id,
+            "rule_id": token.rule_id,
+            "user": token.user,
+            "acquire_time": token.acquire_time,
+            "expire_time": token.expire_time,
+        }
+
+    async def _write(
+        self, inserts: Collection[RateLimitSingleToken], deletes: Collection[int]
+    ):
+        async with get_session() as sess:
+            if len(inserts) != 0:
+                await sess.execute(
+                    insert(RateLimitTokenOrm), [self._to_row(x) for x in inserts]
+                )
+            if len(deletes) != 0:
+                await sess.execute(
+                    delete(RateLimitTokenOrm).where(RateLimitTokenOrm.id.in_(deletes))
+                )
+            await sess.commit()
+
+    async def _write_one_by_one(
+        self, inserts: Collection[RateLimitSingleToken], deletes: Collection[int]
+    ) -> list[RateLimitSingleToken]:
+        """
+        逐条写入令牌，返回因违反约束而被丢弃的令牌
+        """
+        dropped = []
+        async with get_session() as sess:
+            for x in inserts:
+                try:
+                    async with sess.begin_nested():
+                        await sess.execute(insert(RateLimitTokenOrm), [self._to_row(x)])
+                except IntegrityError as e:
+                    # 重试也不会成功，丢弃该令牌
+                    logger.opt(exception=e).warning(
+                        f"dropped rate limit token {x.id} "
+                        f"(rule: {x.rule_id}, user: {x.user}) that cannot be written"
+                    )
+                    dropped.append(x)
+            if len(deletes) != 0:
+                await sess.execute(
+                    delete(RateLimitTokenOrm).where(RateLimitTokenOrm.id.in_(deletes))
+                )
+            await sess.commit()
+        return dropped
+
+    async def flush(self):
+        async with self._get_flush_lock():
+            inserts, self.pending_inserts = self.pending_inserts, {}
+            deletes, self.pending_deletes = self.pending_deletes, set()
+
+            if len(inserts) == 0 and len(deletes) == 0:
+                return
+
+            try:
+                try:
+                    await self._write(inserts.values(), deletes)
+                except IntegrityError as e:
+                    logger.opt(exception=e).warning(
+                        "failed to flush rate limit tokens in batch, "
+                        "retrying one by one"
+                    )
+                    dropped = await self._write_one_by_one(inserts.values(), deletes)
+                    for x in dropped:
+                        # 写入期间已归还的令牌不再删除
+                        if x.id in self.pending_deletes:
+                            self.pending_deletes.discard(x.id)
+                        else:
+                            self.dropped[x.id] = x.expire_time
+            except Exception as e:
+                # 写入失败时放回队列，等待下次写入
+                logger.opt(exception=e).error("failed to flush rate limit tokens")
+                self.pending_inserts = {**inserts, **self.pending_inserts}
+                self.pending_deletes |= deletes
+                return
+
+            logger.trace(
+                f"flushed {len(inserts)} acquired and {len(deletes)} retired "
+                f"rate limit token(s)"
+            )
+
+    async def delete_outdated_tokens(self):
+        await super().delete_outdated_tokens()
+
+        now = datetime.utcnow()
+        self.dropped = {k: v for k, v in self.dropped.items() if v > now}
+        async with get_session() as sess:
+            stmt = delete(RateLimitTokenOrm).where(RateLimitTokenOrm.expire_time <= now)
+            result = await sess.execute(stmt)
+            await sess.commit()
+            logger.debug(f"deleted {result.rowcount} outdated rate limit token(s)")
+
+    async def clear_token(self):
+        async with self._get_flush_lock():
+            await super().clear_token()
+            self.pending_inserts = {}
+            self.pending_deletes = set()
+            self.dropped = {}
+
+            async with get_session() as sess:
+                result = await sess.execute(delete(RateLimitTokenOrm))
+                await sess.commit()
+                logger.debug(f"deleted {result.rowcount} rate limit token(s)")
@@ -1,4 +1,5 @@
 import contextvars
+from typing import Optional, NamedTuple
 from contextlib import AbstractAsyncContextManager, asynccontextmanager
 
 from nonebot import logger
@@ -7,19 +8,74 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 _ac_current_session = contextvars.ContextVar("ac_current_session")
 
+# 进入最外层use_ac_session的次数，与实际创建会话的次数
+_entered_cnt = 0
+_created_cnt = 0
+
+
+class AcSessionStats(NamedTuple):
+    entered: int
+    created: int
+
+
+def get_ac_session_stats() -> AcSessionStats:
+    """
+    返回进入use_ac_session（不含嵌套）的次数与实际创建会话的次数，两者之差即为缓存省下的会话
+    """
+    return AcSessionStats(_entered_cnt, _created_cnt)
+
+
+def reset_ac_session_stats():
+    global _entered_cnt, _created_cnt
+    _entered_cnt = 0
+    _created_cnt = 0
+
+
+class LazySession:
+    """
+    AsyncSession的代理，首次访问会话的属性（执行语句等）时才创建会话
+    """
+
+    __slots__ = ("_session",)
+
+    def __init__(self):
+        self._session: Optional[AsyncSession] = None
+
+    @property
+    def created(self) -> bool:
+        return self._session is not None
+
+    def _get_session(self) -> AsyncSession:
+        global _created_cnt
+
+        if self._session is None:
+            self._session = get_session()
+            _created_cnt += 1
+            logger.trace("sqlalchemy session was created")
+        return self._session
+
+    def __getattr__(self, name: str):
+        return getattr(self._get_session(), name)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            logger.trace("sqlalchemy session was closed")
+
 
 @asynccontextmanager
 async def use_ac_session() -> AbstractAsyncContextManager[AsyncSession]:
+    global _entered_cnt
+
     try:
         yield _ac_current_session.get()
     except LookupError:
-        session = get_session()
-        logger.trace("sqlalchemy session was created")
+        _entered_cnt += 1
+        session = LazySession()
         token = _ac_current_session.set(session)
 
         try:
             yield session
         finally:
             await session.close()
-            logger.trace("sqlalchemy session was closed")
             _ac_current_session.reset(token)
@@ -1 +1,12 @@
 from . import _impl  # noqa
+from .rate_limit import (
+    RATE_LIMIT_ALGORITHMS,
+    add_rate_limit_rule,
+    get_rate_limit_rule_algorithm,
+)
+
+__all__ = (
+    "RATE_LIMIT_ALGORITHMS",
+    "add_rate_limit_rule",
+    "get_rate_limit_rule_algorithm",
+)
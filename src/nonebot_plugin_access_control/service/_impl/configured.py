@@ -0,0 +1,97 @@
+from asyncio import Lock
+from typing import Optional
+from collections.abc import Sequence
+
+from nonebot import logger
+from sqlalchemy import select
+from nonebot_plugin_access_control_api.service.interface import IService
+
+from ...repository.utils import use_ac_session
+from ...repository.orm.permission import PermissionOrm
+from ...repository.orm.rate_limit import RateLimitRuleOrm
+
+
+class ConfiguredServiceIndex:
+    """
+    记录设置过权限或限流规则的服务（服务全称）及其设置过的主体，
+    用于跳过服务链上没有任何配置的服务的检查，以及在查询前去掉不可能匹配到配置的主体
+
+    首次查询时从数据库加载。通过本插件设置权限、添加限流规则时同步加入索引；
+    删除权限与限流规则时只将索引标记为失效，下次查询时重新加载。
+    索引中多出的服务与主体只会使检查走完整的流程，不影响结果。
+    若数据库被其他进程修改，需调用invalidate()使索引失效。
+
+    索引直接从表中读取服务全称，因此加载时尚未创建的服务（如之后才加载的插件）的配置同样会被记录。
+    """
+
+    # 服务全称 -> 设置过权限或限流规则的主体
+    _services: Optional[dict[str, set[str]]] = None
+    # 每次修改索引时递增，用于丢弃加载期间已经过时的结果
+    _version = 0
+    _lock: Optional[Lock] = None
+
+    @classmethod
+    def _get_lock(cls) -> Lock:
+        # 延迟创建，避免绑定到导入时的事件循环
+        if cls._lock is None:
+            cls._lock = Lock()
+        return cls._lock
+
+    @classmethod
+    async def _load(cls) -> dict[str, set[str]]:
+        async with cls._get_lock():
+            while cls._services is None:
+                version = cls._version
+
+                services = {}
+                async with use_ac_session() as sess:
+                    for orm in (PermissionOrm, RateLimitRuleOrm):
+                        stmt = select(orm.service, orm.subject).distinct()
+                        for service, subject in await sess.execute(stmt):
+                            services.setdefault(service, set()).add(subject)
+
+                if version == cls._version:
+                    cls._services = services
+                    logger.debug(
+                        f"loaded {len(services)} service(s) "
+                        f"with permission or rate limit rule"
+                    )
+
+            return cls._services
+
+    @classmethod
+    async def is_configured(cls, service: IService) -> bool:
+        """
+        服务链上（该服务及其所有祖先）是否设置过权限或限流规则
+        """
+        services = cls._services
+        if services is None:
+            services = await cls._load()
+        return any(x.qualified_name in services for x in service.trace())
+
+    @classmethod
+    async def filter_subjects(
+        cls, nodes: Sequence[IService], subjects: Sequence[str]
+    ) -> Sequence[str]:
+        """
+        去掉在给定的服务节点上均没有设置过权限或限流规则的主体，保持原有顺序
+        """
+        services = cls._services
+        if services is None:
+            services = await cls._load()
+
+        configured = [
+            services[x.qualified_name] for x in nodes if x.qualified_name in services
+        ]
+        return [s for s in subjects if any(s in c for c in configured)]
+
+    @classmethod
+    def add(cls, service: IService, subject: str):
+        cls._version += 1
+        if cls._services is not None:
+            cls._services.setdefault(service.qualified_name, set()).add(subject)
+
+    @classmethod
+    def invalidate(cls):
+        cls._version += 1
+        cls._services = None
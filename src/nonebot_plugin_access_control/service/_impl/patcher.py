@@ -1,5 +1,6 @@
 from functools import wraps
 from datetime import datetime
+from typing import Optional, NamedTuple
 
 from nonebot.internal.adapter import Event
 from nonebot.message import run_preprocessor
@@ -12,10 +13,6 @@ from nonebot_plugin_access_control_api.service.interface.patcher import IService
 from nonebot_plugin_access_control_api.service.contextvars import (
     current_rate_limit_token,
 )
-from nonebot_plugin_access_control_api.errors import (
-    RateLimitedError,
-    PermissionDeniedError,
-)
 from nonebot.internal.matcher import (
     Matcher,
     current_bot,
@@ -24,7 +21,17 @@ from nonebot.internal.matcher import (
 )
 
 from ...config import conf
+from .permission import ServicePermissionImpl
 from ...repository.utils import use_ac_session
+from .configured import ConfiguredServiceIndex
+from ...subject.extractor.stream import SubjectStream
+from .rate_limit import ServiceRateLimitImpl, EmptyRateLimitTokenImpl
+
+
+class ServiceCheckResult(NamedTuple):
+    allow: bool
+    # 获取限流令牌的结果，未通过权限检查或未要求获取令牌时为None
+    rate_limit: Optional[AcquireTokenResult] = None
 
 
 class ServicePatcherImpl(IServicePatcher):
@@ -51,6 +58,57 @@ class ServicePatcherImpl(IServicePatcher):
                 )
             await matcher.send(msg)
 
+    @classmethod
+    async def get_default_decision(cls, service: IService) -> Optional[bool]:
+        """
+        服务链上没有设置任何权限与限流规则时，无需提取主体与查询数据库，直接返回默认的权限；
+        否则返回None
+        """
+        if not conf().access_control_skip_unconfigured_service_enabled:
+            return None
+        if await ConfiguredServiceIndex.is_configured(service):
+            return None
+        return conf().access_control_default_permission == "allow"
+
+    @classmethod
+    async def evaluate(
+        cls,
+        service: IService,
+        bot: Bot,
+        event: Event,
+        *,
+        acquire_rate_limit_token: bool = True,
+    ) -> ServiceCheckResult:
+        """
+        检查权限并获取限流令牌：只提取一次主体，权限与限流规则按同一条服务链查询
+        """
+        allow = await cls.get_default_decision(service)
+        if allow is not None:
+            if allow and acquire_rate_limit_token:
+                return ServiceCheckResult(
+                    True,
+                    AcquireTokenResult(success=True, token=EmptyRateLimitTokenImpl()),
+                )
+            return ServiceCheckResult(allow)
+
+        subjects = SubjectStream(bot, event)
+        nodes = list(service.trace())
+
+        # 数据库中的配置每多查一个前缀就多一次查询，因此只在启用缓存时按前缀逐步查找
+        config = conf()
+        async with use_ac_session():
+            allow = await ServicePermissionImpl.of(service)._check_permission(
+                nodes, subjects.stages(config.access_control_permission_cache_enabled)
+            )
+            if not allow or not acquire_rate_limit_token:
+                return ServiceCheckResult(allow)
+
+            result = await ServiceRateLimitImpl.of(service)._acquire_token_by_subjects(
+                nodes,
+                subjects.stages(config.access_control_rate_limit_rule_cache_enabled),
+            )
+            return ServiceCheckResult(True, result)
+
     def patch_matcher(self, matcher: type[Matcher]) -> type[Matcher]:
         self._matcher_service_mapping[matcher] = self.service
         logger.debug(f"patched {matcher}  (with service {self.service.qualified_name})")
@@ -64,17 +122,12 @@ class ServicePatcherImpl(IServicePatcher):
                 event = current_event.get()
                 matcher = current_matcher.get()
 
-                async with use_ac_session():
-                    if not await self.service.check(
-                        bot, event, acquire_rate_limit_token=False
-                    ):
-                        await self.handle_permission_denied(matcher)
-                        return
-
-                    result = await self.service.acquire_token_for_rate_limit_receiving_result(
-                        bot, event
-                    )
+                check_result = await self.evaluate(self.service, bot, event)
+                if not check_result.allow:
+                    await self.handle_permission_denied(matcher)
+                    return
 
+                result = check_result.rate_limit
                 if not result.success:
                     await self.handle_rate_limited(matcher, result)
                     return
@@ -100,14 +153,12 @@ async def check(bot: Bot, event: Event, matcher: Matcher):
     if service is None:
         return
 
-    try:
-        async with use_ac_session():
-            await service.check(bot, event, throw_on_fail=True)
-    except PermissionDeniedError:
+    result = await ServicePatcherImpl.evaluate(service, bot, event)
+    if not result.allow:
         await ServicePatcherImpl.handle_permission_denied(matcher)
         raise IgnoredException("permission denied (by nonebot_plugin_access_control)")
-    except RateLimitedError as e:
-        await ServicePatcherImpl.handle_rate_limited(matcher, e.result)
+    if not result.rate_limit.success:
+        await ServicePatcherImpl.handle_rate_limited(matcher, result.rate_limit)
         raise IgnoredException("rate limited (by nonebot_plugin_access_control)")
 
 
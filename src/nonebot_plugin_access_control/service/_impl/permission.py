@@ -1,5 +1,5 @@
 from typing import Optional
-from collections.abc import AsyncGenerator
+from collections.abc import Sequence, AsyncIterable, AsyncGenerator
 
 from nonebot import logger
 from nonebot_plugin_access_control_api.context import context
@@ -17,6 +17,8 @@ from nonebot_plugin_access_control_api.event_bus import (
 
 from ...config import conf
 from ...repository.utils import use_ac_session
+from .configured import ConfiguredServiceIndex
+from ...subject.extractor.stream import single_stage
 from ...repository.permission import IPermissionRepository
 
 
@@ -26,6 +28,16 @@ class ServicePermissionImpl(IServicePermission):
     def __init__(self, service: IService):
         self.service = service
 
+    @classmethod
+    def of(cls, service: IService) -> "ServicePermissionImpl":
+        """
+        返回服务自身持有的实现（由ServiceComponentFactory创建）
+        """
+        impl = getattr(service, "_permission_impl", None)
+        if isinstance(impl, cls):
+            return impl
+        return cls(service)
+
     def on_set_permission(self, func: Optional[T_Listener] = None):
         return on_event(
             EventType.service_set_permission,
@@ -50,17 +62,37 @@ class ServicePermissionImpl(IServicePermission):
     async def get_permission_by_subject(
         self, *subject: str, trace: bool = True
     ) -> Optional[Permission]:
+        if trace:
+            nodes = list(self.service.trace())
+        else:
+            nodes = [self.service]
+
+        return await self._get_permission(nodes, subject)
+
+    async def _get_permission(
+        self, nodes: Sequence[IService], subject: Sequence[str]
+    ) -> Optional[Permission]:
+        # 一次性查出所有候选配置，再按照主体优先级、服务节点深度（从深到浅）选出生效的配置
+        subject_priority = {}
+        for i, sub in enumerate(subject):
+            subject_priority.setdefault(sub, i)
+        node_priority = {node.qualified_name: i for i, node in enumerate(nodes)}
+
+        result = None
+        result_priority = None
         async with use_ac_session():
-            for sub in subject:
-                if trace:
-                    for node in self.service.trace():
-                        async for p in self.repo.get_permissions(node, sub):
-                            return p
-                else:
-                    async for p in self.repo.get_permissions(self.service, sub):
-                        return p
+            async for p in self.repo.get_permissions_by_subjects(
+                nodes, subject_priority.keys()
+            ):
+                priority = (
+                    subject_priority[p.subject],
+                    node_priority[p.service.qualified_name],
+                )
+                if result_priority is None or priority < result_priority:
+                    result = p
+                    result_priority = priority
 
-            return None
+        return result
 
     async def get_permissions(
         self, *, trace: bool = True
@@ -138,6 +170,7 @@ class ServicePermissionImpl(IServicePermission):
             ok = await self.repo.set_permission(self.service, subject, allow)
 
             if ok:
+                ConfiguredServiceIndex.add(self.service, subject)
                 await self._fire_service_set_permission(subject, allow)
                 await self._fire_service_change_permission(subject, allow)
 
@@ -147,6 +180,7 @@ class ServicePermissionImpl(IServicePermission):
         async with use_ac_session():
             ok = await self.repo.remove_permission(self.service, subject)
             if ok:
+                ConfiguredServiceIndex.invalidate()
                 await self._fire_service_remove_permission(subject)
 
                 p = await self.get_permission_by_subject(subject)
@@ -159,8 +193,28 @@ class ServicePermissionImpl(IServicePermission):
             return ok
 
     async def check_permission(self, *subject: str) -> bool:
+        return await self._check_permission(
+            list(self.service.trace()), single_stage(subject)
+        )
+
+    async def _check_permission(
+        self, nodes: Sequence[IService], stages: AsyncIterable[Sequence[str]]
+    ) -> bool:
+        """
+        stages依次为越来越长的主体列表（前缀），某个前缀已匹配到配置时无需再看更长的列表
+        """
+        skip_enabled = conf().access_control_skip_unconfigured_subject_enabled
+
         async with use_ac_session():
-            p = await self.get_permission_by_subject(*subject)
+            async for subject in stages:
+                if skip_enabled:
+                    subject = await ConfiguredServiceIndex.filter_subjects(
+                        nodes, subject
+                    )
+                p = await self._get_permission(nodes, subject)
+                if p is not None:
+                    break
+
             if p is not None:
                 logger.debug(
                     f"[permission] {'allowed' if p.allow else 'denied'} "
@@ -1,10 +1,11 @@
 from typing import Optional
-from datetime import timedelta
-from collections.abc import Collection, AsyncGenerator
+from datetime import datetime, timedelta
+from collections.abc import Sequence, Collection, AsyncIterable, AsyncGenerator
 
 from nonebot import logger
 from nonebot_plugin_access_control_api.context import context
 from nonebot_plugin_access_control_api.service.interface import IService
+from nonebot_plugin_access_control_api.errors import AccessControlBadRequestError
 from nonebot_plugin_access_control_api.service.interface.rate_limit import (
     IServiceRateLimit,
 )
@@ -21,9 +22,20 @@ from nonebot_plugin_access_control_api.models.rate_limit import (
     RateLimitSingleToken,
 )
 
+from ...config import conf
 from ...repository.utils import use_ac_session
+from .configured import ConfiguredServiceIndex
+from ...subject.extractor.stream import single_stage
 from ...repository.rate_limit import IRateLimitRepository
-from ...repository.rate_limit_token import IRateLimitTokenRepository
+from ...repository.rate_limit_token.utils import StorageKey, StripedLock
+from ...repository.rate_limit_token import (
+    AcquireTokensResult,
+    GcraTokenRepository,
+    IRateLimitTokenRepository,
+)
+
+# 除了默认的存储方式外，可以为单条规则指定的限流算法
+RATE_LIMIT_ALGORITHMS = ("gcra",)
 
 
 class RateLimitTokenImpl(IRateLimitToken):
@@ -37,15 +49,42 @@ class RateLimitTokenImpl(IRateLimitToken):
         async with use_ac_session():
             for t in self.tokens:
                 await self.service._retire_token(t)
+                # 归还令牌后该用户可能不再被限流
+                self.service._unblock(t.user)
+
+
+class EmptyRateLimitTokenImpl(IRateLimitToken):
+    # 没有生效的限流规则时使用的令牌
+    async def retire(self):
+        pass
 
 
 class ServiceRateLimitImpl(IServiceRateLimit):
     repo = context.require(IRateLimitRepository)
     token_repo = context.require(IRateLimitTokenRepository)
+    # 首次遇到使用GCRA算法的规则时才创建
+    _gcra_token_repo: Optional[GcraTokenRepository] = None
+
+    _key_locks = StripedLock()
+
+    # user -> {(service, subjects) -> 获取失败的结果}，在available_time之前直接返回该结果
+    _blocked: dict[str, dict[tuple[IService, tuple[str, ...]], AcquireTokenResult]] = {}
+    # 记录的用户数达到该值时清理已过期的记录
+    _blocked_prune_threshold = 1024
 
     def __init__(self, service: IService):
         self.service = service
 
+    @classmethod
+    def of(cls, service: IService) -> "ServiceRateLimitImpl":
+        """
+        返回服务自身持有的实现（由ServiceComponentFactory创建）
+        """
+        impl = getattr(service, "_rate_limit_impl", None)
+        if isinstance(impl, cls):
+            return impl
+        return cls(service)
+
     def on_add_rate_limit_rule(self, func: Optional[T_Listener] = None):
         return on_event(
             EventType.service_add_rate_limit_rule,
@@ -70,19 +109,14 @@ class ServiceRateLimitImpl(IServiceRateLimit):
     async def get_rate_limit_rules_by_subject(
         self, *subject: str, trace: bool = True
     ) -> AsyncGenerator[RateLimitRule, None]:
+        if trace:
+            nodes = list(self.service.trace())
+        else:
+            nodes = [self.service]
+
         async with use_ac_session():
-            for sub in subject:
-                if trace:
-                    for node in self.service.trace():
-                        async for p in self._get_rules_by_subject(node, sub):
-                            yield p
-                            if p.overwrite:
-                                return
-                else:
-                    async for p in self._get_rules_by_subject(self.service, sub):
-                        yield p
-                        if p.overwrite:
-                            return
+            async for p in self.repo.get_effective_rules(nodes, subject):
+                yield p
 
     async def get_rate_limit_rules(
         self, *, trace: bool = True
@@ -127,12 +161,23 @@ class ServiceRateLimitImpl(IServiceRateLimit):
             )
 
     async def add_rate_limit_rule(
-        self, subject: str, time_span: timedelta, limit: int, overwrite: bool = False
+        self,
+        subject: str,
+        time_span: timedelta,
+        limit: int,
+        overwrite: bool = False,
+        algorithm: Optional[str] = None,
     ) -> RateLimitRule:
+        if algorithm is not None and algorithm not in RATE_LIMIT_ALGORITHMS:
+            raise AccessControlBadRequestError(f"不支持的限流算法：{algorithm}")
+
         async with use_ac_session():
             rule = await self.repo.add_rate_limit_rule(
-                self.service, subject, time_span, limit, overwrite
+                self.service, subject, time_span, limit, overwrite, algorithm
             )
+            ConfiguredServiceIndex.add(self.service, subject)
+            # 新增的覆写规则可能使原本生效的规则失效
+            self._unblock()
             await self._fire_service_add_rate_limit_rule(rule)
             return rule
 
@@ -141,90 +186,195 @@ class ServiceRateLimitImpl(IServiceRateLimit):
         async with use_ac_session():
             rule = await cls.repo.remove_rate_limit_rule(rule_id)
             if rule is not None:
+                cls._unblock()
+                ConfiguredServiceIndex.invalidate()
                 await cls._fire_service_remove_rate_limit_rule(rule)
                 return True
             else:
                 return False
 
     @classmethod
-    async def _get_first_expire_token(
-        cls, rule: RateLimitRule, user: str
-    ) -> Optional[RateLimitSingleToken]:
-        return await cls.token_repo.get_first_expire_token(rule, user)
+    async def get_rule_algorithm(cls, rule_id: str) -> Optional[str]:
+        # 规则存储中已缓存各规则的算法
+        return await cls.repo.get_rule_algorithm(rule_id)
+
+    @classmethod
+    def _get_gcra_token_repo(cls) -> GcraTokenRepository:
+        if cls._gcra_token_repo is None:
+            cls._gcra_token_repo = context.require(GcraTokenRepository)
+        return cls._gcra_token_repo
+
+    @classmethod
+    async def _get_token_repo(cls, rule_id: str) -> IRateLimitTokenRepository:
+        if await cls.get_rule_algorithm(rule_id) == "gcra":
+            return cls._get_gcra_token_repo()
+        else:
+            return cls.token_repo
+
+    @classmethod
+    async def _acquire_tokens(
+        cls, rules: Collection[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        # 同一用户的并发请求在此串行，不同用户的请求互不阻塞
+        async with cls._key_locks.acquire(StorageKey(x.id, user) for x in rules):
+            return await cls._acquire_tokens_locked(rules, user)
 
     @classmethod
-    async def _acquire_token(
-        cls, rule: RateLimitRule, user: str
-    ) -> Optional[RateLimitSingleToken]:
-        x = await cls.token_repo.acquire_token(rule, user)
-        if x is not None:
+    async def _acquire_tokens_locked(
+        cls, rules: Collection[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        # 按存储方式分组，同一存储内的规则一次性获取
+        groups: dict[IRateLimitTokenRepository, list[RateLimitRule]] = {}
+        for rule in rules:
+            token_repo = await cls._get_token_repo(rule.id)
+            groups.setdefault(token_repo, []).append(rule)
+
+        tokens = []
+        violating = []
+        available_time = None
+        for token_repo, group in groups.items():
+            result = await token_repo.acquire_tokens(group, user)
+            tokens.extend(result.tokens)
+            violating.extend(result.violating)
+            if result.available_time is not None and (
+                available_time is None or result.available_time < available_time
+            ):
+                available_time = result.available_time
+
+        if len(violating) != 0 and len(tokens) != 0:
+            # 规则分属不同的存储时，归还其他存储中已获取的令牌
+            for t in tokens:
+                await cls._retire_token(t)
+            tokens = []
+
+        for x in tokens:
             logger.trace(
                 f"[rate limit] token {x.id} acquired "
-                f"for rule {x.rule_id} by user {x.user} "
-                f"(service: {rule.service})"
+                f"for rule {x.rule_id} by user {x.user}"
             )
-        return x
+        return AcquireTokensResult(tokens, violating, available_time)
 
     @classmethod
     async def _retire_token(cls, token: RateLimitSingleToken):
-        await cls.token_repo.retire_token(token)
+        token_repo = await cls._get_token_repo(token.rule_id)
+        await token_repo.retire_token(token)
         logger.trace(
             f"[rate limit] token {token.id} retired for "
             f"rule {token.rule_id} by user {token.user}"
         )
 
+    @classmethod
+    def _get_blocked(
+        cls, service: IService, subject: tuple[str, ...]
+    ) -> Optional[AcquireTokenResult]:
+        entries = cls._blocked.get(subject[0])
+        if entries is None:
+            return None
+
+        result = entries.get((service, subject))
+        if result is None:
+            return None
+
+        if result.available_time <= datetime.utcnow():
+            del entries[(service, subject)]
+            if len(entries) == 0:
+                del cls._blocked[subject[0]]
+            return None
+
+        return result
+
+    @classmethod
+    def _put_blocked(
+        cls, service: IService, subject: tuple[str, ...], result: AcquireTokenResult
+    ):
+        if len(cls._blocked) >= cls._blocked_prune_threshold:
+            now = datetime.utcnow()
+            for user in list(cls._blocked.keys()):
+                entries = cls._blocked[user]
+                for k in [k for k, v in entries.items() if v.available_time <= now]:
+                    del entries[k]
+                if len(entries) == 0:
+                    del cls._blocked[user]
+            # 清理后仍有大量用户被限流时放宽阈值，使清理的开销均摊到每次写入
+            cls._blocked_prune_threshold = max(1024, len(cls._blocked) * 2)
+
+        cls._blocked.setdefault(subject[0], {})[(service, subject)] = result
+
+    @classmethod
+    def _unblock(cls, user: Optional[str] = None):
+        if user is None:
+            cls._blocked = {}
+        else:
+            cls._blocked.pop(user, None)
+
     async def acquire_token_for_rate_limit_by_subjects_receiving_result(
         self, *subject: str
     ) -> AcquireTokenResult:
+        return await self._acquire_token_by_subjects(
+            list(self.service.trace()), single_stage(subject)
+        )
+
+    async def _acquire_token_by_subjects(
+        self, nodes: Sequence[IService], stages: AsyncIterable[Sequence[str]]
+    ) -> AcquireTokenResult:
+        """
+        stages依次为越来越长的主体列表（前缀），某个前缀的生效规则以覆写规则截止时，
+        更长的列表不会再有新的生效规则
+        """
+        config = conf()
+        blocked_cache_enabled = config.access_control_rate_limit_blocked_cache_enabled
+        skip_enabled = config.access_control_skip_unconfigured_subject_enabled
+
         async with use_ac_session():
-            assert len(subject) > 0, "require at least one subject"
-            user = subject[0]
+            async for subject in stages:
+                assert len(subject) > 0, "require at least one subject"
+                subject = tuple(subject)
+                user = subject[0]
 
-            tokens = []
-            violating_rules = []
-
-            # 先获取所有rule，再对每个rule获取token
-            rules = [x async for x in self.get_rate_limit_rules_by_subject(*subject)]
-            for rule in rules:
-                token = await self._acquire_token(rule, user)
-                if token is not None:
-                    tokens.append(token)
-                else:
+                if blocked_cache_enabled:
+                    cached = self._get_blocked(self.service, subject)
+                    if cached is not None:
+                        logger.trace(
+                            f"[rate limit] user {user} is blocked "
+                            f"until {cached.available_time} (cached)"
+                        )
+                        return cached
+
+                # 令牌仍按完整主体列表的第一个主体（用户）计数
+                query = subject
+                if skip_enabled:
+                    query = await ConfiguredServiceIndex.filter_subjects(nodes, subject)
+                rules = [x async for x in self.repo.get_effective_rules(nodes, query)]
+                if len(rules) != 0 and rules[-1].overwrite:
+                    break
+
+            result = await self._acquire_tokens(rules, user)
+
+            if len(result.violating) != 0:
+                for rule in result.violating:
                     logger.debug(
                         f"[rate limit] limit reached for rule {rule.id} "
                         f"(service: {rule.service}, subject: {rule.subject})"
                     )
-                    violating_rules.append(rule)
-
-                if rule.overwrite:
-                    break
 
-            success = len(violating_rules) == 0
-            if not success:
-                for t in tokens:
-                    await self._retire_token(t)
-
-                first_expire_token = None
-                for rule in violating_rules:
-                    _first_expire_token = await self._get_first_expire_token(rule, user)
-                    if (
-                        first_expire_token is None
-                        or _first_expire_token.expire_time
-                        < first_expire_token.expire_time
-                    ):
-                        first_expire_token = _first_expire_token
-
-                return AcquireTokenResult(
+                failure = AcquireTokenResult(
                     success=False,
-                    violating=violating_rules,
-                    available_time=first_expire_token.expire_time,
+                    violating=result.violating,
+                    available_time=result.available_time,
                 )
+                if blocked_cache_enabled and result.available_time is not None:
+                    self._put_blocked(self.service, subject, failure)
+                return failure
             else:
                 return AcquireTokenResult(
-                    success=True, token=RateLimitTokenImpl(tokens, self)
+                    success=True, token=RateLimitTokenImpl(result.tokens, self)
                 )
 
     @classmethod
     async def clear_rate_limit_tokens(cls):
+        cls._unblock()
         async with use_ac_session():
             await cls.token_repo.clear_token()
+            gcra_token_repo = cls._gcra_token_repo
+            if gcra_token_repo is not None and gcra_token_repo is not cls.token_repo:
+                await gcra_token_repo.clear_token()
@@ -0,0 +1,39 @@
+from typing import Optional
+from datetime import timedelta
+
+from nonebot_plugin_access_control_api.service.interface import IService
+from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+from ._impl.rate_limit import RATE_LIMIT_ALGORITHMS, ServiceRateLimitImpl
+
+
+async def add_rate_limit_rule(
+    service: IService,
+    subject: str,
+    time_span: timedelta,
+    limit: int,
+    overwrite: bool = False,
+    algorithm: Optional[str] = None,
+) -> RateLimitRule:
+    """
+    为服务添加限流规则，与Service.add_rate_limit_rule相同，但可以为该规则指定限流算法
+
+    algorithm为RATE_LIMIT_ALGORITHMS之一，为None时使用access_control_rate_limit_token_storage配置的存储方式
+    """
+    return await ServiceRateLimitImpl.of(service).add_rate_limit_rule(
+        subject, time_span, limit, overwrite, algorithm
+    )
+
+
+async def get_rate_limit_rule_algorithm(rule_id: str) -> Optional[str]:
+    """
+    返回限流规则指定的限流算法，未指定时返回None
+    """
+    return await ServiceRateLimitImpl.get_rule_algorithm(rule_id)
+
+
+__all__ = (
+    "RATE_LIMIT_ALGORITHMS",
+    "add_rate_limit_rule",
+    "get_rate_limit_rule_algorithm",
+)
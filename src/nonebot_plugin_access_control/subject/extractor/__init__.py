@@ -1,22 +1,56 @@
-from collections.abc import Sequence
+import weakref
+from typing import Callable, Optional
+from collections.abc import Sequence, Awaitable
 
-from nonebot import logger
+from nonebot import Bot, logger
+from nonebot.internal.adapter import Event
 from nonebot_plugin_session import Session
+from nonebot_plugin_access_control_api.subject import extract_subjects
 from nonebot_plugin_access_control_api.subject.extractor import extractor_chain
 
 from .builtin.qqguild import extract_qqguild_role
+from .builtin.member_role import member_role_cache
 from .builtin.kaiheila import extract_kaiheila_role
-from .builtin.onebot_v11 import extract_onebot_v11_group_role
-from .builtin.session import extract_by_session, extract_from_session
+from .builtin.onebot_v11 import (
+    extract_onebot_v11_group_role,
+    prefetch_onebot_v11_group_role,
+)
+from .builtin.session import (
+    extract_by_session,
+    extract_from_session,
+    session_subject_cache,
+)
 
-extractor_chain.add_first(
+BUILTIN_EXTRACTORS = (
     extract_by_session,
     extract_onebot_v11_group_role,
     extract_qqguild_role,
     extract_kaiheila_role,
 )
+
+extractor_chain.add_first(*BUILTIN_EXTRACTORS)
 logger.debug("added default subject extractors")
 
+T_SubjectPrefetcher = Callable[[Bot, Event], Awaitable[None]]
+
+_prefetchers: list[T_SubjectPrefetcher] = [prefetch_onebot_v11_group_role]
+
+
+def add_subject_prefetcher(prefetcher: T_SubjectPrefetcher) -> T_SubjectPrefetcher:
+    """
+    添加在提取主体前调用的异步函数
+
+    提取器链是同步的，需要调用平台API的数据（如成员角色）由prefetcher预先获取并缓存，
+    提取器再从缓存中读取。prefetcher应在缓存命中时立即返回。
+    """
+    _prefetchers.append(prefetcher)
+    return prefetcher
+
+
+async def prefetch_subjects(bot: Bot, event: Event):
+    for prefetcher in _prefetchers:
+        await prefetcher(bot, event)
+
 
 def extract_subjects_from_session(session: Session) -> Sequence[str]:
     sbj = [x.content for x in extract_from_session(session)]
@@ -24,4 +58,44 @@ def extract_subjects_from_session(session: Session) -> Sequence[str]:
     return sbj
 
 
-__all__ = ("extract_subjects_from_session",)
+# id(event) -> (事件的弱引用, 主体列表)
+# 事件对象不可哈希，因此以id为key，并在事件被回收时移除
+_event_subjects: dict[int, tuple[weakref.ref, tuple[str, ...]]] = {}
+# 不支持弱引用的事件（如pydantic v1的模型，其__slots__为空）只缓存最近的一个
+_last_event_subjects: Optional[tuple[Event, tuple[str, ...]]] = None
+
+
+def extract_subjects_cached(bot: Bot, event: Event) -> Sequence[str]:
+    """
+    与extract_subjects相同，但同一个事件只提取一次（多个matcher处理同一个事件时共享结果）
+    """
+    global _last_event_subjects
+
+    key = id(event)
+    entry = _event_subjects.get(key)
+    if entry is not None and entry[0]() is event:
+        return entry[1]
+
+    last = _last_event_subjects
+    if last is not None and last[0] is event:
+        return last[1]
+
+    sbj = tuple(extract_subjects(bot, event))
+    try:
+        ref = weakref.ref(event, lambda _: _event_subjects.pop(key, None))
+    except TypeError:
+        # 持有强引用，直到下一个这样的事件到来
+        _last_event_subjects = (event, sbj)
+    else:
+        _event_subjects[key] = (ref, sbj)
+    return sbj
+
+
+__all__ = (
+    "extract_subjects_from_session",
+    "extract_subjects_cached",
+    "add_subject_prefetcher",
+    "prefetch_subjects",
+    "session_subject_cache",
+    "member_role_cache",
+)
@@ -0,0 +1,159 @@
+import asyncio
+from time import monotonic
+from collections import OrderedDict
+from collections.abc import Awaitable
+from typing import Callable, Optional, NamedTuple
+
+from nonebot import Bot, logger
+
+from ....config import conf
+
+# (bot.self_id, 群组id, 用户id)
+T_MemberKey = tuple[str, str, str]
+T_RoleFetcher = Callable[[], Awaitable[Optional[str]]]
+
+
+class MemberRoleCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    fetches: int
+
+
+class MemberRoleCache:
+    """
+    按(bot, 群组, 用户)缓存从平台获取的成员角色（带过期时间）
+
+    同一成员同时只会有一个进行中的请求，其余请求等待其结果；每个bot同时进行的请求数不超过上限。
+    获取失败或平台未返回角色时，在较短的时间内不再重新获取，避免每个事件都调用一次API。
+    """
+
+    def __init__(self):
+        # key -> (过期时间, 角色)
+        # 所有条目的过期时间相同，因此插入顺序即过期顺序
+        self._data: OrderedDict[T_MemberKey, tuple[float, str]] = OrderedDict()
+        # 获取失败的key -> 过期时间，同样按插入顺序过期
+        self._failed: OrderedDict[T_MemberKey, float] = OrderedDict()
+        self._pending: dict[T_MemberKey, asyncio.Future] = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    @property
+    def stats(self) -> MemberRoleCacheStats:
+        return MemberRoleCacheStats(self.hits, self.misses, self.fetches)
+
+    def clear(self):
+        self._data.clear()
+        self._failed.clear()
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    @staticmethod
+    def _make_key(bot: Bot, group_id, user_id) -> T_MemberKey:
+        return bot.self_id, str(group_id), str(user_id)
+
+    def get(self, bot: Bot, group_id, user_id) -> Optional[str]:
+        """
+        返回缓存的角色，未缓存或已过期时返回None
+        """
+        entry = self._data.get(self._make_key(bot, group_id, user_id))
+        if entry is not None and entry[0] > monotonic():
+            return entry[1]
+        return None
+
+    def put(self, bot: Bot, group_id, user_id, role: str):
+        key = self._make_key(bot, group_id, user_id)
+        now = monotonic()
+
+        config = conf()
+        self._failed.pop(key, None)
+        self._data.pop(key, None)
+        self._data[key] = (now + config.access_control_role_cache_ttl, role)
+
+        while len(self._data) > config.access_control_subject_cache_size:
+            self._data.popitem(last=False)
+        # 清理过期条目
+        while len(self._data) > 0:
+            expire, _ = next(iter(self._data.values()))
+            if expire > now:
+                break
+            self._data.popitem(last=False)
+
+    def _is_failed(self, key: T_MemberKey) -> bool:
+        expire = self._failed.get(key)
+        return expire is not None and expire > monotonic()
+
+    def _put_failed(self, key: T_MemberKey):
+        now = monotonic()
+
+        config = conf()
+        self._failed.pop(key, None)
+        self._failed[key] = now + config.access_control_role_fetch_failure_ttl
+
+        while len(self._failed) > config.access_control_subject_cache_size:
+            self._failed.popitem(last=False)
+        # 清理过期条目
+        while len(self._failed) > 0:
+            expire = next(iter(self._failed.values()))
+            if expire > now:
+                break
+            self._failed.popitem(last=False)
+
+    def _get_semaphore(self, bot: Bot) -> asyncio.Semaphore:
+        # 延迟创建，避免绑定到导入时的事件循环
+        sem = self._semaphores.get(bot.self_id)
+        if sem is None:
+            sem = self._semaphores[bot.self_id] = asyncio.Semaphore(
+                conf().access_control_role_fetch_concurrency
+            )
+        return sem
+
+    async def _fetch(
+        self, bot: Bot, group_id, user_id, fetcher: T_RoleFetcher
+    ) -> Optional[str]:
+        async with self._get_semaphore(bot):
+            self.fetches += 1
+            try:
+                role = await fetcher()
+            except Exception as e:
+                logger.opt(exception=e).warning(
+                    f"failed to fetch role of user {user_id} in group {group_id}"
+                )
+                role = None
+
+        if role is not None:
+            self.put(bot, group_id, user_id, role)
+        else:
+            self._put_failed(self._make_key(bot, group_id, user_id))
+        return role
+
+    async def fetch(
+        self, bot: Bot, group_id, user_id, fetcher: T_RoleFetcher
+    ) -> Optional[str]:
+        """
+        返回缓存的角色；未缓存时调用fetcher从平台获取，获取失败时返回None
+        """
+        role = self.get(bot, group_id, user_id)
+        if role is not None:
+            self.hits += 1
+            return role
+
+        key = self._make_key(bot, group_id, user_id)
+        if self._is_failed(key):
+            self.hits += 1
+            return None
+
+        self.misses += 1
+        fut = self._pending.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch(bot, group_id, user_id, fetcher))
+            self._pending[key] = fut
+            fut.add_done_callback(lambda _: self._pending.pop(key, None))
+
+        # 等待者被取消时不影响其他等待同一请求的调用方
+        return await asyncio.shield(fut)
+
+
+member_role_cache = MemberRoleCache()
@@ -5,12 +5,41 @@ from nonebot.internal.adapter import Event
 from nonebot_plugin_access_control_api.subject.model import SubjectModel
 from nonebot_plugin_access_control_api.subject.manager import SubjectManager
 
+from ....config import conf
+from .member_role import member_role_cache
+
 if TYPE_CHECKING:
     from nonebot.adapters.onebot.v11.event import Sender
 
 OFFER_BY = "nonebot_plugin_access_control"
 
 
+async def prefetch_onebot_v11_group_role(bot: Bot, event: Event):
+    """
+    事件不带有发送者角色时（如通知事件），通过get_group_member_info获取并缓存
+    """
+    if bot.type != "OneBot V11":
+        return
+
+    group_id = getattr(event, "group_id", None)
+    user_id = getattr(event, "user_id", None)
+    if group_id is None or user_id is None:
+        return
+
+    sender: Optional[Sender] = getattr(event, "sender", None)
+    if sender is not None and sender.role is not None:
+        return
+
+    if not conf().access_control_onebot_v11_role_fetch_enabled:
+        return
+
+    async def fetch() -> Optional[str]:
+        info = await bot.get_group_member_info(group_id=group_id, user_id=user_id)
+        return info.get("role")
+
+    await member_role_cache.fetch(bot, group_id, user_id, fetch)
+
+
 def extract_onebot_v11_group_role(bot: Bot, event: Event, manager: SubjectManager):
     if bot.type != "OneBot V11":
         return
@@ -18,10 +47,19 @@ def extract_onebot_v11_group_role(bot: Bot, event: Event, manager: SubjectManage
     group_id = getattr(event, "group_id", None)
     sender: Optional[Sender] = getattr(event, "sender", None)
 
-    if group_id is not None and sender is not None:
+    role = None
+    if sender is not None:
+        role = sender.role
+    if role is None and group_id is not None:
+        user_id = getattr(event, "user_id", None)
+        if user_id is not None:
+            # 由prefetch_onebot_v11_group_role获取
+            role = member_role_cache.get(bot, group_id, user_id)
+
+    if group_id is not None and role is not None:
         li = []
 
-        if sender.role == "owner":
+        if role == "owner":
             li.append(
                 SubjectModel(
                     f"qq:g{group_id}.group_owner", OFFER_BY, "qq:group.group_owner"
@@ -29,7 +67,7 @@ def extract_onebot_v11_group_role(bot: Bot, event: Event, manager: SubjectManage
             )
             li.append(SubjectModel("qq:group_owner", OFFER_BY, "qq:group_owner"))
 
-        if sender.role == "owner" or sender.role == "admin":
+        if role == "owner" or role == "admin":
             li.append(
                 SubjectModel(
                     f"qq:g{group_id}.group_admin", OFFER_BY, "qq:group.group_admin"
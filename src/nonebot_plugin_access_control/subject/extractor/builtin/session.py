@@ -1,116 +1,201 @@
+from time import monotonic
+from collections import OrderedDict
 from collections.abc import Sequence
+from typing import Optional, NamedTuple
 
 from nonebot import Bot
 from nonebot.internal.adapter import Event
 from nonebot_plugin_access_control_api.subject.model import SubjectModel
 from nonebot_plugin_session import Session, SessionLevel, extract_session
-from nonebot_plugin_access_control_api.utils.superuser import is_superuser
 from nonebot_plugin_access_control_api.subject.manager import SubjectManager
+from nonebot_plugin_access_control_api.utils.superuser import superusers, is_superuser
+
+from ....config import conf
 
 OFFER_BY = "nonebot_plugin_access_control"
 
 
-def _append_subject(
-    li: list[SubjectModel],
-    content_body: str,
-    content_prefix: Sequence[str],
-    tag: Sequence[str],
-):
-    for i in range(min(len(content_prefix), len(tag))):
-        li.append(SubjectModel(f"{content_prefix[i]}{content_body}", OFFER_BY, tag[i]))
+# 各会话级别的主体布局，依次为：
+#   (_PREFIXED, 内容, 标签列表)：内容前依次加上各个前缀，与标签一一对应；
+#       内容中的{0}、{1}、{2}分别替换为会话的id1、id2、id3
+#   (_PLAIN, 内容, 标签)：不加前缀的常量主体
+#   (_SUPERUSER, None, None)：用户为超级用户时才添加
+_PREFIXED = 0
+_PLAIN = 1
+_SUPERUSER = 2
+
+_LAYOUTS = {
+    SessionLevel.LEVEL3: (
+        (
+            _PREFIXED,
+            ":g{2}:c{1}:{0}",
+            ("platform:guild:channel:user", "onebot:guild:channel:user"),
+        ),
+        (_PREFIXED, ":c{1}:{0}", ("platform:channel:user", "onebot:channel:user")),
+        (_PREFIXED, ":g{2}:{0}", ("platform:guild:user", "onebot:guild:user")),
+        (_PREFIXED, ":{0}", ("platform:user", "onebot:user")),
+        (_SUPERUSER, None, None),
+        (_PREFIXED, ":g{2}:c{1}", ("platform:guild:channel", "onebot:guild:channel")),
+        (_PREFIXED, ":c{1}", ("platform:channel", "onebot:channel")),
+        (_PREFIXED, ":g{2}", ("platform:guild", "onebot:guild")),
+        (_PREFIXED, ":channel", ("platform:chat_type", "onebot:chat_type")),
+        (_PLAIN, "channel", "chat_type"),
+    ),
+    SessionLevel.LEVEL2: (
+        (_PREFIXED, ":g{1}:{0}", ("platform:group:user", "onebot:group:user")),
+        (_PREFIXED, ":{0}", ("platform:user", "onebot:user")),
+        (_SUPERUSER, None, None),
+        (_PREFIXED, ":g{1}", ("platform:group", "onebot:group")),
+        (_PREFIXED, ":group", ("platform:chat_type", "onebot:chat_type")),
+        (_PLAIN, "group", "chat_type"),
+    ),
+    SessionLevel.LEVEL1: (
+        (_PREFIXED, ":{0}", ("platform:user", "onebot:user")),
+        (_SUPERUSER, None, None),
+        (_PREFIXED, ":private", ("platform:chat_type", "onebot:chat_type")),
+        (_PLAIN, "private", "chat_type"),
+    ),
+}
+
+_LAYOUT_TAIL = (
+    (_PREFIXED, "", ("platform", "onebot")),
+    (_PLAIN, "all", "all"),
+)
+
+_SUPERUSER_SUBJECT = SubjectModel("superuser", OFFER_BY, "superuser")
+
+
+class _Slot(NamedTuple):
+    # 格式串，为None时直接使用subject
+    fmt: Optional[str]
+    tag: Optional[str]
+    subject: Optional[SubjectModel]
+    superuser_only: bool
+
+
+T_Template = tuple[_Slot, ...]
+
+# (bot_type, platform, level) -> 模板
+_templates: dict[tuple[str, str, SessionLevel], T_Template] = {}
+
+
+def _compile_template(prefix: Sequence[str], level: SessionLevel) -> T_Template:
+    slots = []
+    for kind, content, tag in (*_LAYOUTS.get(level, ()), *_LAYOUT_TAIL):
+        if kind == _SUPERUSER:
+            slots.append(_Slot(None, None, _SUPERUSER_SUBJECT, True))
+        elif kind == _PLAIN:
+            slots.append(_Slot(None, None, SubjectModel(content, OFFER_BY, tag), False))
+        else:
+            for p, t in zip(prefix, tag):
+                # 前缀中的花括号需要转义
+                fmt = p.replace("{", "{{").replace("}", "}}") + content
+                if "{" in content:
+                    slots.append(_Slot(fmt, t, None, False))
+                else:
+                    # 不含id的主体在编译时生成
+                    subject = SubjectModel(fmt.format(), OFFER_BY, t)
+                    slots.append(_Slot(None, None, subject, False))
+    return tuple(slots)
+
+
+def _get_template(session: Session) -> T_Template:
+    key = (session.bot_type, session.platform, session.level)
+    template = _templates.get(key)
+    if template is None:
+        if session.bot_type == "OneBot V11" or session.bot_type == "OneBot V12":
+            prefix = [session.platform, "onebot"]
+        else:
+            prefix = [session.platform]
+        template = _templates[key] = _compile_template(prefix, session.level)
+    return template
 
 
 def extract_from_session(session: Session) -> Sequence[SubjectModel]:
-    if session.bot_type == "OneBot V11" or session.bot_type == "OneBot V12":
-        prefix = [session.platform, "onebot"]
-    else:
-        prefix = [session.platform]
+    template = _get_template(session)
+    ids = (session.id1, session.id2, session.id3)
+    superuser = session.level in _LAYOUTS and is_superuser(
+        session.id1, session.bot_type
+    )
 
     li: list[SubjectModel] = []
+    for fmt, tag, subject, superuser_only in template:
+        if fmt is not None:
+            li.append(SubjectModel(fmt.format(*ids), OFFER_BY, tag))
+        elif not superuser_only or superuser:
+            li.append(subject)
+    return li
 
-    if session.level == SessionLevel.LEVEL3:
-        user_id = session.id1
-        channel_id = session.id2
-        guild_id = session.id3
 
-        _append_subject(
-            li,
-            f":g{guild_id}:c{channel_id}:{user_id}",
-            prefix,
-            ["platform:guild:channel:user", "onebot:guild:channel:user"],
-        )
-        _append_subject(
-            li,
-            f":c{channel_id}:{user_id}",
-            prefix,
-            ["platform:channel:user", "onebot:channel:user"],
-        )
-        _append_subject(
-            li,
-            f":g{guild_id}:{user_id}",
-            prefix,
-            ["platform:guild:user", "onebot:guild:user"],
-        )
-        _append_subject(li, f":{user_id}", prefix, ["platform:user", "onebot:user"])
+T_SessionKey = tuple[str, str, int, Optional[str], Optional[str], Optional[str]]
 
-        if is_superuser(user_id, session.bot_type):
-            li.append(SubjectModel("superuser", OFFER_BY, "superuser"))
 
-        _append_subject(
-            li,
-            f":g{guild_id}:c{channel_id}",
-            prefix,
-            ["platform:guild:channel", "onebot:guild:channel"],
-        )
-        _append_subject(
-            li, f":c{channel_id}", prefix, ["platform:channel", "onebot:channel"]
-        )
-        _append_subject(li, f":g{guild_id}", prefix, ["platform:guild", "onebot:guild"])
+class SessionSubjectCacheStats(NamedTuple):
+    hits: int
+    misses: int
 
-        _append_subject(
-            li, ":channel", prefix, ["platform:chat_type", "onebot:chat_type"]
-        )
-        li.append(SubjectModel("channel", OFFER_BY, "chat_type"))
-    elif session.level == SessionLevel.LEVEL2:
-        user_id = session.id1
-        group_id = session.id2
-
-        _append_subject(
-            li,
-            f":g{group_id}:{user_id}",
-            prefix,
-            ["platform:group:user", "onebot:group:user"],
-        )
-        _append_subject(li, f":{user_id}", prefix, ["platform:user", "onebot:user"])
 
-        if is_superuser(user_id, session.bot_type):
-            li.append(SubjectModel("superuser", OFFER_BY, "superuser"))
+class SessionSubjectCache:
+    """
+    按会话缓存extract_from_session的结果（LRU，带过期时间）
 
-        _append_subject(li, f":g{group_id}", prefix, ["platform:group", "onebot:group"])
-        _append_subject(
-            li, ":group", prefix, ["platform:chat_type", "onebot:chat_type"]
-        )
-        li.append(SubjectModel("group", OFFER_BY, "chat_type"))
-    elif session.level == SessionLevel.LEVEL1:
-        user_id = session.id1
+    结果只取决于会话的各字段与超级用户配置，超级用户配置变化时清空缓存。
+    角色等随消息变化的主体由其他提取器在此基础上插入，不进入缓存。
+    """
+
+    def __init__(self):
+        # key -> (过期时间, 主体列表)
+        self._data: OrderedDict[
+            T_SessionKey, tuple[float, tuple[SubjectModel, ...]]
+        ] = OrderedDict()
+        self._superusers: frozenset[str] = frozenset()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> SessionSubjectCacheStats:
+        return SessionSubjectCacheStats(self.hits, self.misses)
 
-        _append_subject(li, f":{user_id}", prefix, ["platform:user", "onebot:user"])
+    def clear(self):
+        self._data.clear()
 
-        if is_superuser(user_id, session.bot_type):
-            li.append(SubjectModel("superuser", OFFER_BY, "superuser"))
+    def get(self, session: Session) -> Sequence[SubjectModel]:
+        # is_superuser读取的集合
+        if superusers != self._superusers:
+            self._data.clear()
+            self._superusers = frozenset(superusers)
 
-        _append_subject(
-            li, ":private", prefix, ["platform:chat_type", "onebot:chat_type"]
+        key = (
+            session.bot_type,
+            session.platform,
+            session.level,
+            session.id1,
+            session.id2,
+            session.id3,
         )
-        li.append(SubjectModel("private", OFFER_BY, "chat_type"))
+        now = monotonic()
 
-    _append_subject(li, "", prefix, ["platform", "onebot"])
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > now:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
 
-    li.append(SubjectModel("all", OFFER_BY, "all"))
+        self.misses += 1
+        subjects = tuple(extract_from_session(session))
 
-    return li
+        config = conf()
+        self._data[key] = (now + config.access_control_subject_cache_ttl, subjects)
+        self._data.move_to_end(key)
+        while len(self._data) > config.access_control_subject_cache_size:
+            self._data.popitem(last=False)
+
+        return subjects
+
+
+session_subject_cache = SessionSubjectCache()
 
 
 def extract_by_session(bot: Bot, event: Event, manager: SubjectManager):
     session = extract_session(bot, event)
-    manager.append(*extract_from_session(session))
+    manager.append(*session_subject_cache.get(session))
@@ -0,0 +1,68 @@
+from collections.abc import Sequence, AsyncIterator
+
+from nonebot import Bot
+from nonebot.internal.adapter import Event
+from nonebot_plugin_session import extract_session
+from nonebot_plugin_access_control_api.subject.extractor import extractor_chain
+
+from .builtin.session import session_subject_cache
+from . import BUILTIN_EXTRACTORS, prefetch_subjects, extract_subjects_cached
+
+# 用户级别的主体，位于内置提取器所得主体列表的最前面，角色等主体总是插入在其后
+USER_TAGS = frozenset(
+    (
+        "platform:guild:channel:user",
+        "onebot:guild:channel:user",
+        "platform:channel:user",
+        "onebot:channel:user",
+        "platform:guild:user",
+        "onebot:guild:user",
+        "platform:group:user",
+        "onebot:group:user",
+        "platform:user",
+        "onebot:user",
+        "superuser",
+    )
+)
+
+
+class SubjectStream:
+    """
+    按优先级从高到低、按需提取事件的主体
+
+    stages()依次给出越来越长的主体列表（均为完整列表的前缀），最后一个为完整的主体列表。
+    只使用第一个前缀就能得出结论时，无需运行完整的提取器链（群组、频道、角色等），
+    也无需从平台获取角色。
+    """
+
+    def __init__(self, bot: Bot, event: Event):
+        self.bot = bot
+        self.event = event
+
+    @property
+    def full(self) -> Sequence[str]:
+        return extract_subjects_cached(self.bot, self.event)
+
+    def _user_subjects(self) -> Sequence[str]:
+        # 有其他提取器时，无法确定完整列表的前缀
+        if tuple(extractor_chain.extractors) != BUILTIN_EXTRACTORS:
+            return ()
+
+        li = []
+        for x in session_subject_cache.get(extract_session(self.bot, self.event)):
+            if x.tag not in USER_TAGS:
+                break
+            li.append(x.content)
+        return tuple(li)
+
+    async def stages(self, lazy: bool = True) -> AsyncIterator[Sequence[str]]:
+        if lazy:
+            user_subjects = self._user_subjects()
+            if len(user_subjects) != 0:
+                yield user_subjects
+        await prefetch_subjects(self.bot, self.event)
+        yield self.full
+
+
+async def single_stage(subject: Sequence[str]) -> AsyncIterator[Sequence[str]]:
+    yield subject
@@ -14,6 +14,13 @@ def pytest_configure(config: pytest.Config) -> None:
     }
 
 
+@pytest.fixture(scope="session", autouse=True)
+def after_nonebot_init(_nonebot_init: None):  # noqa: PT004
+    # 覆盖nonebug中的同名异步fixture：strict模式下它的协程不会被await，
+    # 导致测试结束时出现RuntimeWarning
+    pass
+
+
 @pytest.fixture(scope="session", autouse=True)
 def _prepare_nonebot():
     import nonebot
@@ -0,0 +1,30 @@
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_lazy_ac_session(app: App):
+    from sqlalchemy import select
+
+    from nonebot_plugin_access_control.repository.orm.permission import PermissionOrm
+    from nonebot_plugin_access_control.repository.utils import (
+        use_ac_session,
+        get_ac_session_stats,
+        reset_ac_session_stats,
+    )
+
+    reset_ac_session_stats()
+
+    # 未执行语句时不创建会话
+    async with use_ac_session() as sess:
+        assert not sess.created
+    assert get_ac_session_stats() == (1, 0)
+
+    # 嵌套时复用同一个会话
+    async with use_ac_session() as sess:
+        async with use_ac_session() as sess2:
+            assert sess2 is sess
+            await sess2.execute(select(PermissionOrm))
+        assert sess.created
+        await sess.execute(select(PermissionOrm))
+    assert get_ac_session_stats() == (2, 1)
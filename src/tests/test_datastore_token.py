@@ -0,0 +1,144 @@
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_datastore_first_expire_token(app: App):
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.repository.rate_limit import (
+        IRateLimitRepository,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit_token.datastore import (
+        DataStoreTokenRepository,
+    )
+
+    rule_repo = context.require(IRateLimitRepository)
+    rule1 = await rule_repo.add_rate_limit_rule(
+        get_nonebot_service(), "all", timedelta(minutes=1), 2
+    )
+    rule2 = await rule_repo.add_rate_limit_rule(
+        get_nonebot_service(), "all", timedelta(seconds=10), 2
+    )
+
+    repo = DataStoreTokenRepository()
+    assert await repo.get_first_expire_token(rule1, "user1") is None
+
+    # 其他规则与其他用户的令牌过期得更早，但不应被返回
+    # （其他用户的令牌先获取，其他规则的时间间隔更短）
+    assert await repo.acquire_token(rule1, "user2") is not None
+    token = await repo.acquire_token(rule1, "user1")
+    assert token is not None
+    assert await repo.acquire_token(rule2, "user1") is not None
+
+    first_expire = await repo.get_first_expire_token(rule1, "user1")
+    assert first_expire.id == token.id
+    assert first_expire.rule_id == rule1.id
+    assert first_expire.user == "user1"
+
+    assert await repo.acquire_token(rule1, "user1") is not None
+    assert await repo.acquire_token(rule1, "user1") is None
+    assert (await repo.get_first_expire_token(rule1, "user1")).id == token.id
+
+    await repo.retire_token(token)
+    assert (await repo.get_first_expire_token(rule1, "user1")).id != token.id
+
+
+@pytest.mark.asyncio
+async def test_datastore_acquire_token_concurrently(app: App):
+    import asyncio
+
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.repository.rate_limit import (
+        IRateLimitRepository,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit_token.datastore import (
+        DataStoreTokenRepository,
+    )
+
+    rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        get_nonebot_service(), "all", timedelta(minutes=1), 3
+    )
+
+    repo = DataStoreTokenRepository()
+    tokens = await asyncio.gather(
+        *[repo.acquire_token(rule, "user1") for _ in range(10)]
+    )
+    assert len([x for x in tokens if x is not None]) == 3
+    assert len({x.id for x in tokens if x is not None}) == 3
+
+
+@pytest.mark.asyncio
+async def test_datastore_acquire_tokens(app: App):
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.repository.rate_limit import (
+        IRateLimitRepository,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit_token.datastore import (
+        DataStoreTokenRepository,
+    )
+
+    rule_repo = context.require(IRateLimitRepository)
+    rule1 = await rule_repo.add_rate_limit_rule(
+        get_nonebot_service(), "all", timedelta(minutes=1), 2
+    )
+    rule2 = await rule_repo.add_rate_limit_rule(
+        get_nonebot_service(), "all", timedelta(minutes=1), 1
+    )
+
+    repo = DataStoreTokenRepository()
+    result = await repo.acquire_tokens([rule1, rule2], "user1")
+    assert [x.rule_id for x in result.tokens] == [rule1.id, rule2.id]
+    assert len(result.violating) == 0
+
+    # rule2超出限制时，rule1的令牌随事务一起回滚
+    result = await repo.acquire_tokens([rule1, rule2], "user1")
+    assert len(result.tokens) == 0
+    assert [x.id for x in result.violating] == [rule2.id]
+    assert (
+        result.available_time
+        == (await repo.get_first_expire_token(rule2, "user1")).expire_time
+    )
+    assert await repo.acquire_token(rule1, "user1") is not None
+    assert await repo.acquire_token(rule1, "user1") is None
+
+
+@pytest.mark.asyncio
+async def test_datastore_acquire_tokens_keeps_caller_changes(app: App):
+    from sqlalchemy import select
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.repository.utils import use_ac_session
+    from nonebot_plugin_access_control.repository.orm.permission import PermissionOrm
+    from nonebot_plugin_access_control.repository.rate_limit import (
+        IRateLimitRepository,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit_token.datastore import (
+        DataStoreTokenRepository,
+    )
+
+    rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        get_nonebot_service(), "all", timedelta(minutes=1), 1
+    )
+
+    repo = DataStoreTokenRepository()
+    assert await repo.acquire_token(rule, "user1") is not None
+
+    # 获取失败时只回滚令牌，会话中调用方未提交的修改仍然保留
+    async with use_ac_session() as sess:
+        sess.add(PermissionOrm(subject="qq:23456", service="nonebot", allow=False))
+        result = await repo.acquire_tokens([rule], "user1")
+        assert len(result.violating) == 1
+        await sess.commit()
+
+    async with use_ac_session() as sess:
+        stmt = select(PermissionOrm).where(PermissionOrm.subject == "qq:23456")
+        assert (await sess.execute(stmt)).scalar_one_or_none() is not None
@@ -0,0 +1,115 @@
+from io import StringIO
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_gcra(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+    from nonebot_plugin_access_control.repository.rate_limit_token import gcra
+    from nonebot_plugin_access_control.repository.rate_limit_token.utils import (
+        datetime_to_timestamp,
+    )
+
+    now = 1000.0
+    monkeypatch.setattr(gcra, "time", lambda: now)
+
+    repo = gcra.GcraTokenRepository()
+    rule = RateLimitRule(
+        "rule1", get_nonebot_service(), "all", timedelta(seconds=10), 2, False
+    )
+
+    assert await repo.get_first_expire_token(rule, "user1") is None
+
+    # 允许一次性连续调用limit次
+    assert await repo.acquire_token(rule, "user1") is not None
+    token = await repo.acquire_token(rule, "user1")
+    assert token is not None
+    assert await repo.acquire_token(rule, "user1") is None
+    assert await repo.acquire_token(rule, "user2") is not None
+
+    # 每5秒恢复一次
+    first_expire = await repo.get_first_expire_token(rule, "user1")
+    assert datetime_to_timestamp(first_expire.expire_time) == pytest.approx(1005.0)
+
+    now = 1004.0
+    assert await repo.acquire_token(rule, "user1") is None
+
+    now = 1005.0
+    assert await repo.acquire_token(rule, "user1") is not None
+    assert await repo.acquire_token(rule, "user1") is None
+
+    # 归还令牌后可以再次获取
+    await repo.retire_token(token)
+    assert await repo.acquire_token(rule, "user1") is not None
+
+    now = 1020.0
+    await repo.delete_outdated_tokens()
+    assert len(repo.data) == 0
+
+
+@pytest.mark.asyncio
+async def test_gcra_rule(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_access_control_api.service import get_service_by_qualified_name
+
+    from nonebot_plugin_access_control.handler.limit_handler import ls, add
+    from nonebot_plugin_access_control.handler.utils.env import ac_set_script_env
+    from nonebot_plugin_access_control.service import get_rate_limit_rule_algorithm
+    from nonebot_plugin_access_control.service._impl.rate_limit import (
+        ServiceRateLimitImpl,
+    )
+
+    ac_set_script_env()
+    monkeypatch.setattr(ServiceRateLimitImpl, "_gcra_token_repo", None)
+
+    service = get_service_by_qualified_name("nonebot_plugin_ac_demo.group1")
+
+    # 没有使用GCRA算法的规则时不创建其存储
+    with StringIO() as f:
+        await add(f, "nonebot_plugin_ac_demo", "all", 10, "1m", False)
+    result = await service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert result.success
+    assert ServiceRateLimitImpl._gcra_token_repo is None
+    await service.remove_rate_limit_rule(
+        [x async for x in service.get_rate_limit_rules()][0].id
+    )
+
+    with StringIO() as f:
+        await add(f, "nonebot_plugin_ac_demo", "all", 2, "1m", False, "gcra")
+        assert "(算法：gcra)" in f.getvalue()
+
+    with StringIO() as f:
+        await ls(f, "nonebot_plugin_ac_demo", None)
+        assert "(算法：gcra)" in f.getvalue()
+
+    result = await service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert result.success
+    result = await service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert result.success
+    result = await service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert not result.success
+    assert result.available_time is not None
+
+    await service.clear_rate_limit_tokens()
+    result = await service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert result.success
+
+    # 删除规则后不再保留其算法
+    rule = [x async for x in service.get_rate_limit_rules()][0]
+    assert await get_rate_limit_rule_algorithm(rule.id) == "gcra"
+    await service.remove_rate_limit_rule(rule.id)
+    assert await get_rate_limit_rule_algorithm(rule.id) is None
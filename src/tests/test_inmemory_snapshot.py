@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_inmemory_snapshot(app: App, tmp_path):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import (
+        RateLimitRule,
+        RateLimitSingleToken,
+    )
+
+    from nonebot_plugin_access_control.repository.rate_limit_token.utils import (
+        StorageKey,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit_token.snapshot import (
+        SnapshotInmemoryTokenRepository,
+    )
+
+    path = tmp_path / "rate_limit_token.snapshot"
+    rule = RateLimitRule(
+        "rule1", get_nonebot_service(), "all", timedelta(hours=1), 3, False
+    )
+
+    repo = SnapshotInmemoryTokenRepository(path)
+    # 快照文件不存在时什么都不做
+    await repo.restore()
+
+    token1 = await repo.acquire_token(rule, "user1")
+    token2 = await repo.acquire_token(rule, "user1")
+    await repo.acquire_token(rule, "user2")
+    await repo.retire_token(token1)
+
+    # 已过期的令牌不写入快照
+    now = datetime.utcnow()
+    key = StorageKey("rule2", "user1")
+    queue = repo._get_queue(key, now)
+    queue.append(
+        RateLimitSingleToken(
+            repo.next_id(), "rule2", "user1", now - timedelta(hours=1), now
+        )
+    )
+
+    await repo.snapshot()
+
+    repo = SnapshotInmemoryTokenRepository(path)
+    await repo.restore()
+    # 恢复时不创建令牌队列，首次访问时才创建
+    assert len(repo.data) == 0
+    assert set(repo.restored.index.keys()) == {
+        StorageKey("rule1", "user1"),
+        StorageKey("rule1", "user2"),
+    }
+
+    first_expire = await repo.get_first_expire_token(rule, "user1")
+    assert abs(first_expire.acquire_time - token2.acquire_time) < timedelta(
+        milliseconds=1
+    )
+    assert abs(first_expire.expire_time - token2.expire_time) < timedelta(
+        milliseconds=1
+    )
+
+    # 恢复后计数仍然有效
+    assert await repo.acquire_token(rule, "user1") is not None
+    assert await repo.acquire_token(rule, "user1") is not None
+    assert await repo.acquire_token(rule, "user1") is None
+    assert set(repo.data.keys()) == {StorageKey("rule1", "user1")}
+
+    # 尚未访问的key同样写入快照
+    await repo.snapshot()
+    repo = SnapshotInmemoryTokenRepository(path)
+    await repo.restore()
+    assert await repo.acquire_token(rule, "user1") is None
+    assert await repo.acquire_token(rule, "user2") is not None
+    assert await repo.acquire_token(rule, "user2") is not None
+    assert await repo.acquire_token(rule, "user2") is None
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_token_queue(app: App):
+    from nonebot_plugin_access_control_api.models.rate_limit import (
+        RateLimitSingleToken,
+    )
+
+    from nonebot_plugin_access_control.repository.rate_limit_token.inmemory import (
+        TokenQueue,
+    )
+
+    now = datetime(2024, 1, 1)
+    queue = TokenQueue()
+    for i in range(1, 6):
+        queue.append(
+            RateLimitSingleToken(
+                i, "rule1", "user1", now, now + timedelta(seconds=i * 10)
+            )
+        )
+    assert len(queue) == 5
+
+    # 队尾的令牌直接出队
+    queue.retire(5)
+    assert len(queue) == 4
+    assert len(queue.retired) == 0
+
+    # 队中的令牌只记录墓碑
+    queue.retire(2)
+    assert len(queue) == 3
+    assert queue.retired == {2}
+
+    # 队首过期后，紧随其后的墓碑一并出队
+    queue.handle_expired(now + timedelta(seconds=10))
+    assert len(queue) == 2
+    assert queue.first().id == 3
+    assert len(queue.retired) == 0
+
+    # 已出队的令牌不会再被记录
+    queue.retire(1)
+    assert len(queue) == 2
+
+    # 队首的令牌直接出队
+    queue.retire(3)
+    assert len(queue) == 1
+    assert queue.first().id == 4
+    assert len(queue.retired) == 0
+
+    # 墓碑超过一半时压缩队列
+    for i in range(6, 10):
+        queue.append(
+            RateLimitSingleToken(
+                i, "rule1", "user1", now, now + timedelta(seconds=i * 10)
+            )
+        )
+    queue.retire(6)
+    queue.retire(7)
+    assert queue.retired == {6, 7}
+    queue.retire(8)
+    assert len(queue) == 2
+    assert [x.id for x in queue.tokens] == [4, 9]
+    assert len(queue.retired) == 0
+
+    queue.handle_expired(now + timedelta(seconds=90))
+    assert len(queue) == 0
+    assert queue.first() is None
+
+
+@pytest.mark.asyncio
+async def test_inmemory_token(app: App):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+    from nonebot_plugin_access_control.repository.rate_limit_token.inmemory import (
+        InmemoryTokenRepository,
+    )
+
+    repo = InmemoryTokenRepository()
+
+    rule = RateLimitRule(
+        "rule1", get_nonebot_service(), "all", timedelta(hours=1), 3, False
+    )
+
+    assert await repo.get_first_expire_token(rule, "user1") is None
+
+    tokens = [await repo.acquire_token(rule, "user1") for _ in range(3)]
+    assert all(x is not None for x in tokens)
+    assert await repo.acquire_token(rule, "user1") is None
+    assert (await repo.get_first_expire_token(rule, "user1")).id == tokens[0].id
+
+    await repo.retire_token(tokens[0])
+    assert (await repo.get_first_expire_token(rule, "user1")).id == tokens[1].id
+    assert await repo.acquire_token(rule, "user1") is not None
+    assert await repo.acquire_token(rule, "user1") is None
+
+
+@pytest.mark.asyncio
+async def test_inmemory_delete_outdated_tokens(
+    app: App, monkeypatch: pytest.MonkeyPatch
+):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.repository.rate_limit_token import inmemory
+
+    monkeypatch.setattr(
+        inmemory,
+        "conf",
+        lambda: Config(access_control_rate_limit_token_cleanup_budget=2),
+    )
+
+    repo = inmemory.InmemoryTokenRepository()
+    expired_rule = RateLimitRule(
+        "rule1", get_nonebot_service(), "all", timedelta(0), 1, False
+    )
+    rule = RateLimitRule(
+        "rule2", get_nonebot_service(), "all", timedelta(hours=1), 1, False
+    )
+
+    for i in range(5):
+        await repo.acquire_token(expired_rule, f"user{i}")
+    await repo.acquire_token(rule, "user0")
+    assert len(repo.data) == 6
+    assert len(repo.expiry) == 6
+
+    # 超出单轮预算的key分多轮处理
+    await repo.delete_outdated_tokens()
+    assert list(repo.data.keys()) == [inmemory.StorageKey("rule2", "user0")]
+    assert len(repo.expiry) == 1
+
+    await repo.clear_token()
+    assert len(repo.data) == 0
+    assert len(repo.expiry) == 0
+
+
+@pytest.mark.asyncio
+async def test_inmemory_acquire_tokens(app: App):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+    from nonebot_plugin_access_control.repository.rate_limit_token.inmemory import (
+        InmemoryTokenRepository,
+    )
+
+    repo = InmemoryTokenRepository()
+    rule1 = RateLimitRule(
+        "rule1", get_nonebot_service(), "all", timedelta(hours=1), 2, False
+    )
+    rule2 = RateLimitRule(
+        "rule2", get_nonebot_service(), "all", timedelta(minutes=1), 1, False
+    )
+
+    result = await repo.acquire_tokens([rule1, rule2], "user1")
+    assert [x.rule_id for x in result.tokens] == ["rule1", "rule2"]
+    assert len(result.violating) == 0
+
+    # rule2超出限制时，rule1也不获取令牌
+    result = await repo.acquire_tokens([rule1, rule2], "user1")
+    assert len(result.tokens) == 0
+    assert result.violating == [rule2]
+    assert (
+        result.available_time
+        == (await repo.get_first_expire_token(rule2, "user1")).expire_time
+    )
+    assert await repo.acquire_token(rule1, "user1") is not None
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from nonebug import App
+
+from .utils.ob11_event import SELF_ID, fake_ob11_group_message_event
+
+
+@pytest.mark.asyncio
+async def test_prefetch_onebot_v11_group_role(
+    app: App, monkeypatch: pytest.MonkeyPatch
+):
+    from nonebot import get_driver
+    from nonebot.adapters.onebot.v11 import Bot, Adapter
+    from nonebot_plugin_access_control_api.subject import extract_subjects
+
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.subject.extractor import prefetch_subjects
+    from nonebot_plugin_access_control.subject.extractor.builtin import onebot_v11
+    from nonebot_plugin_access_control.subject.extractor.builtin.member_role import (
+        member_role_cache,
+    )
+
+    monkeypatch.setattr(
+        onebot_v11,
+        "conf",
+        lambda: Config(access_control_onebot_v11_role_fetch_enabled=True),
+    )
+    member_role_cache.clear()
+
+    async with app.test_api() as ctx:
+        adapter = Adapter(get_driver())
+        ctx.patch_adapter(monkeypatch, adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/a")
+        assert "qq:group_admin" not in extract_subjects(bot, event)
+
+        # 同一用户同时只调用一次API
+        ctx.should_call_api(
+            "get_group_member_info",
+            {"group_id": 34567, "user_id": 23456},
+            {"group_id": 34567, "user_id": 23456, "role": "admin"},
+        )
+        await asyncio.gather(*(prefetch_subjects(bot, event) for _ in range(5)))
+        assert member_role_cache.stats.fetches == 1
+
+        subjects = extract_subjects(bot, event)
+        assert "qq:g34567.group_admin" in subjects
+        assert "qq:group_admin" in subjects
+        assert "qq:group_owner" not in subjects
+
+        # 缓存命中时不调用API
+        await prefetch_subjects(bot, fake_ob11_group_message_event("/a"))
+        assert member_role_cache.stats == (1, 5, 1)
+
+    member_role_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_member_role_cache_concurrency(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot.adapters.onebot.v11 import Bot
+
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.subject.extractor.builtin import member_role
+
+    monkeypatch.setattr(
+        member_role,
+        "conf",
+        lambda: Config(access_control_role_fetch_concurrency=2),
+    )
+    cache = member_role.MemberRoleCache()
+
+    running = 0
+    max_running = 0
+
+    async def fetcher():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return "member"
+
+    async def failing_fetcher():
+        raise RuntimeError("boom")
+
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+
+        roles = await asyncio.gather(
+            *(cache.fetch(bot, 1, user_id, fetcher) for user_id in range(10))
+        )
+        assert roles == ["member"] * 10
+        assert max_running == 2
+        assert cache.stats == (0, 10, 10)
+
+        # 获取失败后，在access_control_role_fetch_failure_ttl内不再重新获取
+        assert await cache.fetch(bot, 2, 1, failing_fetcher) is None
+        assert cache.get(bot, 2, 1) is None
+        assert await cache.fetch(bot, 2, 1, fetcher) is None
+        assert cache.stats == (1, 11, 11)
+
+        now = member_role.monotonic()
+        monkeypatch.setattr(member_role, "monotonic", lambda: now + 31)
+        assert await cache.fetch(bot, 2, 1, fetcher) == "member"
+        assert cache.get(bot, 2, 1) == "member"
+        assert cache.stats == (1, 12, 12)
+
+        # 平台未返回角色时同样如此
+        async def none_fetcher():
+            return None
+
+        assert await cache.fetch(bot, 2, 2, none_fetcher) is None
+        assert await cache.fetch(bot, 2, 2, fetcher) is None
+        assert cache.stats == (2, 13, 13)
+
+        cache.clear()
+        assert cache.stats == (0, 0, 0)
@@ -0,0 +1,218 @@
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+from .utils.ob11_event import SELF_ID, fake_ob11_group_message_event
+
+
+@pytest.mark.asyncio
+async def test_patcher_extract_subjects_once(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot.adapters.onebot.v11 import Bot
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.subject import extractor
+    from nonebot_plugin_ac_demo.matcher_demo import a_matcher, b_matcher
+
+    extract_subjects = extractor.extract_subjects
+    calls = 0
+
+    def counting_extract_subjects(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return extract_subjects(*args, **kwargs)
+
+    monkeypatch.setattr(extractor, "extract_subjects", counting_extract_subjects)
+
+    await get_nonebot_service().add_rate_limit_rule("all", timedelta(minutes=1), 2)
+
+    # patch_matcher（run_preprocessor）
+    async with app.test_matcher(a_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/a")
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "a")
+    assert calls == 1
+
+    # patch_handler
+    async with app.test_matcher(b_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/b")
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "b")
+    assert calls == 2
+
+    # 被限流
+    async with app.test_matcher(b_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/b")
+        ctx.receive_event(bot, event)
+    assert calls == 3
+
+
+@pytest.mark.asyncio
+async def test_extract_subjects_cached(app: App, monkeypatch: pytest.MonkeyPatch):
+    import gc
+
+    from nonebot import get_driver
+    from nonebot.adapters.onebot.v11 import Bot, Adapter
+
+    from nonebot_plugin_access_control.subject import extractor
+
+    extract_subjects = extractor.extract_subjects
+    calls = 0
+
+    def counting_extract_subjects(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return extract_subjects(*args, **kwargs)
+
+    monkeypatch.setattr(extractor, "extract_subjects", counting_extract_subjects)
+
+    bot = Bot(Adapter(get_driver()), str(SELF_ID))
+    event = fake_ob11_group_message_event("/a")
+
+    sbj = extractor.extract_subjects_cached(bot, event)
+    assert "qq:23456" in sbj
+    assert extractor.extract_subjects_cached(bot, event) is sbj
+    assert calls == 1
+
+    # 不同的事件分别提取
+    event2 = fake_ob11_group_message_event("/a")
+    assert extractor.extract_subjects_cached(bot, event2) == sbj
+    assert calls == 2
+
+    # 事件被回收后移除缓存
+    key = id(event)
+    del event
+    gc.collect()
+    assert key not in extractor._event_subjects
+
+
+@pytest.mark.asyncio
+async def test_extract_subjects_cached_without_weakref(
+    app: App, monkeypatch: pytest.MonkeyPatch
+):
+    from nonebot import get_driver
+    from pydantic.v1 import BaseModel
+    from nonebot.adapters.onebot.v11 import Bot, Adapter
+
+    from nonebot_plugin_access_control.subject import extractor
+
+    calls = 0
+
+    def counting_extract_subjects(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return ["qq:23456"]
+
+    monkeypatch.setattr(extractor, "extract_subjects", counting_extract_subjects)
+
+    # pydantic v1的模型不支持弱引用
+    class V1Event(BaseModel):
+        user_id: int = 23456
+
+    bot = Bot(Adapter(get_driver()), str(SELF_ID))
+    event = V1Event()
+
+    sbj = extractor.extract_subjects_cached(bot, event)
+    assert sbj == ("qq:23456",)
+    assert extractor.extract_subjects_cached(bot, event) is sbj
+    assert calls == 1
+
+    event2 = V1Event()
+    assert extractor.extract_subjects_cached(bot, event2) == sbj
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_patcher_lazy_subjects(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot.adapters.onebot.v11 import Bot
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.subject import extractor
+    from nonebot_plugin_access_control.service._impl import patcher
+    from nonebot_plugin_ac_demo.matcher_demo import b_matcher, b_service
+
+    monkeypatch.setattr(
+        patcher,
+        "conf",
+        lambda: Config(
+            access_control_permission_cache_enabled=True,
+            access_control_rate_limit_rule_cache_enabled=True,
+            access_control_reply_on_permission_denied_enabled=False,
+            access_control_reply_on_rate_limited_enabled=False,
+        ),
+    )
+
+    extract_subjects = extractor.extract_subjects
+    calls = 0
+
+    def counting_extract_subjects(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return extract_subjects(*args, **kwargs)
+
+    monkeypatch.setattr(extractor, "extract_subjects", counting_extract_subjects)
+
+    # 用户级别的配置已能得出结论，无需提取群组等主体
+    await b_service.set_permission("qq:23456", True)
+    await b_service.add_rate_limit_rule(
+        "qq:23456", timedelta(minutes=1), 5, overwrite=True
+    )
+    await get_nonebot_service().add_rate_limit_rule(
+        "qq:g34567", timedelta(minutes=1), 1
+    )
+
+    for _ in range(2):
+        async with app.test_matcher(b_matcher) as ctx:
+            bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+            event = fake_ob11_group_message_event("/b")
+            ctx.receive_event(bot, event)
+            ctx.should_call_send(event, "b")
+    assert calls == 0
+
+    # 用户级别没有配置时，提取完整的主体列表
+    await b_service.remove_permission("qq:23456")
+    await b_service.set_permission("qq:g34567", False)
+
+    async with app.test_matcher(b_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/b")
+        ctx.receive_event(bot, event)
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_patcher_use_service_impl(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot.adapters.onebot.v11 import Bot
+
+    from nonebot_plugin_ac_demo.matcher_demo import b_matcher, b_service
+    from nonebot_plugin_access_control.service._impl.rate_limit import (
+        ServiceRateLimitImpl,
+    )
+    from nonebot_plugin_access_control.service._impl.permission import (
+        ServicePermissionImpl,
+    )
+
+    assert ServicePermissionImpl.of(b_service) is b_service._permission_impl
+    assert ServiceRateLimitImpl.of(b_service) is b_service._rate_limit_impl
+
+    created = 0
+
+    def counting_init(self, service):
+        nonlocal created
+        created += 1
+        self.service = service
+
+    # 处理事件时使用服务自身持有的实现，不再创建新的实例
+    monkeypatch.setattr(ServicePermissionImpl, "__init__", counting_init)
+    monkeypatch.setattr(ServiceRateLimitImpl, "__init__", counting_init)
+
+    async with app.test_matcher(b_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/b")
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "b")
+    assert created == 0
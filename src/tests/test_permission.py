@@ -63,3 +63,33 @@ async def test_permission(app: App):
         bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
         event = fake_ob11_group_message_event("/c")
         ctx.receive_event(bot, event)
+
+
+@pytest.mark.asyncio
+async def test_permission_priority(app: App):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_ac_demo.matcher_demo import group1, b_service
+
+    nonebot_service = get_nonebot_service()
+
+    await b_service.set_permission("qq:g34567", False)
+    await group1.set_permission("qq:g34567", True)
+    await nonebot_service.set_permission("qq:23456", True)
+
+    # 主体优先级高于服务节点深度
+    p = await b_service.get_permission_by_subject("qq:23456", "qq:g34567", "all")
+    assert p.service == nonebot_service
+    assert p.subject == "qq:23456"
+    assert p.allow is True
+
+    # 同一主体下，深的服务节点优先
+    p = await b_service.get_permission_by_subject("qq:g34567", "all")
+    assert p.service == b_service
+    assert p.allow is False
+
+    p = await b_service.get_permission_by_subject("qq:g34567", trace=False)
+    assert p.service == b_service
+
+    p = await group1.get_permission_by_subject("all")
+    assert p is None
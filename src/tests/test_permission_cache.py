@@ -0,0 +1,53 @@
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_permission_cache(app: App):
+    from nonebot_plugin_orm import get_session
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_ac_demo.matcher_demo import b_service
+    from nonebot_plugin_access_control.repository.orm.permission import PermissionOrm
+    from nonebot_plugin_access_control.repository.permission.cached import (
+        CachedPermissionRepository,
+    )
+
+    repo = CachedPermissionRepository()
+
+    async with get_session() as sess:
+        sess.add(PermissionOrm(subject="all", service="nonebot", allow=False))
+        await sess.commit()
+
+    nonebot_service = get_nonebot_service()
+
+    # 首次查询时加载
+    res = [x async for x in repo.get_permissions(nonebot_service, "all")]
+    assert len(res) == 1
+    assert res[0].allow is False
+
+    # 写入后同步更新缓存
+    assert await repo.set_permission(b_service, "qq:23456", True)
+    res = [x async for x in repo.get_permissions(b_service, "qq:23456")]
+    assert len(res) == 1
+    assert res[0].allow is True
+
+    res = [x async for x in repo.get_permissions(None, None)]
+    assert len(res) == 2
+
+    assert await repo.remove_permission(b_service, "qq:23456")
+    res = [x async for x in repo.get_permissions(None, "qq:23456")]
+    assert len(res) == 0
+
+    # 其他途径修改数据库后，需要重新加载
+    async with get_session() as sess:
+        sess.add(PermissionOrm(subject="qq", service="nonebot", allow=True))
+        await sess.commit()
+
+    res = [x async for x in repo.get_permissions(nonebot_service, "qq")]
+    assert len(res) == 0
+
+    await repo.reload()
+    res = [x async for x in repo.get_permissions(nonebot_service, "qq")]
+    assert len(res) == 1
+    assert res[0].allow is True
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_blocked_cache(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_ac_demo.matcher_demo import group1
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.service._impl import rate_limit
+
+    monkeypatch.setattr(
+        rate_limit,
+        "conf",
+        lambda: Config(access_control_rate_limit_blocked_cache_enabled=True),
+    )
+
+    service = get_nonebot_service()
+    rule = await service.add_rate_limit_rule("all", timedelta(minutes=1), 1)
+
+    result = await group1.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert result.success
+    token = result.token
+
+    result = await group1.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert not result.success
+
+    # 被限流期间不再获取令牌
+    async def fail(*args, **kwargs):
+        raise AssertionError("should not acquire tokens")
+
+    with monkeypatch.context() as m:
+        m.setattr(rate_limit.ServiceRateLimitImpl, "_acquire_tokens", fail)
+        cached = await group1.acquire_token_for_rate_limit_by_subjects_receiving_result(
+            "qq:23456", "all"
+        )
+        assert cached is result
+
+    # 其他用户不受影响
+    result = await group1.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:12345", "all"
+    )
+    assert result.success
+
+    # 归还令牌后缓存失效
+    await token.retire()
+    result = await group1.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert result.success
+
+    result = await group1.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert not result.success
+
+    # 删除规则后缓存失效
+    await service.remove_rate_limit_rule(rule.id)
+    result = await group1.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert result.success
+
+    # 清空计数后缓存失效
+    await service.add_rate_limit_rule("all", timedelta(minutes=1), 1)
+    result = await group1.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert result.success
+    result = await group1.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert not result.success
+
+    await service.clear_rate_limit_tokens()
+    result = await group1.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "qq:23456", "all"
+    )
+    assert result.success
@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_rule_cache(app: App):
+    from nonebot_plugin_orm import get_session
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_ac_demo.matcher_demo import group1, b_service
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitRuleOrm,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit.cached import (
+        CachedRateLimitRepository,
+    )
+
+    repo = CachedRateLimitRepository()
+
+    async with get_session() as sess:
+        sess.add(
+            RateLimitRuleOrm(
+                subject="all",
+                service="nonebot",
+                time_span=60,
+                limit=5,
+                overwrite=False,
+            )
+        )
+        await sess.commit()
+
+    nodes = list(b_service.trace())
+    subjects = ["qq:g34567:23456", "qq:23456", "qq:g34567", "all"]
+
+    # 首次查询时加载
+    rules = [x async for x in repo.get_effective_rules(nodes, subjects)]
+    assert len(rules) == 1
+    assert rules[0].service == get_nonebot_service()
+    assert rules[0].time_span == timedelta(seconds=60)
+    preloaded_rule = rules[0]
+
+    # 写入后同步更新缓存，覆写规则截断优先级更低的规则
+    rule_1 = await repo.add_rate_limit_rule(
+        group1, "qq:g34567", timedelta(seconds=30), 3
+    )
+    rule_2 = await repo.add_rate_limit_rule(
+        b_service, "qq:23456", timedelta(seconds=10), 1, overwrite=True
+    )
+    rules = [x async for x in repo.get_effective_rules(nodes, subjects)]
+    assert [x.id for x in rules] == [rule_2.id]
+
+    rules = [x async for x in repo.get_effective_rules(nodes, subjects[2:])]
+    assert [x.id for x in rules] == [rule_1.id, preloaded_rule.id]
+    assert rules[0].service == group1
+    assert rules[1].service == get_nonebot_service()
+    assert rules[1].subject == "all"
+
+    rules = [x async for x in repo.get_rules_by_subject(None, None)]
+    assert len(rules) == 3
+
+    await repo.remove_rate_limit_rule(rule_2.id)
+    rules = [x async for x in repo.get_effective_rules(nodes, subjects)]
+    assert len(rules) == 2
+    assert rules[0].id == rule_1.id
+
+    # 其他途径修改数据库后，需要重新加载
+    async with get_session() as sess:
+        await sess.delete(await sess.get(RateLimitRuleOrm, rule_1.id))
+        await sess.commit()
+
+    rules = [x async for x in repo.get_effective_rules(nodes, subjects)]
+    assert len(rules) == 2
+
+    await repo.reload()
+    rules = [x async for x in repo.get_effective_rules(nodes, subjects)]
+    assert len(rules) == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_rule_cache_concurrent_reload(app: App):
+    import asyncio
+
+    from nonebot_plugin_ac_demo.matcher_demo import group1, b_service
+    from nonebot_plugin_access_control.repository.rate_limit.cached import (
+        CachedRateLimitRepository,
+    )
+
+    repo = CachedRateLimitRepository()
+    rule = await repo.add_rate_limit_rule(group1, "qq:g34567", timedelta(seconds=30), 3)
+
+    nodes = list(b_service.trace())
+    subjects = ["qq:23456", "qq:g34567", "all"]
+
+    async def query():
+        return [x.id async for x in repo.get_effective_rules(nodes, subjects)]
+
+    assert await query() == [rule.id]
+
+    # 重新加载期间的查询不会读到（并缓存）加载了一半的索引
+    task = asyncio.create_task(repo.reload())
+    while not task.done():
+        assert await query() == [rule.id]
+        await asyncio.sleep(0)
+    await task
+
+    assert await query() == [rule.id]
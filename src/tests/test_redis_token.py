@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+pytest.importorskip("fakeredis")
+
+
+@pytest.mark.asyncio
+async def test_redis_token(app: App, monkeypatch: pytest.MonkeyPatch):
+    from fakeredis import FakeAsyncRedis
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+    from nonebot_plugin_access_control.repository.rate_limit_token import redis
+    from nonebot_plugin_access_control.repository.rate_limit_token.utils import (
+        datetime_to_timestamp,
+    )
+
+    now = 1000.0
+    monkeypatch.setattr(redis, "time", lambda: now)
+
+    client = FakeAsyncRedis()
+    repo = redis.RedisTokenRepository(client)
+    rule1 = RateLimitRule(
+        "rule1", get_nonebot_service(), "all", timedelta(seconds=10), 2, False
+    )
+    rule2 = RateLimitRule(
+        "rule2", get_nonebot_service(), "all", timedelta(seconds=60), 1, False
+    )
+
+    assert await repo.get_first_expire_token(rule1, "user1") is None
+
+    token1 = await repo.acquire_token(rule1, "user1")
+    assert token1 is not None
+    assert datetime_to_timestamp(token1.expire_time) == pytest.approx(1010.0)
+
+    now = 1002.0
+    result = await repo.acquire_tokens([rule1, rule2], "user1")
+    assert [x.rule_id for x in result.tokens] == ["rule1", "rule2"]
+
+    # rule1与rule2都超出限制，rule1最早在1010可用
+    now = 1005.0
+    result = await repo.acquire_tokens([rule1, rule2], "user1")
+    assert len(result.tokens) == 0
+    assert result.violating == [rule1, rule2]
+    assert datetime_to_timestamp(result.available_time) == pytest.approx(1010.0)
+
+    first_expire = await repo.get_first_expire_token(rule1, "user1")
+    assert first_expire.id == token1.id
+
+    # 其他用户不受影响
+    assert await repo.acquire_token(rule1, "user2") is not None
+
+    # 归还令牌后可以再次获取
+    await repo.retire_token(token1)
+    assert await repo.acquire_token(rule1, "user1") is not None
+    assert await repo.acquire_token(rule1, "user1") is None
+
+    # 过期的令牌不再计数
+    now = 1013.0
+    assert await repo.acquire_token(rule1, "user1") is not None
+    assert await repo.acquire_token(rule2, "user1") is None
+
+    # 键设置了过期时间，无需定时清理
+    assert await client.pttl(repo._key("rule2", "user1")) > 0
+
+    await repo.clear_token()
+    assert await client.keys(f"{repo.prefix}:token:*") == []
+    assert await repo.acquire_token(rule2, "user1") is not None
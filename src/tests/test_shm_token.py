@@ -0,0 +1,142 @@
+import os
+import sys
+import asyncio
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires fcntl")
+@pytest.mark.asyncio
+async def test_shm_token(app: App, monkeypatch: pytest.MonkeyPatch, tmp_path):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.repository.rate_limit_token import shm
+    from nonebot_plugin_access_control.repository.rate_limit_token.utils import (
+        datetime_to_timestamp,
+    )
+
+    now = 1000.0
+    monkeypatch.setattr(shm, "time", lambda: now)
+
+    path = tmp_path / "rate_limit_token.shm"
+    # 模拟两个进程打开同一个文件
+    repo1 = shm.SharedMemoryTokenRepository(path, 4)
+    repo2 = shm.SharedMemoryTokenRepository(path, 1024)
+    assert repo2.slots == 4
+
+    rule1 = RateLimitRule(
+        "rule1", get_nonebot_service(), "all", timedelta(seconds=10), 2, False
+    )
+    rule2 = RateLimitRule(
+        "rule2", get_nonebot_service(), "all", timedelta(seconds=10), 1, False
+    )
+
+    assert await repo1.get_first_expire_token(rule1, "user1") is None
+
+    # 两个进程共享计数
+    assert await repo1.acquire_token(rule1, "user1") is not None
+    token = await repo2.acquire_token(rule1, "user1")
+    assert token is not None
+    assert await repo1.acquire_token(rule1, "user1") is None
+    assert await repo2.acquire_token(rule1, "user2") is not None
+
+    first_expire = await repo2.get_first_expire_token(rule1, "user1")
+    assert datetime_to_timestamp(first_expire.expire_time) == pytest.approx(1005.0)
+
+    # 任意一条规则超出限制时，不获取任何令牌
+    result = await repo1.acquire_tokens([rule2, rule1], "user1")
+    assert result.violating == [rule1]
+    assert await repo1.acquire_token(rule2, "user1") is not None
+
+    await repo1.retire_token(token)
+    assert await repo2.acquire_token(rule1, "user1") is not None
+
+    # 槽位已满时，复用已过期的槽位
+    now = 1020.0
+    for i in range(4):
+        assert await repo1.acquire_token(rule2, f"user{i + 10}") is not None
+    assert await repo1.acquire_token(rule2, "user10") is None
+
+    await repo2.clear_token()
+    assert await repo1.acquire_token(rule2, "user10") is not None
+
+    # 槽位已满且没有过期的槽位时，拒绝获取令牌
+    for i in range(1, 4):
+        assert await repo1.acquire_token(rule2, f"user{i + 10}") is not None
+    result = await repo1.acquire_tokens([rule2], "user20")
+    assert result.violating == [rule2]
+    assert datetime_to_timestamp(result.available_time) == pytest.approx(1030.0)
+
+    monkeypatch.setattr(
+        shm,
+        "conf",
+        lambda: Config(access_control_rate_limit_token_shm_fail_open=True),
+    )
+    assert await repo1.acquire_token(rule2, "user20") is not None
+
+    # 其他进程持有锁时，等待其释放而不阻塞事件循环
+    fd = os.open(path, os.O_RDWR)
+    try:
+        shm.fcntl.flock(fd, shm.fcntl.LOCK_EX)
+        task = asyncio.create_task(repo1.acquire_token(rule1, "user30"))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+
+        shm.fcntl.flock(fd, shm.fcntl.LOCK_UN)
+        assert await asyncio.wait_for(task, 1) is not None
+    finally:
+        os.close(fd)
+
+    repo1.close()
+    repo2.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires fcntl")
+@pytest.mark.asyncio
+async def test_shm_token_batch_slot_collision(
+    app: App, monkeypatch: pytest.MonkeyPatch, tmp_path
+):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.repository.rate_limit_token import shm
+
+    now = 1000.0
+    monkeypatch.setattr(shm, "time", lambda: now)
+
+    rule1 = RateLimitRule(
+        "rule1", get_nonebot_service(), "all", timedelta(seconds=10), 1, False
+    )
+    rule2 = RateLimitRule(
+        "rule2", get_nonebot_service(), "all", timedelta(seconds=10), 1, False
+    )
+
+    # 同一批次中的两个新key只能分配到同一个槽位时，不能都获取令牌
+    repo = shm.SharedMemoryTokenRepository(tmp_path / "rate_limit_token.shm", 1)
+    result = await repo.acquire_tokens([rule1, rule2], "user1")
+    assert result.violating == [rule2]
+    assert await repo.acquire_token(rule1, "user1") is not None
+    assert await repo.acquire_token(rule1, "user1") is None
+    repo.close()
+
+    # 两个槽位时，两个key分别分配到不同的槽位，均被计数
+    repo = shm.SharedMemoryTokenRepository(tmp_path / "rate_limit_token2.shm", 2)
+    result = await repo.acquire_tokens([rule1, rule2], "user1")
+    assert len(result.tokens) == 2
+    result = await repo.acquire_tokens([rule1, rule2], "user1")
+    assert result.violating == [rule1, rule2]
+
+    # 启用fail_open时，分配不到槽位的key不受限流限制
+    monkeypatch.setattr(
+        shm,
+        "conf",
+        lambda: Config(access_control_rate_limit_token_shm_fail_open=True),
+    )
+    result = await repo.acquire_tokens([rule1, rule2], "user2")
+    assert len(result.tokens) == 2
+    repo.close()
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+from .utils.ob11_event import SELF_ID, fake_ob11_group_message_event
+
+
+@pytest.mark.asyncio
+async def test_skip_unconfigured_service(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot.adapters.onebot.v11 import Bot
+    from nonebot_plugin_access_control_api.service.interface import service_base
+
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.service._impl import patcher
+    from nonebot_plugin_access_control.service._impl.configured import (
+        ConfiguredServiceIndex,
+    )
+    from nonebot_plugin_ac_demo.matcher_demo import (
+        group1,
+        a_matcher,
+        b_matcher,
+        c_matcher,
+        c_service,
+    )
+
+    monkeypatch.setattr(
+        patcher,
+        "conf",
+        lambda: Config(
+            access_control_skip_unconfigured_service_enabled=True,
+            access_control_reply_on_permission_denied_enabled=False,
+            access_control_reply_on_rate_limited_enabled=False,
+        ),
+    )
+    ConfiguredServiceIndex.invalidate()
+
+    await group1.set_permission("qq:23456", False)
+    await c_service.add_rate_limit_rule("all", timedelta(minutes=1), 1)
+
+    # 服务链上有配置的服务仍然正常检查
+    async with app.test_matcher(a_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/a")
+        ctx.receive_event(bot, event)
+
+    async with app.test_matcher(b_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/b")
+        ctx.receive_event(bot, event)
+
+    async with app.test_matcher(c_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/c")
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "c")
+
+    async with app.test_matcher(c_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/c")
+        ctx.receive_event(bot, event)
+
+    # 删除配置后，不再创建会话与提取主体
+    await group1.remove_permission("qq:23456")
+    assert not await ConfiguredServiceIndex.is_configured(group1)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("should not be called")
+
+    monkeypatch.setattr(patcher, "use_ac_session", fail)
+    monkeypatch.setattr(service_base, "extract_subjects", fail)
+
+    async with app.test_matcher(a_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/a")
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "a")
+
+    async with app.test_matcher(b_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/b")
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "b")
@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_skip_unconfigured_subject(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service, b_service
+    from nonebot_plugin_access_control.service._impl import permission, rate_limit
+    from nonebot_plugin_access_control.service._impl.configured import (
+        ConfiguredServiceIndex,
+    )
+
+    config = Config(access_control_skip_unconfigured_subject_enabled=True)
+    monkeypatch.setattr(permission, "conf", lambda: config)
+    monkeypatch.setattr(rate_limit, "conf", lambda: config)
+    ConfiguredServiceIndex.invalidate()
+
+    await group1.set_permission("qq:g34567", False)
+    await a_service.add_rate_limit_rule("qq:23456", timedelta(minutes=1), 1)
+
+    subjects = ["qq:g34567:23456", "qq:23456", "qq:g34567", "all"]
+    assert await ConfiguredServiceIndex.filter_subjects(
+        list(a_service.trace()), subjects
+    ) == ["qq:23456", "qq:g34567"]
+    assert await ConfiguredServiceIndex.filter_subjects(
+        list(b_service.trace()), subjects
+    ) == ["qq:g34567"]
+
+    assert not await a_service.check_permission(*subjects)
+
+    result = await a_service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        *subjects
+    )
+    assert result.success
+    result = await a_service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        *subjects
+    )
+    assert not result.success
+
+    # 没有配置的主体不参与查询
+    queried = []
+    get_permissions_by_subjects = (
+        permission.ServicePermissionImpl.repo.__class__.get_permissions_by_subjects
+    )
+
+    async def recording_get_permissions_by_subjects(self, services, subjects):
+        queried.append(list(subjects))
+        async for p in get_permissions_by_subjects(self, services, subjects):
+            yield p
+
+    monkeypatch.setattr(
+        permission.ServicePermissionImpl.repo.__class__,
+        "get_permissions_by_subjects",
+        recording_get_permissions_by_subjects,
+    )
+    assert await b_service.check_permission("qq:12345", "qq:g45678", "all")
+    assert queried == [[]]
+
+    # 删除配置后索引失效
+    await group1.remove_permission("qq:g34567")
+    assert await ConfiguredServiceIndex.filter_subjects(
+        list(a_service.trace()), subjects
+    ) == ["qq:23456"]
+    assert await a_service.check_permission(*subjects)
+
+
+@pytest.mark.asyncio
+async def test_skip_unconfigured_subject_unregistered_service(app: App):
+    from types import SimpleNamespace
+
+    from nonebot_plugin_orm import get_session
+
+    from nonebot_plugin_access_control.repository.orm.permission import PermissionOrm
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitRuleOrm,
+    )
+    from nonebot_plugin_access_control.service._impl.configured import (
+        ConfiguredServiceIndex,
+    )
+
+    # 加载索引时服务尚未创建（如之后才加载的插件），其配置同样被记录
+    async with get_session() as sess:
+        sess.add(PermissionOrm(subject="qq:g34567", service="later", allow=False))
+        sess.add(
+            RateLimitRuleOrm(
+                subject="qq:23456",
+                service="later.sub",
+                time_span=60,
+                limit=1,
+                overwrite=False,
+            )
+        )
+        await sess.commit()
+    ConfiguredServiceIndex.invalidate()
+
+    nodes = [
+        SimpleNamespace(qualified_name="later.sub"),
+        SimpleNamespace(qualified_name="later"),
+    ]
+    subjects = ["qq:g34567:23456", "qq:23456", "qq:g34567", "all"]
+    assert await ConfiguredServiceIndex.filter_subjects(nodes, subjects) == [
+        "qq:23456",
+        "qq:g34567",
+    ]
+    ConfiguredServiceIndex.invalidate()
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_sliding_window(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+    from nonebot_plugin_access_control.repository.rate_limit_token import (
+        sliding_window,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit_token.utils import (
+        datetime_to_timestamp,
+    )
+
+    now = 1000.0
+    monkeypatch.setattr(sliding_window, "time", lambda: now)
+
+    repo = sliding_window.SlidingWindowTokenRepository()
+    rule = RateLimitRule(
+        "rule1", get_nonebot_service(), "all", timedelta(seconds=10), 2, False
+    )
+
+    assert await repo.get_first_expire_token(rule, "user1") is None
+
+    # 窗口[1000, 1010)
+    assert await repo.acquire_token(rule, "user1") is not None
+    assert await repo.acquire_token(rule, "user1") is not None
+    assert await repo.acquire_token(rule, "user1") is None
+    # 其他用户不受影响
+    assert await repo.acquire_token(rule, "user2") is not None
+
+    # 当前窗口计数为2，需要等到下一个窗口过去一半：2 * (1 - 0.5) + 1 <= 2
+    first_expire = await repo.get_first_expire_token(rule, "user1")
+    assert datetime_to_timestamp(first_expire.expire_time) == pytest.approx(1015.0)
+
+    now = 1012.0
+    assert await repo.acquire_token(rule, "user1") is None
+
+    now = 1015.0
+    token = await repo.acquire_token(rule, "user1")
+    assert token is not None
+    assert await repo.acquire_token(rule, "user1") is None
+
+    # 归还令牌后可以再次获取
+    await repo.retire_token(token)
+    assert await repo.acquire_token(rule, "user1") is not None
+
+    # 两个窗口之后计数清空
+    now = 1025.0
+    await repo.delete_outdated_tokens()
+    assert len(repo.data) == 1
+
+    now = 1030.0
+    await repo.delete_outdated_tokens()
+    assert len(repo.data) == 0
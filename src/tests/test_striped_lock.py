@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_striped_lock(app: App):
+    from nonebot_plugin_access_control.repository.rate_limit_token.utils import (
+        StorageKey,
+        StripedLock,
+    )
+
+    lock = StripedLock(stripes=16)
+    key1 = StorageKey("rule1", "user1")
+    key2 = next(
+        StorageKey("rule1", f"user{i}")
+        for i in range(2, 100)
+        if hash(StorageKey("rule1", f"user{i}")) % 16 != hash(key1) % 16
+    )
+
+    events = []
+
+    async def worker(name: str, keys: list[StorageKey]):
+        async with lock.acquire(keys):
+            events.append(f"{name} enter")
+            await asyncio.sleep(0.01)
+            events.append(f"{name} exit")
+
+    # 同一key串行
+    await asyncio.gather(worker("a", [key1]), worker("b", [key1]))
+    assert events == ["a enter", "a exit", "b enter", "b exit"]
+
+    # 不同key并行
+    events.clear()
+    await asyncio.gather(worker("a", [key1]), worker("b", [key2]))
+    assert events == ["a enter", "b enter", "a exit", "b exit"]
+
+    # 以不同顺序锁定多个key时不会死锁
+    events.clear()
+    await asyncio.wait_for(
+        asyncio.gather(
+            worker("a", [key1, key2]), worker("b", [key2, key1]), worker("c", [key1])
+        ),
+        1,
+    )
+    assert len(events) == 6
@@ -0,0 +1,101 @@
+import pytest
+from nonebug import App
+
+from tests.utils.ob11_event import SELF_ID, fake_ob11_group_message_event
+
+
+@pytest.mark.asyncio
+async def test_session_subject_cache(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot import get_driver
+    from nonebot.adapters.onebot.v11 import Bot, Adapter
+    from nonebot.adapters.onebot.v11.event import Sender
+    from nonebot_plugin_access_control_api.subject import extract_subjects
+
+    from nonebot_plugin_access_control.subject.extractor.builtin import session
+
+    cache = session.session_subject_cache
+    cache.clear()
+    now = 1000.0
+    monkeypatch.setattr(session, "monotonic", lambda: now)
+
+    bot = Bot(Adapter(get_driver()), str(SELF_ID))
+    event = fake_ob11_group_message_event("/a")
+
+    hits, misses = cache.stats
+    sbj = extract_subjects(bot, event)
+    assert cache.stats == (hits, misses + 1)
+    assert extract_subjects(bot, fake_ob11_group_message_event("/a")) == sbj
+    assert cache.stats == (hits + 1, misses + 1)
+
+    # 角色主体不进入缓存
+    event = fake_ob11_group_message_event("/a")
+    event.sender = Sender(user_id=23456, nickname="23456", role="admin")
+    assert "qq:group_admin" in extract_subjects(bot, event)
+    assert "qq:group_admin" not in extract_subjects(
+        bot, fake_ob11_group_message_event("/a")
+    )
+    assert cache.stats == (hits + 3, misses + 1)
+
+    # 超级用户配置变化时清空缓存
+    superusers = get_driver().config.superusers
+    superusers.add("onebot:23456")
+    try:
+        assert "superuser" in extract_subjects(bot, fake_ob11_group_message_event("/a"))
+    finally:
+        superusers.discard("onebot:23456")
+    assert cache.stats == (hits + 3, misses + 2)
+
+    # 过期后重新提取
+    now += 3600
+    extract_subjects(bot, fake_ob11_group_message_event("/a"))
+    assert cache.stats == (hits + 3, misses + 3)
+
+
+@pytest.mark.asyncio
+async def test_extract_from_session(app: App):
+    from nonebot_plugin_session import Session, SessionLevel
+
+    from nonebot_plugin_access_control.subject.extractor.builtin.session import (
+        extract_from_session,
+    )
+
+    session = Session(
+        bot_id="1",
+        bot_type="QQ Guild",
+        platform="qqguild",
+        level=SessionLevel.LEVEL3,
+        id1="1",
+        id2="2",
+        id3="3",
+    )
+    assert [(x.content, x.tag) for x in extract_from_session(session)] == [
+        ("qqguild:g3:c2:1", "platform:guild:channel:user"),
+        ("qqguild:c2:1", "platform:channel:user"),
+        ("qqguild:g3:1", "platform:guild:user"),
+        ("qqguild:1", "platform:user"),
+        ("qqguild:g3:c2", "platform:guild:channel"),
+        ("qqguild:c2", "platform:channel"),
+        ("qqguild:g3", "platform:guild"),
+        ("qqguild:channel", "platform:chat_type"),
+        ("channel", "chat_type"),
+        ("qqguild", "platform"),
+        ("all", "all"),
+    ]
+
+    session = Session(
+        bot_id="1",
+        bot_type="OneBot V11",
+        platform="qq",
+        level=SessionLevel.LEVEL1,
+        id1="1",
+    )
+    assert [x.content for x in extract_from_session(session)] == [
+        "qq:1",
+        "onebot:1",
+        "qq:private",
+        "onebot:private",
+        "private",
+        "qq",
+        "onebot",
+        "all",
+    ]
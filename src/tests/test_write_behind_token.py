@@ -0,0 +1,189 @@
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_write_behind_token(app: App, monkeypatch: pytest.MonkeyPatch):
+    from sqlalchemy import select
+    from nonebot_plugin_orm import get_session
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.repository.rate_limit_token import (
+        write_behind,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit import (
+        IRateLimitRepository,
+    )
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitTokenOrm,
+    )
+
+    async def stored_ids() -> set[int]:
+        async with get_session() as sess:
+            return set(await sess.scalars(select(RateLimitTokenOrm.id)))
+
+    monkeypatch.setattr(
+        write_behind,
+        "conf",
+        lambda: Config(access_control_rate_limit_token_flush_max_pending=1000),
+    )
+
+    rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        get_nonebot_service(), "all", timedelta(minutes=1), 3
+    )
+
+    repo = write_behind.WriteBehindTokenRepository()
+    await repo.load()
+
+    token1 = await repo.acquire_token(rule, "user1")
+    token2 = await repo.acquire_token(rule, "user1")
+    assert await stored_ids() == set()
+
+    # 尚未写入的令牌归还后不会写入
+    await repo.retire_token(token2)
+    await repo.flush()
+    assert await stored_ids() == {token1.id}
+
+    token3 = await repo.acquire_token(rule, "user1")
+    token4 = await repo.acquire_token(rule, "user1")
+    assert await repo.acquire_token(rule, "user1") is None
+    await repo.retire_token(token1)
+    await repo.flush()
+    assert await stored_ids() == {token3.id, token4.id}
+
+    # 重启后从表中恢复计数，令牌ID继续分配
+    repo = write_behind.WriteBehindTokenRepository()
+    await repo.load()
+    token5 = await repo.acquire_token(rule, "user1")
+    assert token5.id > token4.id
+    assert await repo.acquire_token(rule, "user1") is None
+    assert (await repo.get_first_expire_token(rule, "user1")).id == token3.id
+
+    await repo.clear_token()
+    assert await stored_ids() == set()
+    assert await repo.acquire_token(rule, "user1") is not None
+
+
+@pytest.mark.asyncio
+async def test_write_behind_flush_on_max_pending(
+    app: App, monkeypatch: pytest.MonkeyPatch
+):
+    import asyncio
+
+    from sqlalchemy import func, select
+    from nonebot_plugin_orm import get_session
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.repository.rate_limit_token import (
+        write_behind,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit import (
+        IRateLimitRepository,
+    )
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitTokenOrm,
+    )
+
+    monkeypatch.setattr(
+        write_behind,
+        "conf",
+        lambda: Config(access_control_rate_limit_token_flush_max_pending=2),
+    )
+
+    rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        get_nonebot_service(), "all", timedelta(minutes=1), 10
+    )
+
+    repo = write_behind.WriteBehindTokenRepository()
+    await repo.load()
+
+    await repo.acquire_token(rule, "user1")
+    assert repo._flush_task is None
+    await repo.acquire_token(rule, "user1")
+    await asyncio.wait_for(repo._flush_task, 5)
+
+    async with get_session() as sess:
+        assert (
+            await sess.execute(select(func.count(RateLimitTokenOrm.id)))
+        ).scalar_one() == 2
+
+
+@pytest.mark.asyncio
+async def test_write_behind_drop_unwritable_token(
+    app: App, monkeypatch: pytest.MonkeyPatch
+):
+    from datetime import datetime
+
+    from sqlalchemy import select
+    from nonebot_plugin_orm import get_session
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.config import Config
+    from nonebot_plugin_access_control.repository.rate_limit_token import (
+        write_behind,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit import (
+        IRateLimitRepository,
+    )
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitTokenOrm,
+    )
+
+    monkeypatch.setattr(
+        write_behind,
+        "conf",
+        lambda: Config(access_control_rate_limit_token_flush_max_pending=1000),
+    )
+
+    rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        get_nonebot_service(), "all", timedelta(minutes=1), 3
+    )
+
+    repo = write_behind.WriteBehindTokenRepository()
+    await repo.load()
+
+    token1 = await repo.acquire_token(rule, "user1")
+    await repo.flush()
+
+    # 其他途径占用了下一个令牌ID
+    async with get_session() as sess:
+        now = datetime.utcnow()
+        sess.add(
+            RateLimitTokenOrm(
+                rule_id=rule.id,
+                user="user2",
+                acquire_time=now,
+                expire_time=now + timedelta(minutes=1),
+            )
+        )
+        await sess.commit()
+
+    token2 = await repo.acquire_token(rule, "user1")
+    token3 = await repo.acquire_token(rule, "user1")
+    token4 = await repo.acquire_token(rule, "user3")
+
+    # 写入失败的令牌被丢弃，不会阻塞其他令牌的写入
+    await repo.flush()
+    assert len(repo.pending_inserts) == 0
+
+    async with get_session() as sess:
+        stmt = select(RateLimitTokenOrm.id).where(RateLimitTokenOrm.user == "user1")
+        assert set(await sess.scalars(stmt)) == {token1.id, token3.id}
+        stmt = select(RateLimitTokenOrm.id).where(RateLimitTokenOrm.user == "user3")
+        assert set(await sess.scalars(stmt)) == {token4.id}
+
+    # 归还被丢弃的令牌时，不删除其他途径写入的ID相同的记录
+    await repo.retire_token(token2)
+    await repo.flush()
+    assert len(repo.pending_deletes) == 0
+
+    async with get_session() as sess:
+        stmt = select(RateLimitTokenOrm.id).where(RateLimitTokenOrm.user == "user2")
+        assert set(await sess.scalars(stmt)) == {token2.id}